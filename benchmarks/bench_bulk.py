@@ -0,0 +1,178 @@
+"""benchmark the bulk load path against the batched row path
+
+Run from the repo root, with the MariaDB settings from .env:
+    python -m benchmarks.bench_bulk --tickets 20000 --lines 50000
+    python -m benchmarks.bench_bulk --database rs_bench --rounds 3
+
+Loads synthetic tickets, their comments and invoice_items (the stand-in's
+fixtures) into a scratch database, once page by page through insert_*
+and once through bulk_library's staging table and merge, each into empty
+tables and again over the loaded rows with a tenth of them touched, and
+prints rows/s. The scratch database is created if it doesn't exist, the
+live tables are never touched. The server needs local_infile=ON.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from benchmarks.stand_in_server import PER_PAGE, make_fixtures, rs_time
+from library import bulk_library, env_library
+from library.db_create import (
+    create_comments_table_if_not_exists,
+    create_invoice_items_table_if_not_exists,
+    create_tickets_table_if_not_exists,
+)
+from library.db_insert import (
+    COMMENT_COLUMNS,
+    INVOICE_LINE_COLUMNS,
+    TICKET_COLUMNS,
+    comment_rows,
+    insert_comments,
+    insert_invoice_lines,
+    insert_tickets,
+    invoice_line_rows,
+    ticket_rows,
+)
+from library.volume_library import create_volume_table_if_not_exists
+
+# (table, records key, insert, row builder, columns, version, volume name)
+ENTITIES = [
+    (
+        "tickets",
+        "tickets",
+        insert_tickets,
+        ticket_rows,
+        TICKET_COLUMNS,
+        "updated_at_u",
+        "tickets",
+    ),
+    (
+        "comments",
+        "comments",
+        lambda logger, cursor, comments: insert_comments(
+            logger, cursor, [{"comments": comments}]
+        ),
+        comment_rows,
+        COMMENT_COLUMNS,
+        "updated_at",
+        "comments",
+    ),
+    (
+        "invoice_items",
+        "line_items",
+        insert_invoice_lines,
+        invoice_line_rows,
+        INVOICE_LINE_COLUMNS,
+        "updated_at",
+        "line_items",
+    ),
+]
+
+
+def connect(database):
+    """connection to the scratch database, created if needed"""
+    config = dict(env_library.config, allow_local_infile=True)
+    config.pop("database", None)
+    connection = mysql.connector.connect(**config)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    cursor.execute(f"USE `{database}`")
+    create_volume_table_if_not_exists(cursor)
+    create_tickets_table_if_not_exists(cursor)
+    create_comments_table_if_not_exists(cursor)
+    create_invoice_items_table_if_not_exists(cursor)
+    return cursor, connection
+
+
+def touch(records, share=10):
+    """copy of records with every share-th one moved a day forward"""
+    touched = []
+    for index, record in enumerate(records):
+        if index % share == 0:
+            record = dict(record)
+            moved = datetime.fromisoformat(record["updated_at"]) + timedelta(days=1)
+            record["updated_at"] = rs_time(moved)
+        touched.append(record)
+    return touched
+
+
+def row_path(logger, cursor, connection, insert, records):
+    """insert_* a page at a time with a commit per page, return seconds"""
+    start = time.perf_counter()
+    for offset in range(0, len(records), PER_PAGE):
+        insert(logger, cursor, records[offset : offset + PER_PAGE])
+        connection.commit()
+    return time.perf_counter() - start
+
+
+def bulk_path(logger, cursor, connection, entity, records):
+    """stage every page, load and merge, return seconds"""
+    table, _key, _insert, rows, columns, version, volume_name = entity
+    start = time.perf_counter()
+    bulk = bulk_library.start_bulk(cursor, table, columns, True)
+    for offset in range(0, len(records), PER_PAGE):
+        bulk_library.add_rows(bulk, rows(records[offset : offset + PER_PAGE]))
+        if bulk_library.flush_due(bulk):
+            bulk_library.load_rows(cursor, bulk)
+            connection.commit()
+    bulk_library.load_rows(cursor, bulk)
+    connection.commit()
+    bulk_library.merge_staged(logger, cursor, bulk, version, volume_name)
+    connection.commit()
+    bulk_library.finish_bulk(cursor, bulk, True)
+    return time.perf_counter() - start
+
+
+def main():
+    """time both paths per entity and print one line each"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="rs_bench")
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("bench_bulk")
+    fixtures = make_fixtures({"tickets": args.tickets, "line_items": args.lines})
+    fixtures["comments"] = [
+        comment for ticket in fixtures["tickets"] for comment in ticket["comments"]
+    ]
+    cursor, connection = connect(args.database)
+
+    for entity in ENTITIES:
+        table, key, insert = entity[0], entity[1], entity[2]
+        records = fixtures[key]
+        for _ in range(args.rounds):
+            timings = {}
+            for name in ("row", "bulk"):
+                # comments reference tickets, empty them child first
+                if table == "tickets":
+                    cursor.execute("DELETE FROM comments")
+                cursor.execute(f"DELETE FROM `{table}`")
+                connection.commit()
+                if table == "comments":
+                    insert_tickets(logger, cursor, fixtures["tickets"])
+                    connection.commit()
+                for phase, batch in (("empty", records), ("touched", touch(records))):
+                    if name == "row":
+                        seconds = row_path(logger, cursor, connection, insert, batch)
+                    else:
+                        seconds = bulk_path(logger, cursor, connection, entity, batch)
+                    timings[(name, phase)] = seconds
+            print(
+                f"{table:<14} {len(records):7} rows  "
+                + "  ".join(
+                    f"{name} {phase} {len(records) / seconds:9.0f} rows/s"
+                    for (name, phase), seconds in timings.items()
+                )
+            )
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""benchmark every insert_* path under each connection profile
+
+Run from the repo root, with the MariaDB settings from .env:
+    python -m benchmarks.bench_driver
+    python -m benchmarks.bench_driver --profiles pure fast --scale 5
+
+Upserts the stand-in's fixtures through each insert_* function into a
+scratch database, a page at a time with a commit per page, once into empty
+tables (every row new) and once more with the same records (every row
+looked up and left alone). That runs per profile from
+db_general.DB_PROFILES and prints rows/s. Profiles that need the C
+extension are skipped when it isn't installed. The scratch database is
+created if it doesn't exist, the live tables are never touched.
+"""
+import argparse
+import logging
+import time
+
+import mysql.connector
+
+from benchmarks.stand_in_server import DEFAULT_COUNTS, PER_PAGE, make_fixtures
+from library import env_library
+from library.db_create import (
+    create_comments_table_if_not_exists,
+    create_contact_table_if_not_exists,
+    create_customer_table_if_not_exists,
+    create_estimates_table_if_not_exists,
+    create_invoice_items_table_if_not_exists,
+    create_invoices_table_if_not_exists,
+    create_payments_table_if_not_exists,
+    create_products_table_if_not_exists,
+    create_tickets_table_if_not_exists,
+)
+from library.db_general import DB_PROFILES, connect_to_db, connection_profile
+from library.db_insert import (
+    insert_comments,
+    insert_contacts,
+    insert_customers,
+    insert_estimates,
+    insert_invoice_lines,
+    insert_invoices,
+    insert_payments,
+    insert_products,
+    insert_tickets,
+)
+from library.volume_library import create_volume_table_if_not_exists
+
+# (path, table, fixtures key, insert), comments are upserted from the
+# tickets so they come after them and are emptied before them
+PATHS = [
+    ("contacts", "contacts", "contacts", insert_contacts),
+    ("customers", "customers", "customers", insert_customers),
+    ("estimates", "estimates", "estimates", insert_estimates),
+    ("invoices", "invoices", "invoices", insert_invoices),
+    ("invoice_lines", "invoice_items", "line_items", insert_invoice_lines),
+    ("payments", "payments", "payments", insert_payments),
+    ("products", "products", "products", insert_products),
+    ("tickets", "tickets", "tickets", insert_tickets),
+    ("comments", "comments", "tickets", insert_comments),
+]
+
+
+def prepare_database(database):
+    """create the scratch database and its tables, return its config"""
+    config = dict(env_library.config, database=database)
+    bootstrap = dict(config)
+    bootstrap.pop("database")
+    connection = mysql.connector.connect(**bootstrap)
+    connection.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    connection.close()
+
+    cursor, connection = connect_to_db(config, "default")
+    create_volume_table_if_not_exists(cursor)
+    create_contact_table_if_not_exists(cursor)
+    create_customer_table_if_not_exists(cursor)
+    create_estimates_table_if_not_exists(cursor)
+    create_invoices_table_if_not_exists(cursor)
+    create_invoice_items_table_if_not_exists(cursor)
+    create_payments_table_if_not_exists(cursor)
+    create_products_table_if_not_exists(cursor)
+    create_tickets_table_if_not_exists(cursor)
+    create_comments_table_if_not_exists(cursor)
+    connection.commit()
+    connection.close()
+    return config
+
+
+def run_path(logger, cursor, connection, insert, records):
+    """insert records a page at a time with a commit per page, return seconds"""
+    start = time.perf_counter()
+    for offset in range(0, len(records), PER_PAGE):
+        insert(logger, cursor, records[offset : offset + PER_PAGE])
+        connection.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    """time each insert_* path per profile and print one line each"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="rs_bench")
+    parser.add_argument(
+        "--profiles", nargs="*", default=list(DB_PROFILES), choices=list(DB_PROFILES)
+    )
+    parser.add_argument("--scale", type=int, default=1, help="fixture multiplier")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("bench_driver")
+    fixtures = make_fixtures(
+        {name: count * args.scale for name, count in DEFAULT_COUNTS.items()}
+    )
+    config = prepare_database(args.database)
+
+    for profile in args.profiles:
+        if DB_PROFILES[profile]["use_pure"] is False and not mysql.connector.HAVE_CEXT:
+            print(f"{profile:<14} skipped, the C extension isn't installed")
+            continue
+        cursor, connection = connect_to_db(config, profile)
+        protocol, prepared = connection_profile(cursor)
+        for _path, table, _key, _insert in reversed(PATHS):
+            cursor.execute(f"DELETE FROM `{table}`")
+        connection.commit()
+
+        for path, _table, key, insert in PATHS:
+            records = fixtures[key]
+            if path == "comments":
+                rows = sum(len(ticket["comments"]) for ticket in records)
+            else:
+                rows = len(records)
+            new = run_path(logger, cursor, connection, insert, records)
+            same = run_path(logger, cursor, connection, insert, records)
+            print(
+                f"{profile:<14} {protocol:<4} "
+                f"{'prepared' if prepared else 'text':<8} {path:<14} {rows:7} rows"
+                f"  new {rows / new:9.0f} rows/s  unchanged {rows / same:9.0f} rows/s"
+            )
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
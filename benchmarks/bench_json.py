@@ -0,0 +1,202 @@
+"""benchmark page decoding, stdlib json vs orjson, per entity type
+
+Run from the repo root:
+    python -m benchmarks.bench_json --rounds 200
+    python -m benchmarks.bench_json --recorded pages/
+
+--recorded reads saved RS responses, one page per file, named after the
+entity (tickets_12.json, customers_3.json, ...). Without it synthetic pages
+shaped like the RS responses are used.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def make_tickets(per_page=25):
+    """tickets page with embedded comments, the heaviest full run page"""
+    return {
+        "tickets": [
+            {
+                "id": ticket_id,
+                "number": 10000 + ticket_id,
+                "subject": f"iPhone 12 screen repair {ticket_id}",
+                "created_at": "2023-08-01T10:15:00.000-04:00",
+                "updated_at": "2023-08-02T16:45:12.123-04:00",
+                "customer_id": ticket_id * 7,
+                "customer_business_then_name": f"Customer {ticket_id}",
+                "status": "Resolved",
+                "properties": {"Passcode": "1234", "IMEI": "35" + "0" * 13},
+                "comments": [
+                    {
+                        "id": ticket_id * 100 + comment,
+                        "created_at": "2023-08-01T11:00:00.000-04:00",
+                        "updated_at": "2023-08-01T11:00:00.000-04:00",
+                        "ticket_id": ticket_id,
+                        "subject": "Update",
+                        "body": "Replaced the screen and tested touch. " * 5,
+                        "tech": "Tech Name",
+                        "hidden": False,
+                        "user_id": 42,
+                    }
+                    for comment in range(8)
+                ],
+            }
+            for ticket_id in range(1, per_page + 1)
+        ],
+        "meta": {"total_pages": 400, "total_entries": 10000, "page": 1},
+    }
+
+
+def make_customers(per_page=25):
+    """customers page with nested contacts and properties"""
+    return {
+        "customers": [
+            {
+                "id": customer_id,
+                "firstname": "First",
+                "lastname": f"Last{customer_id}",
+                "fullname": f"First Last{customer_id}",
+                "business_name": "",
+                "email": f"customer{customer_id}@example.com",
+                "phone": "5555550100",
+                "mobile": "5555550101",
+                "created_at": "2021-02-03T09:00:00.000-05:00",
+                "updated_at": "2023-07-30T12:00:00.000-04:00",
+                "address": "1 Main St",
+                "city": "Town",
+                "state": "NY",
+                "zip": "10001",
+                "notes": "Prefers text messages. " * 4,
+                "properties": {"Referral": "Google", "Notification": "SMS"},
+                "contacts": [
+                    {
+                        "id": customer_id * 10 + contact,
+                        "name": f"Contact {contact}",
+                        "email": f"contact{contact}@example.com",
+                        "phone": "5555550102",
+                    }
+                    for contact in range(3)
+                ],
+            }
+            for customer_id in range(1, per_page + 1)
+        ],
+        "meta": {"total_pages": 200, "total_entries": 5000, "page": 1},
+    }
+
+
+def make_invoices(per_page=25):
+    """invoices page"""
+    return {
+        "invoices": [
+            {
+                "id": invoice_id,
+                "number": str(20000 + invoice_id),
+                "customer_id": invoice_id * 3,
+                "created_at": "2023-07-01T10:00:00.000-04:00",
+                "updated_at": "2023-07-01T10:05:00.000-04:00",
+                "date": "2023-07-01",
+                "subtotal": "149.99",
+                "total": "162.37",
+                "tax": "12.38",
+                "is_paid": True,
+                "ticket_id": invoice_id * 5,
+                "note": "Thank you for your business",
+            }
+            for invoice_id in range(1, per_page + 1)
+        ],
+        "meta": {"total_pages": 300, "total_entries": 7500, "page": 1},
+    }
+
+
+def make_contacts(per_page=25):
+    """contacts page"""
+    return {
+        "contacts": [
+            {
+                "id": contact_id,
+                "name": f"Contact {contact_id}",
+                "email": f"contact{contact_id}@example.com",
+                "phone": "5555550100",
+                "customer_id": contact_id * 2,
+                "notes": "x" * 200,
+                "created_at": "2022-01-01T10:00:00.000-05:00",
+                "updated_at": "2023-01-01T10:00:00.000-05:00",
+            }
+            for contact_id in range(1, per_page + 1)
+        ],
+        "meta": {"total_pages": 40, "total_entries": 1000, "page": 1},
+    }
+
+
+SYNTHETIC = {
+    "tickets": make_tickets,
+    "customers": make_customers,
+    "invoices": make_invoices,
+    "contacts": make_contacts,
+}
+
+
+def load_pages(recorded):
+    """{entity: [raw page bytes]} from --recorded or the synthetic pages"""
+    if recorded is None:
+        return {
+            entity: [json.dumps(make()).encode()]
+            for entity, make in SYNTHETIC.items()
+        }
+    pages = {}
+    for name in sorted(os.listdir(recorded)):
+        if not name.endswith(".json"):
+            continue
+        entity = name[:-5].rstrip("0123456789").rstrip("_-")
+        with open(os.path.join(recorded, name), "rb") as file:
+            pages.setdefault(entity, []).append(file.read())
+    return pages
+
+
+def time_decode(loads, bodies, rounds):
+    """decode every body rounds times, return per page latencies in ms"""
+    latencies = []
+    for _ in range(rounds):
+        for body in bodies:
+            start = time.perf_counter()
+            loads(body)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    """decode each entity's pages with both backends and compare"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--recorded", help="directory of saved RS pages")
+    args = parser.parse_args()
+
+    backends = [("json", json.loads)]
+    if orjson is not None:
+        backends.append(("orjson", orjson.loads))
+    else:
+        print("orjson isn't installed, only timing the stdlib decoder")
+
+    for entity, bodies in load_pages(args.recorded).items():
+        size = statistics.mean(len(body) for body in bodies) / 1024
+        means = {}
+        for name, loads in backends:
+            means[name] = statistics.mean(time_decode(loads, bodies, args.rounds))
+        line = f"{entity:<10} {size:7.1f} KB/page"
+        for name, mean in means.items():
+            line += f"  {name} {mean:6.3f} ms"
+        if "orjson" in means:
+            line += f"  x{means['json'] / means['orjson']:.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
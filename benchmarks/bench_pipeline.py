@@ -0,0 +1,86 @@
+"""benchmark overlapping page downloads with the DB writes, per endpoint
+
+Run from the repo root:
+    python -m benchmarks.bench_pipeline --latency 80 --write-ms 60
+    python -m benchmarks.bench_pipeline --depth 1 2 4 --modules
+
+Pages every endpoint through paginate() with one worker, once fetching one
+page at a time (PIPELINE_DEPTH 0) and once per --depth, and prints the wall
+clock of each. Without --modules the upsert is simulated by sleeping
+--write-ms per page, --modules runs the real module functions instead, that
+needs the MariaDB settings from .env.
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.bench_sync import MODULE_ENDPOINTS, run_module
+from benchmarks.stand_in_server import (
+    ENDPOINT_PATHS,
+    add_arguments,
+    configure_endpoints,
+    stand_in_from_args,
+    start_server,
+)
+from library import env_library, rate_limit_library
+from library.api_requests import close_session, paginate
+
+
+def run_endpoint(logger, endpoint, write_ms):
+    """page through endpoint sleeping write_ms per page, return (pages, seconds)"""
+    pages = 0
+    start = time.perf_counter()
+    for _page, _data in paginate(logger, endpoint):
+        time.sleep(write_ms / 1000)
+        pages += 1
+    return pages, time.perf_counter() - start
+
+
+def main():
+    """time every endpoint sequentially and pipelined, print one line each"""
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--depth", type=int, nargs="*", default=[1, 2])
+    parser.add_argument(
+        "--write-ms", type=float, default=50, help="simulated upsert per page"
+    )
+    parser.add_argument(
+        "--rate", type=float, help="requests/s for the limiter, default RS budget"
+    )
+    parser.add_argument(
+        "--endpoints", nargs="*", default=MODULE_ENDPOINTS, choices=MODULE_ENDPOINTS
+    )
+    parser.add_argument("--modules", action="store_true", help="run the modules")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("bench_pipeline")
+    if args.rate:
+        rate_limit_library.rate_limit = lambda: 1 / args.rate
+
+    stand_in = stand_in_from_args(args)
+    server, base_url = start_server(stand_in)
+    configure_endpoints(base_url)
+
+    for endpoint in args.endpoints:
+        line = f"{ENDPOINT_PATHS[endpoint]:<11}"
+        sequential = None
+        for depth in [0] + args.depth:
+            env_library.pipeline_depth = depth
+            if args.modules:
+                pages, seconds = run_module(logger, endpoint, 1, True)
+            else:
+                pages, seconds = run_endpoint(logger, endpoint, args.write_ms)
+            if sequential is None:
+                sequential = seconds
+                line += f" {pages:5} pages  sequential {seconds:7.2f} s"
+            else:
+                line += f"  depth {depth} {seconds:7.2f} s x{sequential / seconds:.2f}"
+        print(line)
+
+    close_session()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""benchmark the generated row converters against per-row code
+
+Run from the repo root, no database needed:
+    python -m benchmarks.bench_schema
+    python -m benchmarks.bench_schema --scale 10 --rounds 5
+
+Converts the stand-in's fixtures to row tuples three ways per entity and
+prints rows/s for each: the hand-written item[...] lists db_insert used
+before the registry (the baseline, loaded from git, see load_baseline),
+interpreting the schema column by column for every record, and the
+generated converter as the sync uses it. The outputs are compared column
+by column first, so a converter that drifts fails loudly instead of
+looking fast.
+"""
+import argparse
+import json
+import logging
+import subprocess
+import time
+import types
+from pathlib import Path
+
+from benchmarks.stand_in_server import DEFAULT_COUNTS, make_fixtures
+from library.db_general import extract_devices
+from library.db_hash import compute_hash
+from library.fix_date_time import format_date_fordb, rs_to_unix_timestamp
+from library.schema_library import SCHEMAS
+
+# schema -> fixtures key, comments come out of the tickets
+FIXTURES = {
+    "contacts": "contacts",
+    "customers": "customers",
+    "invoices": "invoices",
+    "invoice_items": "line_items",
+    "estimates": "estimates",
+    "tickets": "tickets",
+    "comments": "comments",
+    "payments": "payments",
+    "products": "products",
+}
+
+# schema -> the pre-registry insert function that built its rows
+INSERTS = {
+    "contacts": "insert_contacts",
+    "customers": "insert_customers",
+    "invoices": "insert_invoices",
+    "invoice_items": "insert_invoice_lines",
+    "estimates": "insert_estimates",
+    "tickets": "insert_tickets",
+    "comments": "insert_comments",
+    "payments": "insert_payments",
+    "products": "insert_products",
+}
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_GETTERS = {
+    "date": lambda record, field: format_date_fordb(record[field]),
+    "unix": lambda record, field: rs_to_unix_timestamp(record[field]),
+    "json": lambda record, field: json.dumps(record[field]),
+    "get": lambda record, field, default: record.get(field, default),
+    "json_get": lambda record, field, default: json.dumps(
+        record.get(field, default)
+    ),
+    "nested": lambda record, field, key: record[field].get(key),
+    "property": lambda record, key: record["properties"].get(key),
+    "devices": lambda record, field: extract_devices(record[field]),
+    "hash": compute_hash,
+}
+
+
+def git(*args):
+    """stdout of a git command run in the repo"""
+    return subprocess.run(
+        ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+
+
+def load_baseline(revision=None):
+    """{table: (columns, convert)} built from db_insert.py as it was before
+    the registry, the parent of the commit that added schema_library unless
+    revision says otherwise
+
+    The old insert functions are run with upsert_rows swapped for a stub
+    that keeps the columns and rows they built, so the baseline is the
+    hand-written code itself rather than a copy of it.
+    """
+    if revision is None:
+        added = git(
+            "log", "--diff-filter=A", "--format=%H", "--", "library/schema_library.py"
+        ).split()
+        revision = f"{added[-1]}^"
+    module = types.ModuleType("baseline_db_insert")
+    exec(  # pylint: disable=exec-used
+        compile(git("show", f"{revision}:library/db_insert.py"), "db_insert", "exec"),
+        module.__dict__,
+    )
+    columns = {}
+    built = {}
+
+    def upsert_rows(_cursor, table, table_columns, rows, *_args, **_kwargs):
+        columns[table] = table_columns
+        built[table] = rows
+        return 0, 0
+
+    module.upsert_rows = upsert_rows
+    logger = logging.getLogger("bench_schema.baseline")
+    logger.disabled = True
+
+    def converter(table, insert):
+        def convert(records):
+            # insert_comments takes tickets and pulls their comments out
+            if table == "comments":
+                records = [{"comments": records}]
+            insert(logger, None, records)
+            return built.pop(table)
+
+        return convert
+
+    baseline = {}
+    for table, name in INSERTS.items():
+        convert = converter(table, getattr(module, name))
+        convert([])
+        baseline[table] = (columns[table], convert)
+    return baseline
+
+
+def interpreted(schema):
+    """converter walking the schema's columns for every record"""
+    getters = []
+    for _column, _sql_type, source in schema["columns"]:
+        if source is None:
+            continue
+        if isinstance(source, str):
+            getters.append((_GETTERS["get"], (source, None)))
+        else:
+            getters.append((_GETTERS[source[0]], tuple(source[1:])))
+
+    def convert(records):
+        return [
+            tuple(getter(record, *args) for getter, args in getters)
+            for record in records
+        ]
+
+    return convert
+
+
+def best_of(convert, records, rounds):
+    """fastest of rounds conversions of records, in seconds"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        convert(records)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    """time the three converters per entity and print one line each"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=5, help="fixture multiplier")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--baseline", help="revision to take the hand-written converters from"
+    )
+    args = parser.parse_args()
+
+    fixtures = make_fixtures(
+        {name: count * args.scale for name, count in DEFAULT_COUNTS.items()}
+    )
+    fixtures["comments"] = [
+        comment for ticket in fixtures["tickets"] for comment in ticket["comments"]
+    ]
+
+    before = load_baseline(args.baseline)
+    for table, schema in SCHEMAS.items():
+        records = fixtures[FIXTURES[table]]
+        columns, handwritten = before[table]
+        converters = {
+            "hand-written": handwritten,
+            "per-row": interpreted(schema),
+            "generated": schema["convert"],
+        }
+        orders = [columns, schema["names"], schema["names"]]
+        # the hand-written rows don't always share the registry's order
+        outputs = [
+            [dict(zip(order, row)) for row in convert(records)]
+            for order, convert in zip(orders, converters.values())
+        ]
+        if any(output != outputs[0] for output in outputs[1:]):
+            raise SystemExit(f"{table}: converters disagree")
+
+        line = f"{table:<14} {len(records):7} rows"
+        baseline = None
+        for name, convert in converters.items():
+            rate = len(records) / best_of(convert, records, args.rounds)
+            baseline = baseline or rate
+            line += f"  {name} {rate:9.0f} rows/s x{rate / baseline:.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
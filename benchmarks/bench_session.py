@@ -0,0 +1,72 @@
+"""benchmark per-page latency, bare requests.get vs the shared api session
+
+Run from the repo root:
+    python -m benchmarks.bench_session --pages 200
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from benchmarks.stand_in_server import StandIn, make_fixtures, start_server
+from library.api_requests import close_session, get_session
+
+
+def time_pages(fetch, url, pages):
+    """fetch every page once, return per page latencies in ms"""
+    latencies = []
+    for page in range(1, pages + 1):
+        start = time.perf_counter()
+        response = fetch(f"{url}?page={page}")
+        response.json()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    """print mean / p50 / p95 for one run"""
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(
+        f"{label:<14} mean {statistics.mean(ordered):7.2f} ms  "
+        f"p50 {statistics.median(ordered):7.2f} ms  p95 {p95:7.2f} ms"
+    )
+
+
+def main():
+    """run both fetch styles against the stand-in (or --url) and compare"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--url", help="benchmark a different server instead")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        stand_in = StandIn(make_fixtures({"contacts": args.pages * 25}))
+        server, base_url = start_server(stand_in)
+        url = f"{base_url}/contacts"
+
+    headers = {"Authorization": "Bearer benchmark"}
+    before = time_pages(
+        lambda page_url: requests.get(page_url, headers=headers, timeout=10),
+        url,
+        args.pages,
+    )
+    session = get_session()
+    after = time_pages(
+        lambda page_url: session.get(page_url, headers=headers, timeout=10),
+        url,
+        args.pages,
+    )
+    close_session()
+
+    report("requests.get", before)
+    report("shared session", after)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""benchmark sync throughput per endpoint against the local stand-in
+
+Run from the repo root:
+    python -m benchmarks.bench_sync --workers 4 --rate 50
+    python -m benchmarks.bench_sync --latency 80 --throttle-every 40 --fail-pages 7
+
+Pages every endpoint through paginate() and reports pages/s with the
+request telemetry. --modules runs the real module functions instead, that
+needs the MariaDB settings from .env.
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.stand_in_server import (
+    ENDPOINT_PATHS,
+    add_arguments,
+    configure_endpoints,
+    stand_in_from_args,
+    start_server,
+)
+from library import rate_limit_library
+from library.api_requests import close_session, paginate
+from library.metrics_library import api_metrics
+
+MODULE_ENDPOINTS = [
+    "contacts",
+    "customers",
+    "estimates",
+    "invoice_lines",
+    "invoices",
+    "payments",
+    "products",
+    "tickets",
+]
+
+
+def run_endpoint(logger, endpoint, workers):
+    """page through endpoint, return (pages, seconds)"""
+    pages = 0
+    start = time.perf_counter()
+    for _page, _data in paginate(logger, endpoint, workers=workers):
+        pages += 1
+    return pages, time.perf_counter() - start
+
+
+def run_module(logger, endpoint, workers, full_run):
+    """run the sync module for endpoint, return (pages, seconds)"""
+    # pylint: disable=import-outside-toplevel
+    from modules.contacts import contacts
+    from modules.customers import customers
+    from modules.estimates import estimates
+    from modules.invoice_lines import invoice_lines
+    from modules.invoices import invoices
+    from modules.payments import payments
+    from modules.products import products
+    from modules.tickets import tickets
+
+    module = {
+        "contacts": contacts,
+        "customers": customers,
+        "estimates": estimates,
+        "invoice_lines": invoice_lines,
+        "invoices": invoices,
+        "payments": payments,
+        "products": products,
+        "tickets": tickets,
+    }[endpoint]
+    before = api_metrics().get(endpoint, {}).get("requests", 0)
+    start = time.perf_counter()
+    module(logger, full_run, workers=workers)
+    elapsed = time.perf_counter() - start
+    return api_metrics()[endpoint]["requests"] - before, elapsed
+
+
+def main():
+    """benchmark every endpoint and print one line each"""
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--rate", type=float, help="requests/s for the limiter, default RS budget"
+    )
+    parser.add_argument(
+        "--endpoints", nargs="*", default=MODULE_ENDPOINTS, choices=MODULE_ENDPOINTS
+    )
+    parser.add_argument("--modules", action="store_true", help="run the modules")
+    parser.add_argument("--frequent", action="store_true", help="modules' --frequent")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("bench_sync")
+    if args.rate:
+        rate_limit_library.rate_limit = lambda: 1 / args.rate
+
+    stand_in = stand_in_from_args(args)
+    server, base_url = start_server(stand_in)
+    configure_endpoints(base_url)
+
+    for endpoint in args.endpoints:
+        if args.modules:
+            pages, seconds = run_module(
+                logger, endpoint, args.workers, not args.frequent
+            )
+        else:
+            pages, seconds = run_endpoint(logger, endpoint, args.workers)
+        metrics = api_metrics().get(endpoint, {})
+        print(
+            f"{ENDPOINT_PATHS[endpoint]:<11} {pages:5} pages {seconds:7.2f} s "
+            f"{pages / seconds if seconds else 0:7.1f} pages/s  "
+            f"p95 {metrics.get('p95_ms')} ms  429s {metrics.get('throttled', 0)}  "
+            f"errors {metrics.get('errors', 0)}  "
+            f"back-off {metrics.get('backoff', 0)} s"
+        )
+
+    print(
+        f"stand-in: {stand_in.requests} requests, {stand_in.throttled} throttled, "
+        f"{stand_in.failed} failed"
+    )
+    close_session()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
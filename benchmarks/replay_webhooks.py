@@ -0,0 +1,62 @@
+"""post recorded RS webhook payloads to the webhook receiver
+
+Run from the repo root against a receiver started with main.py --webhooks:
+    python -m benchmarks.replay_webhooks payloads/ --url http://127.0.0.1:8085
+
+payloads/ holds one payload per file, named after the kind it's posted as
+(tickets_1.json, comments_7.json, invoices_2.json, payments_3.json), the
+same naming bench_json uses for recorded pages. Prints the status of every
+post and the time each took, the token comes from WEBHOOK_SECRET.
+"""
+import argparse
+import os
+import time
+import requests
+from library import env_library
+
+
+def replay(url, directory, token):
+    """post every payload in directory, return {status: count}"""
+    statuses = {}
+    with requests.Session() as session:
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            kind = name[:-5].rstrip("0123456789").rstrip("_-")
+            with open(os.path.join(directory, name), "rb") as file:
+                body = file.read()
+            start = time.perf_counter()
+            response = session.post(
+                f"{url}/webhooks/{kind}",
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Webhook-Token": token,
+                },
+                timeout=30,
+            )
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{name:<24} {response.status_code} {elapsed:7.1f} ms")
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return statuses
+
+
+def main():
+    """replay the payloads and print a summary"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="directory of recorded payloads")
+    parser.add_argument(
+        "--url", default=f"http://127.0.0.1:{env_library.webhook_port}"
+    )
+    parser.add_argument("--token", default=env_library.webhook_secret)
+    args = parser.parse_args()
+
+    statuses = replay(args.url.rstrip("/"), args.directory, args.token)
+    print(
+        "posted "
+        + ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items()))
+    )
+
+
+if __name__ == "__main__":
+    main()
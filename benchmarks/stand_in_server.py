@@ -0,0 +1,641 @@
+"""local stand-in for the RepairShopr api, for offline benchmarks
+
+Serves every endpoint the sync uses with the RS response shape (records
+plus meta.total_pages / total_entries, 25 per page), honours
+since_updated_at and the invoice_lines invoice_id_not_null filter, and
+answers conditional requests with ETags. Latency, 429 bursts and failing
+pages can be injected.
+
+Records are synthetic unless --fixtures points at a directory of recorded
+records, one <collection>.json list per endpoint (tickets.json,
+line_items.json, users.json, ...).
+
+Run from the repo root to serve on a fixed port:
+    python -m benchmarks.stand_in_server --port 8080 --latency 40
+or start it in process with start_server() and point the sync at it with
+configure_endpoints().
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PER_PAGE = 25
+
+# path -> collection key, the order pages are served in
+COLLECTIONS = {
+    "contacts": ("contacts", "id"),
+    "customers": ("customers", "id"),
+    "estimates": ("estimates", "newest"),
+    "invoices": ("invoices", "id"),
+    "line_items": ("line_items", "updated"),
+    "payments": ("payments", "newest"),
+    "products": ("products", "id"),
+    "tickets": ("tickets", "id"),
+}
+
+# api_requests.ENDPOINTS name -> stand-in path
+ENDPOINT_PATHS = {
+    "contacts": "contacts",
+    "customers": "customers",
+    "estimates": "estimates",
+    "invoices": "invoices",
+    "invoice_lines": "line_items",
+    "payments": "payments",
+    "products": "products",
+    "tickets": "tickets",
+    "users": "users",
+}
+
+# Default record counts for the synthetic fixtures
+DEFAULT_COUNTS = {
+    "contacts": 500,
+    "customers": 1000,
+    "estimates": 500,
+    "invoices": 2000,
+    "line_items": 5000,
+    "payments": 1500,
+    "products": 300,
+    "tickets": 2000,
+    "users": 20,
+}
+
+
+def rs_time(moment):
+    """RS style timestamp, millisecond precision with the utc offset"""
+    return moment.isoformat(timespec="milliseconds")
+
+
+def _parse_time(value):
+    """unix seconds for an RS timestamp or a since_updated_at date"""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _timeline(count, days=365):
+    """count ascending (created_at, updated_at) pairs ending now"""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    step = timedelta(days=days) / max(count, 1)
+    start = now - timedelta(days=days)
+    for index in range(count):
+        created = start + step * index
+        yield rs_time(created), rs_time(created + step / 2)
+
+
+def make_fixtures(counts=None, seed=1):
+    """synthetic records for every collection, shaped for the insert_* code"""
+    counts = dict(DEFAULT_COUNTS, **(counts or {}))
+    rng = random.Random(seed)
+    fixtures = {}
+
+    fixtures["contacts"] = [
+        {
+            "id": index,
+            "name": f"Contact {index}",
+            "address1": f"{index} Main St",
+            "address2": "",
+            "city": "Town",
+            "state": "NY",
+            "zip": "10001",
+            "email": f"contact{index}@example.com",
+            "phone": "5555550100",
+            "mobile": "5555550101",
+            "latitude": 40.7,
+            "longitude": -74.0,
+            "customer_id": rng.randint(1, counts["customers"]),
+            "account_id": 1,
+            "notes": "Prefers email",
+            "created_at": created,
+            "updated_at": updated,
+            "vendor_id": None,
+            "properties": {"title": "Manager"} if index % 5 == 0 else {},
+            "opt_out": False,
+            "extension": "",
+            "processed_phone": "5555550100",
+            "processed_mobile": "5555550101",
+            "ticket_matching_emails": "",
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["contacts"]), 1
+        )
+    ]
+
+    fixtures["customers"] = [
+        {
+            "id": index,
+            "firstname": "First",
+            "lastname": f"Last{index}",
+            "fullname": f"First Last{index}",
+            "business_name": "" if index % 4 else f"Business {index}",
+            "email": f"customer{index}@example.com",
+            "phone": "5555550100",
+            "mobile": "5555550101",
+            "created_at": created,
+            "updated_at": updated,
+            "address": f"{index} Main St",
+            "address_2": "",
+            "city": "Town",
+            "state": "NY",
+            "zip": "10001",
+            "latitude": 40.7,
+            "longitude": -74.0,
+            "notes": "Prefers text messages",
+            "get_sms": True,
+            "opt_out": False,
+            "disabled": False,
+            "no_email": False,
+            "referred_by": "Google",
+            "properties": {"Notification": "SMS"},
+            "contacts": [
+                {"id": index * 10 + contact, "name": f"Contact {contact}"}
+                for contact in range(rng.randint(0, 3))
+            ],
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["customers"]), 1
+        )
+    ]
+
+    fixtures["estimates"] = [
+        {
+            "id": index,
+            "customer_business_then_name": f"Customer {index}",
+            "number": str(5000 + index),
+            "status": rng.choice(["Fresh", "Approved", "Declined"]),
+            "created_at": created,
+            "updated_at": updated,
+            "date": created[:10],
+            "subtotal": "100.00",
+            "total": "108.25",
+            "tax": "8.25",
+            "ticket_id": rng.randint(1, counts["tickets"]),
+            "pdf_url": None,
+            "location_id": 1,
+            "invoice_id": None,
+            "employee": "tech@example.com",
+            "customer_id": rng.randint(1, counts["customers"]),
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["estimates"]), 1
+        )
+    ]
+
+    fixtures["invoices"] = [
+        {
+            "id": index,
+            "customer_id": rng.randint(1, counts["customers"]),
+            "customer_business_then_name": f"Customer {index}",
+            "number": str(20000 + index),
+            "created_at": created,
+            "updated_at": updated,
+            "date": created[:10],
+            "due_date": created[:10],
+            "subtotal": "149.99",
+            "total": "162.37",
+            "tax": "12.38",
+            "verified_paid": False,
+            "tech_marked_paid": False,
+            "ticket_id": rng.randint(1, counts["tickets"]),
+            "user_id": 1,
+            "pdf_url": None,
+            "is_paid": bool(index % 3),
+            "location_id": 1,
+            "po_number": None,
+            "contact_id": None,
+            "note": "Thank you for your business",
+            "hardwarecost": "40.00",
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["invoices"]), 1
+        )
+    ]
+
+    fixtures["line_items"] = [
+        {
+            "id": index,
+            "created_at": created,
+            "updated_at": updated,
+            # about a third of the lines belong to estimates
+            "invoice_id": (
+                None if index % 3 == 0 else rng.randint(1, counts["invoices"])
+            ),
+            "estimate_id": (
+                rng.randint(1, counts["estimates"]) if index % 3 == 0 else None
+            ),
+            "item": "Labor",
+            "name": "Screen replacement",
+            "cost": "40.0",
+            "price": "149.99",
+            "quantity": "1.0",
+            "product_id": rng.randint(1, counts["products"]),
+            "taxable": True,
+            "discount_percent": None,
+            "position": 1,
+            "invoice_bundle_id": None,
+            "discount_dollars": "0.0",
+            "product_category": "Repairs",
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["line_items"]), 1
+        )
+    ]
+
+    fixtures["payments"] = [
+        {
+            "id": index,
+            "created_at": created,
+            "updated_at": updated,
+            "success": True,
+            "payment_amount": 162.37,
+            "invoice_ids": [rng.randint(1, counts["invoices"])],
+            "ref_num": None,
+            "applied_at": created[:10],
+            "payment_method": rng.choice(["Cash", "Credit Card"]),
+            "transaction_response": None,
+            "signature_date": None,
+            "customer": {
+                "id": rng.randint(1, counts["customers"]),
+                "business_and_full_name": f"Customer {index}",
+            },
+        }
+        for index, (created, updated) in enumerate(
+            _timeline(counts["payments"]), 1
+        )
+    ]
+
+    fixtures["products"] = [
+        {
+            "id": index,
+            "price_cost": 40.0,
+            "price_retail": 149.99,
+            "condition": "",
+            "description": f"Part {index}",
+            "maintain_stock": True,
+            "name": f"Part {index}",
+            "quantity": rng.randint(0, 20),
+            "warranty": None,
+            "sort_order": None,
+            "reorder_at": 2,
+            "disabled": False,
+            "taxable": True,
+            "product_category": "Parts",
+            "category_path": "Parts",
+            "upc_code": None,
+            "discount_percent": None,
+            "warranty_template_id": None,
+            "qb_item_id": None,
+            "desired_stock_level": 5,
+            "price_wholesale": 60.0,
+            "notes": None,
+            "tax_rate_id": None,
+            "physical_location": "Shelf A",
+            "serialized": False,
+            "vendor_ids": [],
+            "long_description": None,
+            "location_quantities": [{"location_id": 1, "quantity": 3}],
+            "photos": [],
+        }
+        for index in range(1, counts["products"] + 1)
+    ]
+
+    fixtures["tickets"] = []
+    comment_id = 0
+    for index, (created, updated) in enumerate(_timeline(counts["tickets"]), 1):
+        comments = []
+        for _ in range(rng.randint(0, 6)):
+            comment_id += 1
+            comments.append(
+                {
+                    "id": comment_id,
+                    "created_at": created,
+                    "updated_at": created,
+                    "ticket_id": index,
+                    "subject": "Update",
+                    "body": "Replaced the screen and tested touch.",
+                    "tech": "Tech Name",
+                    "hidden": False,
+                    "user_id": 1,
+                }
+            )
+        fixtures["tickets"].append(
+            {
+                "id": index,
+                "number": 10000 + index,
+                "subject": f"iPhone 12 screen repair {index}",
+                "created_at": created,
+                "customer_id": rng.randint(1, counts["customers"]),
+                "customer_business_then_name": f"Customer {index}",
+                "due_date": created,
+                "resolved_at": None,
+                "start_at": None,
+                "end_at": None,
+                "location_id": 1,
+                "problem_type": "Screen",
+                "status": rng.choice(["New", "In Progress", "Resolved"]),
+                "ticket_type_id": None,
+                "properties": {"Passcode": "1234"},
+                "user_id": 1,
+                "updated_at": updated,
+                "pdf_url": None,
+                "priority": None,
+                "comments": comments,
+            }
+        )
+
+    fixtures["users"] = [
+        [index, f"Tech {index}"] for index in range(1, counts["users"] + 1)
+    ]
+    return fixtures
+
+
+def load_fixtures(directory):
+    """recorded records from <collection>.json files, synthetic for the rest"""
+    fixtures = make_fixtures()
+    for name in os.listdir(directory):
+        collection = name[:-5]
+        if name.endswith(".json") and collection in fixtures:
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as file:
+                fixtures[collection] = json.load(file)
+    return fixtures
+
+
+class StandIn:
+    """records and failure settings shared by the request handlers"""
+
+    def __init__(
+        self,
+        fixtures=None,
+        latency=0.0,
+        jitter=0.0,
+        throttle_every=0,
+        throttle_burst=1,
+        retry_after=1,
+        fail_pages=(),
+        fail_rate=0.0,
+        slow_rate=0.0,
+        slow_latency=0.0,
+        seed=1,
+    ):
+        self.fixtures = fixtures if fixtures is not None else make_fixtures()
+        # seconds added to every response, plus up to jitter more
+        self.latency = latency
+        self.jitter = jitter
+        # share of responses held back slow_latency seconds more, a long tail
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        # every throttle_every requests the next throttle_burst get a 429
+        self.throttle_every = throttle_every
+        self.throttle_burst = throttle_burst
+        self.retry_after = retry_after
+        # pages that always fail with a 500, and the share of random 500s
+        self.fail_pages = set(fail_pages)
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+        self._ordered = {}
+
+    def touch(self, collection, count):
+        """bump updated_at on count random records, as if they were edited"""
+        now = rs_time(datetime.now(timezone.utc))
+        with self.lock:
+            records = self.fixtures[collection]
+            for record in self.rng.sample(records, min(count, len(records))):
+                record["updated_at"] = now
+            self._ordered.pop(collection, None)
+
+    def ordered(self, collection, order):
+        """records in the order the api pages them"""
+        with self.lock:
+            records = self._ordered.get(collection)
+            if records is None:
+                records = list(self.fixtures[collection])
+                if order == "newest":
+                    records.sort(key=lambda record: record["created_at"], reverse=True)
+                elif order == "updated":
+                    records.sort(key=lambda record: _parse_time(record["updated_at"]))
+                else:
+                    records.sort(key=lambda record: record["id"])
+                self._ordered[collection] = records
+            return records
+
+    def next_outcome(self, page):
+        """429, 500 or None (serve the page) for the next request"""
+        with self.lock:
+            self.requests += 1
+            if self.throttle_every:
+                position = self.requests % (self.throttle_every + self.throttle_burst)
+                if position >= self.throttle_every:
+                    self.throttled += 1
+                    return 429
+            if page in self.fail_pages or self.rng.random() < self.fail_rate:
+                self.failed += 1
+                return 500
+        return None
+
+    def delay(self):
+        """injected latency for one response"""
+        seconds = self.latency + self.rng.random() * self.jitter
+        if self.slow_rate and self.rng.random() < self.slow_rate:
+            seconds += self.slow_latency
+        if seconds:
+            time.sleep(seconds)
+
+    def page(self, path, query):
+        """(status, body) for a request"""
+        if path == "users":
+            return 200, {"users": self.fixtures["users"]}
+        if path not in COLLECTIONS:
+            return 404, {"error": f"unknown endpoint {path}"}
+
+        collection, order = COLLECTIONS[path]
+        records = self.ordered(collection, order)
+        if "since_updated_at" in query:
+            since = _parse_time(query["since_updated_at"])
+            records = [
+                record
+                for record in records
+                if _parse_time(record["updated_at"]) >= since
+            ]
+        if collection == "line_items" and "invoice_id_not_null" in query:
+            records = [record for record in records if record["invoice_id"]]
+
+        page = int(query.get("page", 1))
+        total_pages = (len(records) + PER_PAGE - 1) // PER_PAGE
+        start = (page - 1) * PER_PAGE
+        return 200, {
+            collection: records[start : start + PER_PAGE],
+            "meta": {
+                "total_pages": total_pages,
+                "total_entries": len(records),
+                "per_page": PER_PAGE,
+                "page": page,
+            },
+        }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """serves the stand-in over keep-alive http/1.1"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, avoid the delayed-ack stall
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """return the requested page, or the injected failure"""
+        stand_in = self.server.stand_in
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        stand_in.delay()
+
+        outcome = stand_in.next_outcome(int(query.get("page", 1)))
+        if outcome == 429:
+            self.send_json(
+                429,
+                {"error": "Too many requests"},
+                {"Retry-After": str(stand_in.retry_after)},
+            )
+            return
+        if outcome == 500:
+            self.send_json(500, {"error": "Injected failure"})
+            return
+
+        status, data = stand_in.page(url.path.strip("/").split("/")[-1], query)
+        self.send_json(status, data)
+
+    def send_json(self, status, data, headers=None):
+        """write data as json, with an etag and gzip when the client asks"""
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        encoding = None
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            encoding = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """keep the benchmark output clean"""
+
+
+def start_server(stand_in=None, port=0):
+    """serve stand_in on port (a free one by default), return (server, base url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    server.daemon_threads = True
+    server.stand_in = stand_in if stand_in is not None else StandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def endpoint_urls(base_url):
+    """api_requests endpoint name -> stand-in url"""
+    return {
+        endpoint: f"{base_url}/{path}" for endpoint, path in ENDPOINT_PATHS.items()
+    }
+
+
+def configure_endpoints(base_url):
+    """point every api_requests endpoint at the stand-in"""
+    # pylint: disable=import-outside-toplevel
+    from library.api_requests import ENDPOINTS
+
+    for endpoint, url in endpoint_urls(base_url).items():
+        ENDPOINTS[endpoint]["url"] = url
+
+
+ENV_NAMES = {
+    "contacts": "API_CONTACT",
+    "customers": "API_CUSTOMERS",
+    "estimates": "API_ESTIMATES",
+    "invoices": "API_INVOICE",
+    "invoice_lines": "API_INVOICE_LINES",
+    "payments": "API_PAYMENTS",
+    "products": "API_PRODUCTS",
+    "tickets": "API_TICKETS",
+}
+
+
+def add_arguments(parser):
+    """stand-in settings shared by the benchmark scripts"""
+    parser.add_argument("--fixtures", help="directory of recorded records")
+    parser.add_argument("--latency", type=float, default=0, help="ms per response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to ms more")
+    parser.add_argument(
+        "--throttle-every", type=int, default=0, help="429 after this many requests"
+    )
+    parser.add_argument("--throttle-burst", type=int, default=1)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--fail-pages", type=int, nargs="*", default=[], help="pages that 500"
+    )
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--slow-rate", type=float, default=0.0, help="share of slow responses"
+    )
+    parser.add_argument("--slow-latency", type=float, default=0, help="ms extra")
+
+
+def stand_in_from_args(args):
+    """StandIn for the parsed add_arguments() settings"""
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else None
+    return StandIn(
+        fixtures=fixtures,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        throttle_every=args.throttle_every,
+        throttle_burst=args.throttle_burst,
+        retry_after=args.retry_after,
+        fail_pages=args.fail_pages,
+        fail_rate=args.fail_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency / 1000,
+    )
+
+
+def main():
+    """serve the stand-in until interrupted"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(stand_in_from_args(args), args.port)
+    print("Point the sync at the stand-in with:")
+    urls = endpoint_urls(base_url)
+    for endpoint, name in ENV_NAMES.items():
+        print(f"    export {name}={urls[endpoint]}")
+    print("users is hardcoded in api_requests, use configure_endpoints() for it")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,402 +1,562 @@
 """api requests"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+import threading
 import time
 import requests
-from library import env_library
-
-
-def get_contacts(logger, page, max_retries=3, retry_delay=30):
-    """api request for contacts"""
-    url = f"{env_library.api_url_contact}?page={page}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_contact}"}
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching contacts on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "contacts", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
-
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching contacts on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "contacts", "error": "non 200"}},
-                )
-                return None
-
-            return response.json()
-
-        except requests.RequestException as error:
-            logger.error(
-                "Error fetching contacts on page %s (Retry %s/%s): %s",
-                page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "contacts", "error": "retry"}},
+from requests.adapters import HTTPAdapter
+from library import cache_library, env_library, json_library
+from library.breaker_library import allow_request, record_result
+from library.concurrency_library import enter, leave
+from library.metrics_library import (
+    latency_percentile,
+    record_backoff,
+    record_hedge,
+    record_processing,
+    record_request,
+    record_wait,
+)
+from library.pipeline_library import next_page, start_prefetch, stop_prefetch
+from library.rate_limit_library import acquire, penalize, retry_after
+
+# One pooled keep-alive session for the whole process, see get_session()
+_session = None
+_session_lock = threading.Lock()
+# Threads that carry hedged requests, see _send()
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=env_library.api_pool_size * 2, thread_name_prefix="hedge"
+)
+
+
+def get_session():
+    """shared session, keeps connections to RS open between pages and modules"""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=env_library.api_pool_size,
+                pool_maxsize=env_library.api_pool_size,
             )
-
-    return None
-
-
-def get_estimates(logger, page, max_retries=3, retry_delay=30):
-    """api request for estimates"""
-    url = f"{env_library.api_url_estimates}?page={page}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_estimates}"}
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching estimates on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "estimates", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
-
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching estimates on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "estimates", "error": "non 200"}},
-                )
-                return None
-
-            return response.json()
-        except requests.RequestException as error:
-            logger.error(
-                "Error fetching estimates on page %s (Retry %s/%s): %s",
-                page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "estimates"}},
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {
+                    "Accept": "application/json",
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive",
+                }
             )
+            _session = session
+        return _session
+
+
+def close_session():
+    """close the shared session and its pooled connections"""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# Every paginated RS endpoint: url, api key and the key holding its records
+ENDPOINTS = {
+    "contacts": {
+        "url": env_library.api_url_contact,
+        "key": env_library.api_key_contact,
+        "collection": "contacts",
+    },
+    "customers": {
+        "url": env_library.api_url_customers,
+        "key": env_library.api_key_customers,
+        "collection": "customers",
+    },
+    "estimates": {
+        "url": env_library.api_url_estimates,
+        "key": env_library.api_key_estimates,
+        "collection": "estimates",
+    },
+    "invoices": {
+        "url": env_library.api_url_invoice,
+        "key": env_library.api_key_invoice,
+        "collection": "invoices",
+    },
+    "invoice_lines": {
+        "url": env_library.api_url_invoice_lines,
+        "key": env_library.api_key_invoice,
+        "collection": "line_items",
+    },
+    "payments": {
+        "url": env_library.api_url_payments,
+        "key": env_library.api_key_payments,
+        "collection": "payments",
+    },
+    "products": {
+        "url": env_library.api_url_products,
+        "key": env_library.api_key_products,
+        "collection": "products",
+    },
+    "tickets": {
+        "url": env_library.api_url_tickets,
+        "key": env_library.api_key_tickets,
+        "collection": "tickets",
+    },
+    "users": {
+        "url": "https://cellmechanic.repairshopr.com/api/v1/users",
+        # doesn't have perms using random key
+        "key": env_library.api_key_tickets,
+        "collection": "users",
+    },
+}
+
+
+def key_bucket(endpoint):
+    """rate limit bucket of endpoint's api key, named after its first endpoint
+
+    Each key has its own budget, endpoints sharing a key share a bucket.
+    """
+    key = ENDPOINTS[endpoint]["key"]
+    for name, settings in ENDPOINTS.items():
+        if settings["key"] == key:
+            return name
+    return endpoint
+
+
+# invoice_lines filters, invoice lines vs estimate lines
+INVOICE_LINE_PARAMS = {
+    "invoice": {"invoice_id_not_null": "false", "estimate_id_not_null": "false"},
+    "estimate": {},
+}
+
+
+def _send_once(endpoint, settings, headers, params, timing):
+    """one GET inside a slot of its key's concurrency limit, a 429 or timeout
+    lowers the limit, other errors leave it alone
+
+    timing["seconds"] gets how long the GET took once it had its slot, and
+    timing["sent"], if there is one, is set as it goes out.
+    """
+    ticket = enter(key_bucket(endpoint))
+    overloaded = False
+    failed = True
+    start = time.perf_counter()
+    if "sent" in timing:
+        timing["sent"].set()
+    try:
+        response = get_session().get(
+            settings["url"], headers=headers, params=params, timeout=10
+        )
+        overloaded = response.status_code == 429
+        failed = response.status_code not in (200, 304, 429)
+        return response
+    except requests.Timeout:
+        overloaded = True
+        raise
+    finally:
+        timing["seconds"] = time.perf_counter() - start
+        leave(ticket, overloaded, failed)
+
+
+def _send_hedge(endpoint, settings, headers, params, timing):
+    """the second copy of a slow request, paid for from the same budget"""
+    record_wait(endpoint, acquire(key_bucket(endpoint)))
+    return _send_once(endpoint, settings, headers, params, timing)
+
+
+def _send(endpoint, settings, headers, params, timing):
+    """one GET, hedged with a second copy if it's slower than usual
+
+    With API_HEDGE on, a request still running after the endpoint's recent
+    API_HEDGE_PERCENTILE latency gets a copy sent alongside it and the
+    first good answer wins, the other is left to finish in the background.
+    The hedge delay counts from when the request left, not while it queued
+    for a thread or a concurrency slot, and timing["seconds"] is the
+    winner's time on the wire, the latency the metrics record.
+    """
+    delay = None
+    if env_library.api_hedge:
+        delay = latency_percentile(
+            endpoint,
+            env_library.api_hedge_percentile,
+            env_library.api_hedge_min_samples,
+        )
+    if delay is None:
+        return _send_once(endpoint, settings, headers, params, timing)
+
+    original_timing = {"sent": threading.Event()}
+    original = _hedge_pool.submit(
+        _send_once, endpoint, settings, headers, params, original_timing
+    )
+    original_timing["sent"].wait()
+    if wait((original,), timeout=delay / 1000).done:
+        timing["seconds"] = original_timing["seconds"]
+        return original.result()
+
+    record_hedge(endpoint)
+    hedge_timing = {}
+    hedge = _hedge_pool.submit(
+        _send_hedge, endpoint, settings, headers, params, hedge_timing
+    )
+    done, _ = wait((original, hedge), return_when=FIRST_COMPLETED)
+    first = original if original in done else hedge
+    if first.exception() is not None:
+        # the other one may still come good
+        other = hedge if first is original else original
+        if other.exception() is None:
+            first = other
+    if first is hedge and first.exception() is None:
+        record_hedge(endpoint, won=True)
+    winner = original_timing if first is original else hedge_timing
+    timing["seconds"] = winner["seconds"]
+    return first.result()
+
+
+def fetch_page(
+    logger,
+    endpoint,
+    page=None,
+    params=None,
+    max_retries=3,
+    retry_delay=30,
+    cache=False,
+    stop=None,
+):
+    """api request for one page of an endpoint, None if it can't be fetched
 
-    return None
-
+    With cache, a page that matches the response cache comes back with an
+    empty collection and its ids under "cached_ids", see record_ids(). stop
+    is set by paginate() once nobody wants the page any more, the request
+    then gives up before its next try and records nothing, so pages
+    abandoned after a failure don't count against the breaker or metrics.
+    """
+    settings = ENDPOINTS[endpoint]
+    headers = {"Authorization": f"Bearer {settings['key']}"}
 
-def get_payments(logger, page, max_retries=3, retry_delay=30):
-    """api request for payments"""
+    # params
+    params = dict(params or {})
+    if page is not None:
+        params["page"] = page
 
-    url = f"{env_library.api_url_payments}?page={page}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_payments}"}
+    entry = None
+    cache = cache and cache_library.enabled()
+    if cache:
+        entry = cache_library.lookup(endpoint, params)
+        headers.update(cache_library.validators(entry))
 
     for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching payments on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "payments", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
-
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching payments on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "payments", "error": "non 200"}},
-                )
-                return None
-
-            return response.json()
-        except requests.RequestException as error:
+        if stop is not None and stop.is_set():
+            return None
+        if not allow_request(endpoint):
             logger.error(
-                "Error fetching payments on page %s (Retry %s/%s): %s",
+                "Circuit open for %s, not fetching page %s",
+                endpoint,
                 page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "payments"}},
+                extra={"tags": {"service": endpoint, "error": "circuit open"}},
             )
-
-    return None
-
-
-def get_customers(logger, page, max_retries=3, retry_delay=30):
-    """api request for customers"""
-    url = f"{env_library.api_url_customers}?page={page}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_customers}"}
-
-    for retry_count in range(max_retries):
+            return None
+        record_wait(endpoint, acquire(key_bucket(endpoint)))
+        response = None
+        timing = {}
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching customers on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "customers", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
-
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching customers on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "customers", "error": "non 200"}},
-                )
+            response = _send(endpoint, settings, headers, params, timing)
+            if stop is not None and stop.is_set():
                 return None
-
-            return response.json()
-
-        except requests.RequestException as error:
-            logger.error(
-                "Error fetching customers on page %s (Retry %s/%s): %s",
-                page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "customers"}},
+            record_request(
+                endpoint,
+                timing["seconds"],
+                response.status_code,
+                len(response.content),
+                retry=retry_count > 0,
             )
-
-    return None
-
-
-def get_invoice_lines(logger, page, datatype, max_retries=3, retry_delay=30):
-    """api request for invoice line items"""
-    headers = {"Authorization": f"Bearer {env_library.api_key_invoice}"}
-    if datatype == "invoice":
-        url = (f"{env_library.api_url_invoice_lines}?invoice_id_not_null=false"
-        f"&estimate_id_not_null=false&page={page}")
-    else:
-        url = f"{env_library.api_url_invoice_lines}?page={page}"
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
+            record_result(logger, endpoint, response.status_code in (200, 304, 429))
 
             if response.status_code == 429:
+                delay = retry_after(response, retry_delay)
                 logger.error(
-                    "Rate limit exceeded for fetching invoice line items on page %s: %s",
+                    "Rate limit exceeded for fetching %s on page %s, "
+                    "backing off %ss: %s",
+                    endpoint,
                     page,
+                    delay,
                     response.text,
-                    extra={"tags": {"service": "invoice_lines", "error": "rate limit"}},
+                    extra={"tags": {"service": endpoint, "error": "rate limit"}},
                 )
-                time.sleep(retry_delay)
+                penalize(key_bucket(endpoint), delay)
+                record_backoff(endpoint, delay)
                 continue
 
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching invoice line items on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "invoice_lines", "error": "non 200"}},
+            if response.status_code == 304 and entry is not None:
+                return cache_library.unchanged_page(
+                    endpoint, settings["collection"], entry, not_modified=True
                 )
-                return None
-
-            return response.json()
-
-        except requests.RequestException as error:
-            logger.error(
-                "Error fetching invoice line items on page %s (Retry %s/%s): %s",
-                page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "invoice_lines", "error": "retry"}},
-            )
-
-    return None
-
-
-def get_tickets(
-    logger, page=None, look_back_period=None, max_retries=3, retry_delay=30
-):
-    """api request for ticket data"""
-    # base url / header key
-    url = f"{env_library.api_url_tickets}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_tickets}"}
-
-    # params
-    params = {}
-    if page is not None:
-        params["page"] = page
-    if look_back_period is not None:
-        params["since_updated_at"] = get_date_for_header(look_back_period)
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching ticket data on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "tickets", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
 
             if response.status_code != 200:
                 logger.error(
-                    "Error fetching ticket data on page %s: %s",
+                    "Error fetching %s on page %s: %s",
+                    endpoint,
                     page,
                     response.text,
-                    extra={"tags": {"service": "tickets", "error": "non 200"}},
+                    extra={"tags": {"service": endpoint, "error": "non 200"}},
                 )
                 return None
 
-            return response.json()
-
-        except requests.RequestException as error:
-            logger.error(
-                "Error fetching ticket data on page %s (Retry %s/%s): %s",
-                page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "tickets"}},
-            )
-
-    return None
-
-
-def get_invoices(logger, page=None, look_back_date=None, max_retries=3, retry_delay=30):
-    """API request for invoice data."""
-    # base url / header key
-    url = f"{env_library.api_url_invoice}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_invoice}"}
-
-    # params
-    params = {}
-    if page is not None:
-        params["page"] = page
-    if look_back_date is not None:
-        params["since_updated_at"] = look_back_date
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            if not cache:
+                return json_library.loads(response.content)
 
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching invoices on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "invoices", "error": "rate limit"}},
+            # same bytes as last time, skip decoding and the database
+            body_digest = cache_library.digest(response.content)
+            if entry is not None and body_digest == entry["digest"]:
+                return cache_library.unchanged_page(
+                    endpoint, settings["collection"], entry
                 )
-                time.sleep(retry_delay)
-                continue
-
-            if response.status_code != 200:
-                logger.error(
-                    "Error fetching invoices on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "invoices", "error": "non 200"}},
+            data = json_library.loads(response.content)
+            if settings["collection"] in data:
+                cache_library.stage(
+                    endpoint,
+                    params,
+                    body_digest,
+                    response,
+                    data,
+                    settings["collection"],
                 )
-                return None
-
-            return response.json()
+            return data
 
-        except requests.RequestException as error:
+        except (requests.RequestException, json_library.JSONDecodeError) as error:
+            if stop is not None and stop.is_set():
+                return None
+            if response is None:
+                record_request(
+                    endpoint,
+                    timing.get("seconds", 0.0),
+                    None,
+                    retry=retry_count > 0,
+                )
+                record_result(logger, endpoint, False)
             logger.error(
-                "Error fetching invoices on page %s (Retry %s/%s): %s",
+                "Error fetching %s on page %s (Retry %s/%s): %s",
+                endpoint,
                 page,
                 retry_count + 1,
                 max_retries,
                 str(error),
-                extra={"tags": {"service": "invoices", "error": "retry"}},
+                extra={"tags": {"service": endpoint, "error": "retry"}},
             )
 
     return None
 
 
-def get_products(logger, page, max_retries=3, retry_delay=30):
-    """api request for products"""
-    url = f"{env_library.api_url_products}?page={page}"
-    headers = {"Authorization": f"Bearer {env_library.api_key_products}"}
-
-    for retry_count in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-
-            if response.status_code == 429:
-                logger.error(
-                    "Rate limit exceeded for fetching products on page %s: %s",
-                    page,
-                    response.text,
-                    extra={"tags": {"service": "products", "error": "rate limit"}},
-                )
-                time.sleep(retry_delay)
-                continue
+def paginate(
+    logger,
+    endpoint,
+    params=None,
+    collection=None,
+    start_page=1,
+    workers=1,
+    end_page=None,
+    fetched=None,
+    cache=False,
+):
+    """yield (page, data) for every page of an endpoint
+
+    The first response supplies meta.total_pages and is yielded as its own
+    page, so nothing is fetched twice. fetched maps pages the caller already
+    has (start_page among them, e.g. from locate_page()) to their data, they
+    are yielded as they are instead of being fetched again. end_page stops
+    short of the last page. cache lets pages that haven't changed since the
+    last run come from the response cache, their entries are written once
+    the caller asks for the next page, i.e. after its commit. With workers >
+    1 up to that many of the remaining pages are in flight at once, still
+    yielded in order, with one worker the next PIPELINE_DEPTH pages download
+    while the caller works, see pipeline_library. Iteration stops after
+    logging at the first page that can't be fetched, callers compare the
+    last page they got against meta.total_pages to know if they have
+    everything.
+    """
+    if collection is None:
+        collection = ENDPOINTS[endpoint]["collection"]
+
+    fetched = dict(fetched or {})
+    first = fetched.pop(start_page, None)
+    if first is None:
+        first = fetch_page(logger, endpoint, start_page, params, cache=cache)
+    if first is None or collection not in first:
+        logger.error(
+            "Error getting %s data on page %s",
+            endpoint,
+            start_page,
+            extra={"tags": {"service": endpoint}},
+        )
+        return
+
+    total_pages = first["meta"]["total_pages"]
+    logger.info(
+        "Total pages: %s",
+        total_pages,
+        extra={"tags": {"service": endpoint}},
+    )
+
+    if end_page is not None:
+        total_pages = min(total_pages, end_page)
+    pages = list(range(start_page, total_pages + 1))
+
+    executor = None
+    pending = {}
+    prefetch = None
+    # set when paginate returns, the pages still in flight are abandoned
+    stop = threading.Event()
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif env_library.pipeline_depth > 0:
+        prefetch = start_prefetch(
+            lambda page: fetch_page(
+                logger, endpoint, page, params, cache=cache, stop=stop
+            ),
+            [page for page in pages if page != start_page and page not in fetched],
+            env_library.pipeline_depth,
+        )
 
-            if response.status_code != 200:
+    try:
+        for index, page in enumerate(pages):
+            if executor is not None:
+                # keep the window of in flight pages full
+                for ahead in pages[index : index + workers]:
+                    if (
+                        ahead != start_page
+                        and ahead not in pending
+                        and ahead not in fetched
+                    ):
+                        pending[ahead] = executor.submit(
+                            fetch_page,
+                            logger,
+                            endpoint,
+                            ahead,
+                            params,
+                            cache=cache,
+                            stop=stop,
+                        )
+
+            if page == start_page:
+                data, first = first, None
+            elif page in fetched:
+                data = fetched.pop(page)
+            elif executor is not None:
+                data = pending.pop(page).result()
+            elif prefetch is not None:
+                _page, data = next_page(prefetch[0])
+            else:
+                data = fetch_page(logger, endpoint, page, params, cache=cache)
+
+            if data is None or collection not in data:
                 logger.error(
-                    "Error fetching products on page %s: %s",
+                    "Error getting %s data on page %s",
+                    endpoint,
                     page,
-                    response.text,
-                    extra={"tags": {"service": "products", "error": "non 200"}},
+                    extra={"tags": {"service": endpoint}},
                 )
-                return None
-
-            return response.json()
-
-        except requests.RequestException as error:
+                return
+            # the time until the caller asks for the next page is its own work
+            start = time.perf_counter()
+            yield page, data
+            record_processing(endpoint, time.perf_counter() - start)
+            if cache:
+                cache_library.confirm(endpoint, dict(params or {}, page=page))
+    finally:
+        stop.set()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if prefetch is not None:
+            stop_prefetch(prefetch[1])
+
+
+def record_ids(data, collection):
+    """ids of the records on a page, from the cache if the page was unchanged"""
+    if "cached_ids" in data:
+        return data["cached_ids"]
+    return [record["id"] for record in data[collection]]
+
+
+def _past_boundary(
+    logger, endpoint, page, key, boundary, params, fetched, newest_first=False
+):
+    """True if page has a record at or past boundary, None if it can't be fetched
+
+    Pages are ordered by key, so that's the page's newest record: its last
+    one oldest first, its first one newest first.
+    """
+    collection = ENDPOINTS[endpoint]["collection"]
+    if page not in fetched:
+        data = fetch_page(logger, endpoint, page, params)
+        if data is None or collection not in data:
             logger.error(
-                "Error fetching products on page %s (Retry %s/%s): %s",
+                "Error getting %s data on page %s",
+                endpoint,
                 page,
-                retry_count + 1,
-                max_retries,
-                str(error),
-                extra={"tags": {"service": "products", "error": "retry"}},
-            )
-
-    return None
-
-
-def get_users(logger):
-    """api request for users"""
-    url = "https://cellmechanic.repairshopr.com/api/v1/users"
-    headers = {
-        "Authorization": f"Bearer {env_library.api_key_tickets}"
-    }  # doesn't have perms using random key
-
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-
-        if response.status_code != 200:
-            logger.error(
-                "Error fetching users: %s",
-                response.text,
-                extra={"tags": {"service": "users", "error": "non 200"}},
+                extra={"tags": {"service": endpoint}},
             )
             return None
-
-        return response.json()
-
-    except requests.RequestException as error:
-        logger.error(
-            "Error fetching users: %s",
-            str(error),
-            extra={"tags": {"service": "users"}},
+        fetched[page] = data
+    items = fetched[page][collection]
+    if not items:
+        return False
+    return key(items[0] if newest_first else items[-1]) >= boundary
+
+
+def locate_page(logger, endpoint, key, boundary, params=None, newest_first=False):
+    """binary search an endpoint's pages for where key(record) crosses boundary
+
+    Pages have to be ordered by key, oldest first unless newest_first. Returns
+    (page, total_pages, fetched): for oldest first the first page holding a
+    record at or past boundary, total_pages + 1 if none does, for newest
+    first the last such page, 0 if none does. fetched maps every page read on
+    the way to its data so the caller can hand it to paginate() and none of
+    them is fetched twice. page is None if a page couldn't be fetched.
+    """
+    fetched = {}
+    if (
+        _past_boundary(
+            logger, endpoint, 1, key, boundary, params, fetched, newest_first
         )
-        return None
+        is None
+    ):
+        return None, 0, fetched
+    total_pages = fetched[1]["meta"]["total_pages"]
+
+    if newest_first:
+        low, high = 0, total_pages
+        while low < high:
+            middle = (low + high + 1) // 2
+            past = _past_boundary(
+                logger, endpoint, middle, key, boundary, params, fetched, newest_first
+            )
+            if past is None:
+                return None, total_pages, fetched
+            if past:
+                low = middle
+            else:
+                high = middle - 1
+    else:
+        low, high = 1, total_pages + 1
+        while low < high:
+            middle = (low + high) // 2
+            past = _past_boundary(
+                logger, endpoint, middle, key, boundary, params, fetched, newest_first
+            )
+            if past is None:
+                return None, total_pages, fetched
+            if past:
+                high = middle
+            else:
+                low = middle + 1
+
+    logger.info(
+        "Located page %s of %s after %s request(s)",
+        low,
+        total_pages,
+        len(fetched),
+        extra={"tags": {"service": endpoint}},
+    )
+    return low, total_pages, fetched
 
 
 def get_date_for_header(look_back):
@@ -0,0 +1,130 @@
+"""per endpoint circuit breaker, so a failing endpoint stops early
+
+After API_BREAKER_THRESHOLD failed attempts in a row (errors, timeouts,
+non 200 answers other than 429) an endpoint's breaker opens and its
+requests are refused for API_BREAKER_COOLDOWN seconds. Then one trial
+request is let through, success closes the breaker and failure opens it
+again. Open breakers are stored in api_breakers so the next --frequent run
+skips the endpoint too instead of hammering it again. A threshold of 0
+turns the breaker off.
+"""
+from datetime import datetime, timedelta
+import threading
+import time
+import mysql.connector
+from library import env_library
+from library.db_create import create_api_breakers_table_if_not_exists
+from library.db_general import connect_to_db
+from library.metrics_library import record_breaker
+
+_lock = threading.Lock()
+_breakers = {}
+_loaded = False
+
+
+def _load():
+    """pick up breakers a previous run left open, call with _lock held"""
+    global _loaded  # pylint: disable=global-statement
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        cursor, connection = connect_to_db(env_library.config)
+    except mysql.connector.Error:
+        # no DB (benchmarks against the stand-in), the breakers stay in memory
+        return
+    create_api_breakers_table_if_not_exists(cursor)
+    cursor.execute(
+        "SELECT endpoint, open_until FROM api_breakers WHERE open_until > NOW()"
+    )
+    for endpoint, open_until in cursor.fetchall():
+        remaining = (open_until - datetime.now()).total_seconds()
+        _get_breaker(endpoint)["open_until"] = time.monotonic() + remaining
+    connection.commit()
+    connection.close()
+
+
+def _save(endpoint, seconds):
+    """store (or clear with 0) endpoint's open breaker for the next run"""
+    try:
+        cursor, connection = connect_to_db(env_library.config)
+    except mysql.connector.Error:
+        return
+    create_api_breakers_table_if_not_exists(cursor)
+    cursor.execute(
+        "INSERT INTO api_breakers (endpoint, open_until) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE open_until = VALUES(open_until)",
+        (endpoint, datetime.now() + timedelta(seconds=seconds)),
+    )
+    connection.commit()
+    connection.close()
+
+
+def _get_breaker(endpoint):
+    """breaker state for endpoint, created closed, call with _lock held"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = {"failures": 0, "open_until": 0.0, "trial": False}
+        _breakers[endpoint] = breaker
+    return breaker
+
+
+def allow_request(endpoint):
+    """False while endpoint's breaker is open"""
+    if not env_library.api_breaker_threshold:
+        return True
+    with _lock:
+        _load()
+        breaker = _get_breaker(endpoint)
+        if breaker["open_until"] == 0.0:
+            return True
+        # half open, one trial request at a time
+        if time.monotonic() >= breaker["open_until"] and not breaker["trial"]:
+            breaker["trial"] = True
+            return True
+    record_breaker(endpoint, "skipped")
+    return False
+
+
+def record_result(logger, endpoint, success):
+    """count an attempt's outcome, opening or closing the breaker"""
+    if not env_library.api_breaker_threshold:
+        return
+    cooldown = env_library.api_breaker_cooldown
+    with _lock:
+        breaker = _get_breaker(endpoint)
+        was_open = breaker["open_until"] != 0.0
+        trial, breaker["trial"] = breaker["trial"], False
+        if success:
+            breaker["failures"] = 0
+            breaker["open_until"] = 0.0
+            changed = was_open
+        else:
+            breaker["failures"] += 1
+            # stragglers sent before the breaker opened don't reopen it
+            if was_open:
+                changed = trial
+            else:
+                changed = breaker["failures"] >= env_library.api_breaker_threshold
+            if changed:
+                breaker["open_until"] = time.monotonic() + cooldown
+    if not changed:
+        return
+
+    if success:
+        logger.info(
+            "Circuit closed for %s",
+            endpoint,
+            extra={"tags": {"service": endpoint, "breaker": "closed"}},
+        )
+        _save(endpoint, 0)
+        return
+    logger.error(
+        "Circuit open for %s after %s failure(s), skipping it for %ss",
+        endpoint,
+        breaker["failures"],
+        cooldown,
+        extra={"tags": {"service": endpoint, "breaker": "open"}},
+    )
+    record_breaker(endpoint, "opened")
+    _save(endpoint, cooldown)
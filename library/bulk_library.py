@@ -0,0 +1,231 @@
+"""bulk load path for --full runs, LOAD DATA into a staging table and merge
+
+With DB_BULK_LOAD=1 the full runs of tickets, comments and invoice_items
+don't upsert page by page. Rows go to a TSV file, every DB_BULK_ROWS rows
+the file is loaded into stage_<table> with LOAD DATA LOCAL INFILE and the
+pages it held are checkpointed, so a stopped run resumes with its staged
+rows intact. Once paging is done merge_staged() inserts the new rows,
+updates the newer ones and finds the rows that are gone in one pass of
+set-based SQL, archive_gone() moves those to deleted_<table>.
+"""
+from datetime import datetime
+from decimal import Decimal
+import os
+import tempfile
+import time
+from library import env_library
+from library.schema_library import SCHEMAS, deleted_table_sql
+from library.volume_library import insert_volume
+
+# LOAD DATA's default escaping, FIELDS ESCAPED BY '\\'
+_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"}
+)
+
+
+def bulk_enabled():
+    """True if DB_BULK_LOAD is set"""
+    return env_library.db_bulk_load
+
+
+def _tsv_field(value):
+    """one value in LOAD DATA's default text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value).translate(_ESCAPES)
+
+
+def _open_file():
+    """fresh TSV file for the next load"""
+    return tempfile.NamedTemporaryFile(
+        "w", suffix=".tsv", delete=False, encoding="utf-8", newline="\n"
+    )
+
+
+def start_bulk(cursor, table, columns, fresh):
+    """bulk state for table, fresh empties rows a previous run staged"""
+    stage = f"stage_{table}"
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS `{stage}` LIKE `{table}`")
+    if fresh:
+        cursor.execute(f"TRUNCATE TABLE `{stage}`")
+    return {
+        "table": table,
+        "stage": stage,
+        "columns": columns,
+        "file": _open_file(),
+        "rows": 0,
+        "loaded": 0,
+        "seconds": 0.0,
+    }
+
+
+def add_rows(bulk, rows):
+    """append row tuples, in the bulk's column order, to the TSV file"""
+    write = bulk["file"].write
+    for row in rows:
+        write("\t".join([_tsv_field(value) for value in row]))
+        write("\n")
+    bulk["rows"] += len(rows)
+
+
+def flush_due(bulk):
+    """True once the file holds DB_BULK_ROWS rows"""
+    return bulk["rows"] >= env_library.db_bulk_rows
+
+
+def load_rows(cursor, bulk):
+    """LOAD DATA the file into the staging table, the caller commits"""
+    path = bulk["file"].name
+    bulk["file"].close()
+    try:
+        if bulk["rows"]:
+            start = time.perf_counter()
+            names = ", ".join(f"`{column}`" for column in bulk["columns"])
+            # a page that shifted during the run replaces its earlier copy
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE `{bulk['stage']}` "
+                f"CHARACTER SET utf8mb4 ({names})",
+                (path,),
+            )
+            bulk["seconds"] += time.perf_counter() - start
+            bulk["loaded"] += bulk["rows"]
+    finally:
+        os.unlink(path)
+    bulk["file"] = _open_file()
+    bulk["rows"] = 0
+
+
+def merge_rows(cursor, table, stage, columns, version, newer=None):
+    """insert stage's new rows into table and update the changed ones, return
+    (added, updated)
+
+    columns[0] is the primary key, a row changed when newer, an SQL test of
+    the live row t against the staged row s, holds, by default when the
+    staged version is larger.
+    """
+    key = columns[0]
+    if newer is None:
+        newer = f"t.`{version}` IS NULL OR s.`{version}` > t.`{version}`"
+
+    names = ", ".join(f"`{column}`" for column in columns)
+    staged = ", ".join(f"s.`{column}`" for column in columns)
+    cursor.execute(
+        f"INSERT INTO `{table}` ({names}) SELECT {staged} FROM `{stage}` s "
+        f"LEFT JOIN `{table}` t ON t.`{key}` = s.`{key}` WHERE t.`{key}` IS NULL"
+    )
+    added = cursor.rowcount
+
+    assignments = ", ".join(
+        f"t.`{column}` = s.`{column}`"
+        for column in [column for column in columns[1:] if column != version]
+        + [version]
+    )
+    cursor.execute(
+        f"UPDATE `{table}` t JOIN `{stage}` s ON s.`{key}` = t.`{key}` "
+        f"SET {assignments} WHERE {newer}"
+    )
+    return added, cursor.rowcount
+
+
+def merge_staged(logger, cursor, bulk, version, volume_name, expected=None):
+    """merge the staging table into the live one, return the ids that are gone
+
+    New rows are inserted, rows whose version grew are updated. The ids in
+    the live table but not staged are only returned if the staging table
+    holds expected rows, i.e. every page, None otherwise.
+    """
+    table = bulk["table"]
+    stage = bulk["stage"]
+    key = bulk["columns"][0]
+    start = time.perf_counter()
+
+    added, updated = merge_rows(cursor, table, stage, bulk["columns"], version)
+
+    gone = None
+    cursor.execute(f"SELECT COUNT(*) FROM `{stage}`")
+    if expected is not None and cursor.fetchone()[0] == expected:
+        cursor.execute(
+            f"SELECT t.`{key}` FROM `{table}` t LEFT JOIN `{stage}` s "
+            f"ON s.`{key}` = t.`{key}` WHERE s.`{key}` IS NULL"
+        )
+        gone = [row[0] for row in cursor.fetchall()]
+    else:
+        cursor.fetchall()
+
+    if added > 0 or updated > 0:
+        insert_volume(
+            cursor, logger, new=added, updated=updated, table_name=volume_name
+        )
+    seconds = bulk["seconds"] + time.perf_counter() - start
+    logger.info(
+        "Bulk merged %s: %s staged, added %s, updated %s, %s gone, %s rows/s",
+        table,
+        bulk["loaded"],
+        added,
+        updated,
+        "unknown" if gone is None else len(gone),
+        round(bulk["loaded"] / seconds) if seconds else bulk["loaded"],
+        extra={"tags": {"service": table}},
+    )
+    return gone
+
+
+def archive_gone(logger, cursor, bulk, gone, volume_name, children=()):
+    """move the rows merge_staged() found gone to deleted_<table>, return
+    how many
+
+    children are (table, column) pairs whose rows reference the gone ones,
+    they're archived first. Works a DB_BATCH_SIZE chunk of ids at a time.
+    """
+    if not gone:
+        return 0
+    table = bulk["table"]
+    key = bulk["columns"][0]
+    for child, _column in children:
+        cursor.execute(deleted_table_sql(SCHEMAS[child]))
+    cursor.execute(deleted_table_sql(SCHEMAS[table]))
+
+    size = max(1, env_library.db_batch_size)
+    for offset in range(0, len(gone), size):
+        chunk = gone[offset : offset + size]
+        marks = ", ".join(["%s"] * len(chunk))
+        for child, column in children:
+            cursor.execute(
+                f"REPLACE INTO `deleted_{child}` SELECT * FROM `{child}` "
+                f"WHERE `{column}` IN ({marks})",
+                chunk,
+            )
+            cursor.execute(
+                f"DELETE FROM `{child}` WHERE `{column}` IN ({marks})", chunk
+            )
+        cursor.execute(
+            f"REPLACE INTO `deleted_{table}` SELECT * FROM `{table}` "
+            f"WHERE `{key}` IN ({marks})",
+            chunk,
+        )
+        cursor.execute(f"DELETE FROM `{table}` WHERE `{key}` IN ({marks})", chunk)
+
+    insert_volume(cursor, logger, deleted=len(gone), table_name=volume_name)
+    logger.warning(
+        "Moved %s gone %s row(s) to deleted_%s",
+        len(gone),
+        table,
+        table,
+        extra={"tags": {"service": table, "finished": "full"}},
+    )
+    return len(gone)
+
+
+def finish_bulk(cursor, bulk, clear):
+    """drop the TSV file, after the commit, clear also empties the staging
+    table, leave it for a run that stopped early to resume from"""
+    bulk["file"].close()
+    os.unlink(bulk["file"].name)
+    if clear:
+        cursor.execute(f"TRUNCATE TABLE `{bulk['stage']}`")
@@ -0,0 +1,162 @@
+"""on disk cache of api pages, so a page that hasn't changed skips all the work
+
+Each (endpoint, params) keeps the sha256 of the last body, its ETag /
+Last-Modified and the page's meta and record ids. A 304 or a body with the
+same digest comes back as an empty page carrying the cached ids instead of
+being decoded and upserted again. Entries are only written once the caller
+has committed the page, see stage() / confirm(). Disabled unless
+API_CACHE_PATH is set.
+"""
+from array import array
+import hashlib
+import json
+import sqlite3
+import threading
+from library import env_library
+
+_lock = threading.Lock()
+_connection = None
+_staged = {}
+_stats = {}
+
+
+def enabled():
+    """True if API_CACHE_PATH is set"""
+    return bool(env_library.api_cache_path)
+
+
+def _get_connection():
+    """sqlite connection shared by the fetch threads, call with _lock held"""
+    global _connection  # pylint: disable=global-statement
+    if _connection is None:
+        _connection = sqlite3.connect(
+            env_library.api_cache_path, check_same_thread=False
+        )
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT,
+                params TEXT,
+                digest TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                meta TEXT,
+                ids BLOB,
+                PRIMARY KEY (endpoint, params)
+            )
+            """
+        )
+    return _connection
+
+
+def _params_key(params):
+    """stable text form of the request params, page included"""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def _count(endpoint, outcome):
+    """bump the hit / miss counters, call with _lock held"""
+    stats = _stats.setdefault(endpoint, {"hits": 0, "not_modified": 0, "misses": 0})
+    stats[outcome] += 1
+
+
+def digest(body):
+    """sha256 of a raw response body"""
+    return hashlib.sha256(body).hexdigest()
+
+
+def lookup(endpoint, params):
+    """cached entry for the request, None if there isn't one"""
+    with _lock:
+        row = (
+            _get_connection()
+            .execute(
+                "SELECT digest, etag, last_modified, meta, ids FROM responses "
+                "WHERE endpoint = ? AND params = ?",
+                (endpoint, _params_key(params)),
+            )
+            .fetchone()
+        )
+    if row is None:
+        return None
+    ids = array("q")
+    ids.frombytes(row[4])
+    return {
+        "digest": row[0],
+        "etag": row[1],
+        "last_modified": row[2],
+        "meta": json.loads(row[3]),
+        "ids": ids,
+    }
+
+
+def validators(entry):
+    """conditional request headers for a cached entry"""
+    headers = {}
+    if entry is None:
+        return headers
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def unchanged_page(endpoint, collection, entry, not_modified=False):
+    """stand in for a page that matches its cache entry"""
+    with _lock:
+        _count(endpoint, "not_modified" if not_modified else "hits")
+    return {"meta": entry["meta"], collection: [], "cached_ids": entry["ids"]}
+
+
+def stage(endpoint, params, body_digest, response, data, collection):
+    """hold a changed page's entry until the caller has committed the page"""
+    ids = array("q", (record["id"] for record in data[collection]))
+    with _lock:
+        _count(endpoint, "misses")
+        _staged[(endpoint, _params_key(params))] = (
+            body_digest,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            json.dumps(data.get("meta", {})),
+            ids.tobytes(),
+        )
+
+
+def confirm(endpoint, params):
+    """write the staged entry for a page the caller has committed"""
+    key = (endpoint, _params_key(params))
+    with _lock:
+        entry = _staged.pop(key, None)
+        if entry is None:
+            return
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(endpoint, params, digest, etag, last_modified, meta, ids) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            key + entry,
+        )
+        connection.commit()
+
+
+def cache_stats():
+    """copy of the per endpoint hit counters"""
+    with _lock:
+        return {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+
+
+def log_cache_stats(logger):
+    """log how many pages each endpoint got from the cache"""
+    for endpoint, stats in cache_stats().items():
+        pages = stats["hits"] + stats["not_modified"] + stats["misses"]
+        logger.info(
+            "Response cache %s: %s / %s page(s) unchanged (%s not modified), "
+            "%s%% hit rate",
+            endpoint,
+            stats["hits"] + stats["not_modified"],
+            pages,
+            stats["not_modified"],
+            round(100 * (stats["hits"] + stats["not_modified"]) / pages, 1),
+            extra={"tags": {"service": "api_cache"}},
+        )
@@ -0,0 +1,107 @@
+"""full run checkpoints, so a restarted --full resumes where it stopped"""
+from array import array
+from datetime import datetime, timedelta
+from library import env_library
+from library.db_create import create_sync_state_tables_if_not_exists
+
+
+def clear_checkpoint(cursor, endpoint):
+    """forget the checkpoint for endpoint"""
+    create_sync_state_tables_if_not_exists(cursor)
+    cursor.execute("DELETE FROM sync_state_ids WHERE endpoint = %s", (endpoint,))
+    cursor.execute("DELETE FROM sync_state WHERE endpoint = %s", (endpoint,))
+
+
+def load_checkpoint(logger, cursor, endpoint):
+    """return (page to start from, ids already committed) for endpoint
+
+    The last committed page is fetched again, its ids are dropped from the
+    restored set so they aren't counted twice. A checkpoint that is too old
+    or whose ids don't match the stored count / sum digest is discarded.
+    """
+    create_sync_state_tables_if_not_exists(cursor)
+    cursor.execute(
+        "SELECT last_page, id_count, id_sum, started_at FROM sync_state "
+        "WHERE endpoint = %s",
+        (endpoint,),
+    )
+    state = cursor.fetchone()
+    if state is None:
+        return 1, array("q")
+
+    last_page, id_count, id_sum, started_at = state
+    max_age = timedelta(hours=env_library.checkpoint_max_age_hours)
+    if started_at is None or datetime.now() - started_at > max_age:
+        logger.warning(
+            "Checkpoint for %s started at %s is too old, starting over",
+            endpoint,
+            started_at,
+            extra={"tags": {"service": endpoint, "checkpoint": "stale"}},
+        )
+        clear_checkpoint(cursor, endpoint)
+        return 1, array("q")
+
+    cursor.execute(
+        "SELECT page, ids FROM sync_state_ids WHERE endpoint = %s ORDER BY page",
+        (endpoint,),
+    )
+    ids = array("q")
+    last_page_count = 0
+    for page, blob in cursor.fetchall():
+        page_ids = array("q")
+        page_ids.frombytes(blob)
+        if page < last_page:
+            ids.extend(page_ids)
+        else:
+            last_page_count += len(page_ids)
+            id_sum -= sum(page_ids)
+
+    if len(ids) + last_page_count != id_count or sum(ids) != id_sum:
+        logger.warning(
+            "Checkpoint for %s doesn't match its digest, starting over",
+            endpoint,
+            extra={"tags": {"service": endpoint, "checkpoint": "mismatch"}},
+        )
+        clear_checkpoint(cursor, endpoint)
+        return 1, array("q")
+
+    # rewind to just before the page we're about to fetch again
+    cursor.execute(
+        "DELETE FROM sync_state_ids WHERE endpoint = %s AND page >= %s",
+        (endpoint, last_page),
+    )
+    cursor.execute(
+        "UPDATE sync_state SET last_page = %s, id_count = %s, id_sum = %s "
+        "WHERE endpoint = %s",
+        (last_page - 1, len(ids), sum(ids), endpoint),
+    )
+    logger.info(
+        "Resuming %s from page %s with %s ids already committed",
+        endpoint,
+        last_page,
+        len(ids),
+        extra={"tags": {"service": endpoint, "checkpoint": "resume"}},
+    )
+    return last_page, ids
+
+
+def save_checkpoint(cursor, endpoint, page, page_ids):
+    """record page as committed, call before the page's commit"""
+    cursor.execute(
+        "INSERT INTO sync_state_ids (endpoint, page, ids) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE ids = VALUES(ids)",
+        (endpoint, page, array("q", page_ids).tobytes()),
+    )
+    cursor.execute(
+        """
+        INSERT INTO sync_state (
+            endpoint, last_page, id_count, id_sum, started_at, updated_at
+        ) VALUES (%s, %s, %s, %s, NOW(), NOW())
+        ON DUPLICATE KEY UPDATE
+            last_page = VALUES(last_page),
+            id_count = id_count + VALUES(id_count),
+            id_sum = id_sum + VALUES(id_sum),
+            updated_at = NOW()
+        """,
+        (endpoint, page, len(page_ids), sum(page_ids)),
+    )
@@ -0,0 +1,124 @@
+"""AIMD limits on api requests in flight, one per api key, shared by every
+module in the run
+
+Each key's limit starts at API_WORKERS and grows by one for every limit's
+worth of healthy responses, up to API_CONCURRENCY_MAX. A 429 or a timeout
+cuts it by API_CONCURRENCY_DECREASE, down to API_CONCURRENCY_MIN. Other
+errors leave it where it is. Responses to requests sent before a cut don't
+cut it again, so a burst of 429s from one window only halves it once. Keys
+have separate budgets at RS, so one key backing off doesn't slow the
+others' lanes down.
+"""
+import threading
+import time
+from library import env_library
+from library.metrics_library import set_gauge
+
+_lock = threading.Lock()
+_controllers = {}
+
+
+def _controller(key):
+    """key's controller state, created on first use"""
+    with _lock:
+        state = _controllers.get(key)
+        if state is None:
+            state = _controllers[key] = {
+                "condition": threading.Condition(),
+                "limit": float(
+                    min(
+                        max(env_library.api_workers, env_library.api_concurrency_min),
+                        env_library.api_concurrency_max,
+                    )
+                ),
+                "in_flight": 0,
+                "peak": 0,
+                "started": 0,
+                "cut_at": 0,
+                "increases": 0,
+                "decreases": 0,
+                "waited": 0.0,
+            }
+        return state
+
+
+def _export(key, state):
+    """push key's controller state to the metrics gauges, call with its
+    condition held"""
+    set_gauge(f"concurrency_limit.{key}", round(state["limit"], 2))
+    set_gauge(f"concurrency_in_flight.{key}", state["in_flight"])
+
+
+def enter(key):
+    """wait for a slot under key's limit, returns the ticket to pass to leave()"""
+    state = _controller(key)
+    start = time.monotonic()
+    with state["condition"]:
+        while state["in_flight"] >= int(state["limit"]):
+            state["condition"].wait()
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        state["started"] += 1
+        state["waited"] += time.monotonic() - start
+        _export(key, state)
+        return key, state["started"]
+
+
+def leave(ticket, overloaded=False, failed=False):
+    """free the slot, overloaded for a 429 or a timeout, failed for any other
+    error, which neither raises nor cuts the limit"""
+    key, started = ticket
+    state = _controller(key)
+    with state["condition"]:
+        state["in_flight"] -= 1
+        if overloaded:
+            if started > state["cut_at"]:
+                state["limit"] = max(
+                    float(env_library.api_concurrency_min),
+                    state["limit"] * env_library.api_concurrency_decrease,
+                )
+                state["cut_at"] = state["started"]
+                state["decreases"] += 1
+        elif not failed and state["limit"] < env_library.api_concurrency_max:
+            state["limit"] = min(
+                float(env_library.api_concurrency_max),
+                state["limit"] + 1 / state["limit"],
+            )
+            state["increases"] += 1
+        _export(key, state)
+        state["condition"].notify_all()
+
+
+def concurrency_stats():
+    """{key: copy of its controller state}, waited is seconds"""
+    with _lock:
+        controllers = dict(_controllers)
+    stats = {}
+    for key, state in controllers.items():
+        with state["condition"]:
+            stats[key] = {
+                "limit": round(state["limit"], 2),
+                "in_flight": state["in_flight"],
+                "peak": state["peak"],
+                "requests": state["started"],
+                "increases": state["increases"],
+                "decreases": state["decreases"],
+                "waited": round(state["waited"], 3),
+            }
+    return stats
+
+
+def log_concurrency_stats(logger):
+    """log where each key's controller ended up and how often it moved"""
+    for key, stats in concurrency_stats().items():
+        logger.info(
+            "Concurrency limit for %s %s (peak %s in flight), %s increase(s), "
+            "%s decrease(s), waited %ss for a slot",
+            key,
+            stats["limit"],
+            stats["peak"],
+            stats["increases"],
+            stats["decreases"],
+            stats["waited"],
+            extra={"tags": {"service": "concurrency", "metric": "aimd"}},
+        )
@@ -1,7 +1,12 @@
 """General DB utilities"""
+from array import array
+from bisect import bisect_left
 from calendar import c
+from collections import OrderedDict
 import re
+import weakref
 import mysql.connector
+from library import env_library
 
 
 def rate_limit():
@@ -9,21 +14,103 @@ def rate_limit():
     return 60 / 180
 
 
-def connect_to_db(config):
-    """connect to the db"""
-    connection = mysql.connector.connect(**config)
+# connection profiles for DB_PROFILE: use_pure picks the pure Python
+# protocol (True), the C extension (False) or whatever is installed (None),
+# prepared runs the hot statements as server side prepared statements
+DB_PROFILES = {
+    "default": {"use_pure": None, "prepared": False},
+    "pure": {"use_pure": True, "prepared": False},
+    "pure_prepared": {"use_pure": True, "prepared": True},
+    "cext": {"use_pure": False, "prepared": False},
+    "fast": {"use_pure": False, "prepared": True},
+}
+# prepared statements kept per connection, the least recently used is closed
+HOT_STATEMENTS = 64
+
+# cursor connect_to_db() handed out -> its connection and extra cursors
+_connections = weakref.WeakKeyDictionary()
+
+
+def connect_to_db(config, profile=None):
+    """connect to the db, with the DB_PROFILE profile unless profile is given
+
+    "fast" needs the C extension, mysql.connector raises ImportError when it
+    isn't installed.
+    """
+    settings = DB_PROFILES[profile or env_library.db_profile]
+    options = dict(config)
+    if settings["use_pure"] is not None:
+        options["use_pure"] = settings["use_pure"]
+    connection = mysql.connector.connect(**options)
     cursor = connection.cursor()
+    _connections[cursor] = {
+        "connection": connection,
+        "prepared": settings["prepared"],
+        "statements": OrderedDict(),
+        "buffered": None,
+    }
     return cursor, connection
 
 
-def compare_id_sums(logger, cursor, data, table_name):
+def execute_hot(cursor, sql, params=None, buffered=False, prepare=True):
+    """run one of the statements the sync sends over and over, return the
+    cursor its result is read from
+
+    On a prepared profile every statement gets its own prepared cursor, so
+    the upserts and lookups don't re-prepare each other, prepare=False
+    keeps statements whose text changes every call off them. Otherwise
+    buffered reads the whole result as the statement runs instead of row by
+    row. Cursors that didn't come from connect_to_db() just run sql.
+    """
+    state = _connections.get(cursor)
+    if state is None:
+        cursor.execute(sql, params)
+        return cursor
+    if state["prepared"] and prepare:
+        statements = state["statements"]
+        hot = statements.pop(sql, None)
+        if hot is None:
+            if len(statements) >= HOT_STATEMENTS:
+                statements.popitem(last=False)[1].close()
+            hot = state["connection"].cursor(prepared=True)
+        statements[sql] = hot
+    elif buffered:
+        if state["buffered"] is None:
+            state["buffered"] = state["connection"].cursor(buffered=True)
+        hot = state["buffered"]
+    else:
+        hot = cursor
+    hot.execute(sql, params)
+    return hot
+
+
+def connection_profile(cursor):
+    """(protocol, prepared) of the connection behind cursor, protocol is
+    cext or pure, for logs and benchmarks"""
+    state = _connections[cursor]
+    cext = type(state["connection"]).__name__.startswith("CMySQL")
+    return "cext" if cext else "pure", state["prepared"]
+
+
+def compact_ids(ids):
+    """sorted 8 byte array of ids, a fraction of the size of a set of ints"""
+    return array("q", sorted(ids))
+
+
+def contains_id(ids, value):
+    """membership test against compact_ids() output"""
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def compare_id_sums(logger, cursor, ids, table_name):
     """compare the id sums to make sure they match"""
 
     if table_name == "contacts":
         cursor.execute("SELECT SUM(id) FROM contacts")
         contacts_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(contact["id"] for contact in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from contacts API: %s",
             sum_of_ids_api,
@@ -52,7 +139,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM invoice_items")
         line_items_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(invoice_item["id"] for invoice_item in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from invoice_items table in DB: %s",
             line_items_sum,
@@ -80,7 +167,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM tickets")
         tickets_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(ticket["id"] for ticket in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from tickets table in DB: %s",
             tickets_sum,
@@ -107,7 +194,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM comments")
         comments_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(comment["id"] for comment in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from comments table in DB: %s",
             comments_sum,
@@ -134,7 +221,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM customers")
         customers_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(customer["id"] for customer in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from customers table in DB: %s",
             customers_sum,
@@ -161,7 +248,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM estimates")
         estimates_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(estimate["id"] for estimate in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from estimates table in DB: %s",
             estimates_sum,
@@ -188,7 +275,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM invoices")
         invoices_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(invoice["id"] for invoice in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from invoices table in DB: %s",
             invoices_sum,
@@ -215,7 +302,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM payments")
         payments_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(payment["id"] for payment in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from payments table in DB: %s",
             payments_sum,
@@ -244,7 +331,7 @@ def compare_id_sums(logger, cursor, data, table_name):
         cursor.execute("SELECT SUM(id) FROM products")
         products_sum = cursor.fetchone()[0]
 
-        sum_of_ids_api = sum(product["id"] for product in data)
+        sum_of_ids_api = sum(ids)
         logger.info(
             "Sum of IDs from products table in DB: %s",
             products_sum,
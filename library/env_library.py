@@ -21,6 +21,52 @@ api_url_payments = os.getenv("API_PAYMENTS")
 api_key_products = os.getenv("API_PRODUCTS_KEY")
 api_url_products = os.getenv("API_PRODUCTS")
 
+# Connections kept open per host by the shared API session
+api_pool_size = int(os.getenv("API_POOL_SIZE", "10"))
+# Pages in flight at once for modules main.py runs concurrently
+api_workers = int(os.getenv("API_WORKERS", "4"))
+# Bounds of the adaptive limit on requests in flight per api key, which
+# starts at API_WORKERS, and the factor a 429 or timeout cuts it by, see
+# concurrency_library
+api_concurrency_min = int(os.getenv("API_CONCURRENCY_MIN", "1"))
+api_concurrency_max = int(os.getenv("API_CONCURRENCY_MAX", "16"))
+api_concurrency_decrease = float(os.getenv("API_CONCURRENCY_DECREASE", "0.5"))
+# Send a second copy of a request that's slower than the endpoint's recent
+# API_HEDGE_PERCENTILE latency, once API_HEDGE_MIN_SAMPLES are known
+api_hedge = os.getenv("API_HEDGE", "0") == "1"
+api_hedge_percentile = float(os.getenv("API_HEDGE_PERCENTILE", "95"))
+api_hedge_min_samples = int(os.getenv("API_HEDGE_MIN_SAMPLES", "20"))
+# Failed attempts in a row that open an endpoint's circuit breaker (0 turns
+# it off) and how long it stays open
+api_breaker_threshold = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+api_breaker_cooldown = int(os.getenv("API_BREAKER_COOLDOWN", "600"))
+# Pages a single worker paginate() downloads ahead of the page being written,
+# 0 fetches one page at a time
+pipeline_depth = int(os.getenv("PIPELINE_DEPTH", "1"))
+# Requests the rate limiter lets through back to back before pacing kicks in
+api_rate_burst = int(os.getenv("API_RATE_BURST", "1"))
+
+# Run modules on different api keys at the same time, see scheduler_library
+api_parallel_keys = os.getenv("API_PARALLEL_KEYS", "1") == "1"
+
+# Seconds of each --frequent cycle the api work may take, non critical
+# modules that don't fit are deferred to the next cycle
+frequent_cycle_seconds = int(os.getenv("FREQUENT_CYCLE_SECONDS", "240"))
+
+# Full run checkpoints older than this are thrown away instead of resumed
+checkpoint_max_age_hours = int(os.getenv("CHECKPOINT_MAX_AGE_HOURS", "24"))
+# sqlite file for the api response cache, unset turns the cache off
+api_cache_path = os.getenv("API_CACHE_PATH", "")
+# Decoder for api pages: auto, orjson or json, see json_library
+json_backend = os.getenv("JSON_BACKEND", "auto").lower()
+# How far before the stored watermark an incremental run asks from
+watermark_overlap_seconds = int(os.getenv("WATERMARK_OVERLAP_SECONDS", "300"))
+
+# Webhook receiver, refuses to start without a secret, see modules/webhooks
+webhook_secret = os.getenv("WEBHOOK_SECRET", "")
+webhook_host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+webhook_port = int(os.getenv("WEBHOOK_PORT", "8085"))
+
 loki_url = os.getenv("LOKI_URL")
 
 user = os.getenv("DB_USER")
@@ -28,10 +74,24 @@ password = os.getenv("DB_PASSWORD")
 host = os.getenv("DB_HOST")
 database = os.getenv("DB_NAME")
 
+# Rows per multi-row upsert statement, see db_insert.upsert_rows()
+db_batch_size = int(os.getenv("DB_BATCH_SIZE", "500"))
+# Full runs of tickets, comments and invoice_items load through a staging
+# table, DB_BULK_ROWS rows per LOAD DATA, see bulk_library
+db_bulk_load = os.getenv("DB_BULK_LOAD", "0") == "1"
+db_bulk_rows = int(os.getenv("DB_BULK_ROWS", "20000"))
+# Full runs of contacts, products and invoice_items build shadow_<table> and
+# swap it in with RENAME TABLE, see shadow_library
+db_shadow_swap = os.getenv("DB_SHADOW_SWAP", "0") == "1"
+# Connection profile, see db_general.DB_PROFILES, "fast" for the C extension
+# with prepared upserts and lookups
+db_profile = os.getenv("DB_PROFILE", "default")
+
 # Database configuration
 config = {
     "user": user,
     "password": password,
     "host": host,
     "database": database,
+    "allow_local_infile": db_bulk_load,
 }
@@ -0,0 +1,31 @@
+"""json decoding for api pages, orjson when it's installed
+
+JSON_BACKEND picks the decoder at startup: "auto" (default) uses orjson if
+it imports and the stdlib json otherwise, "orjson" / "json" force one, an
+orjson that isn't installed falls back to json.
+"""
+import json
+from library import env_library
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the install
+    orjson = None
+
+
+def _select(name):
+    """(backend name, loads) for a JSON_BACKEND value"""
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.loads
+    return "json", json.loads
+
+
+BACKEND, _loads = _select(env_library.json_backend)
+
+# orjson's decode error subclasses this one
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(body):
+    """decode a response body, bytes or str"""
+    return _loads(body)
@@ -0,0 +1,344 @@
+"""run metrics: peak memory per module and per endpoint request telemetry"""
+from collections import deque
+from datetime import datetime
+import json
+import resource
+import threading
+from library import env_library
+from library.db_create import create_api_metrics_table_if_not_exists
+from library.db_general import connect_to_db
+
+# Upper bounds in ms of the request latency histogram, the last one catches
+# everything slower
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+# Latencies kept per endpoint for percentiles
+RECENT_LATENCIES = 1000
+
+_lock = threading.Lock()
+_endpoints = {}
+_gauges = {}
+# thread running a module -> True once another module overlapped it
+_rss_readings = {}
+
+
+def reset_peak_rss():
+    """start the calling module's peak RSS reading
+
+    The kernel's peak RSS mark is process wide, so it's only reset when no
+    other module is running. Modules that overlap another one, e.g. in the
+    scheduler's parallel key lanes, get the process peak instead, see
+    log_peak_rss().
+    """
+    current = threading.get_ident()
+    alive = {thread.ident for thread in threading.enumerate()}
+    with _lock:
+        # readings a module that raised never finished
+        for thread in list(_rss_readings):
+            if thread == current or thread not in alive:
+                del _rss_readings[thread]
+        overlapped = bool(_rss_readings)
+        for thread in _rss_readings:
+            _rss_readings[thread] = True
+        _rss_readings[current] = overlapped
+        if overlapped:
+            return
+        try:
+            with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+                file.write("5")
+        except OSError:
+            pass
+
+
+def peak_rss_kb():
+    """peak resident memory in KB since the last reset_peak_rss()"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # no /proc, fall back to the high water mark for the whole process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def log_peak_rss(logger, service):
+    """log the peak RSS of the module that just finished, or the process
+    wide one if another module ran alongside it"""
+    with _lock:
+        overlapped = _rss_readings.pop(threading.get_ident(), True)
+    if overlapped:
+        logger.info(
+            "Peak RSS: %s MB, process wide, other modules ran alongside",
+            round(peak_rss_kb() / 1024, 1),
+            extra={"tags": {"service": service, "metric": "peak_rss_process"}},
+        )
+        return
+    logger.info(
+        "Peak RSS: %s MB",
+        round(peak_rss_kb() / 1024, 1),
+        extra={"tags": {"service": service, "metric": "peak_rss"}},
+    )
+
+
+def _get_endpoint(endpoint):
+    """metrics for endpoint, created empty on first use, call with _lock held"""
+    metrics = _endpoints.get(endpoint)
+    if metrics is None:
+        metrics = {
+            "requests": 0,
+            "retries": 0,
+            "throttled": 0,
+            "errors": 0,
+            "bytes": 0,
+            "latency": 0.0,
+            "max_latency": 0.0,
+            "histogram": [0] * len(LATENCY_BUCKETS),
+            "recent": deque(maxlen=RECENT_LATENCIES),
+            "statuses": {},
+            "backoff": 0.0,
+            "waited": 0.0,
+            "processing": 0.0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "breaker_opened": 0,
+            "breaker_skipped": 0,
+        }
+        _endpoints[endpoint] = metrics
+    return metrics
+
+
+def record_request(endpoint, seconds, status, size=0, retry=False):
+    """one http attempt, status is None if it raised before a response"""
+    milliseconds = seconds * 1000
+    with _lock:
+        metrics = _get_endpoint(endpoint)
+        metrics["requests"] += 1
+        metrics["bytes"] += size
+        metrics["latency"] += milliseconds
+        metrics["max_latency"] = max(metrics["max_latency"], milliseconds)
+        metrics["recent"].append(milliseconds)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if milliseconds <= bound:
+                metrics["histogram"][index] += 1
+                break
+        status = str(status) if status is not None else "error"
+        metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+        if retry:
+            metrics["retries"] += 1
+        if status == "429":
+            metrics["throttled"] += 1
+        elif status != "200" and status != "304":
+            metrics["errors"] += 1
+
+
+def record_backoff(endpoint, seconds):
+    """time a 429 held the endpoint back"""
+    with _lock:
+        _get_endpoint(endpoint)["backoff"] += seconds
+
+
+def record_wait(endpoint, seconds):
+    """time the endpoint waited on the rate limiter"""
+    with _lock:
+        _get_endpoint(endpoint)["waited"] += seconds
+
+
+def record_processing(endpoint, seconds):
+    """time the caller spent on a page, mostly database work"""
+    with _lock:
+        _get_endpoint(endpoint)["processing"] += seconds
+
+
+def record_hedge(endpoint, won=False):
+    """a hedge request was sent, won if it answered before the original"""
+    with _lock:
+        metrics = _get_endpoint(endpoint)
+        if won:
+            metrics["hedge_wins"] += 1
+        else:
+            metrics["hedged"] += 1
+
+
+def record_breaker(endpoint, event):
+    """circuit breaker "opened" or a request "skipped" while it was open"""
+    with _lock:
+        _get_endpoint(endpoint)[f"breaker_{event}"] += 1
+
+
+def request_counts():
+    """requests made so far per endpoint"""
+    with _lock:
+        return {
+            endpoint: metrics["requests"] for endpoint, metrics in _endpoints.items()
+        }
+
+
+def set_gauge(name, value):
+    """current value of a run wide measurement, e.g. the concurrency limit"""
+    with _lock:
+        _gauges[name] = value
+
+
+def gauges():
+    """copy of the gauges"""
+    with _lock:
+        return dict(_gauges)
+
+
+def latency_percentile(endpoint, percent, min_samples=1):
+    """percentile in ms of the endpoint's recent latencies
+
+    None until there are min_samples of them.
+    """
+    with _lock:
+        metrics = _endpoints.get(endpoint)
+        if metrics is None or len(metrics["recent"]) < max(1, min_samples):
+            return None
+        ordered = sorted(metrics["recent"])
+    index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[index]
+
+
+def api_metrics():
+    """summary per endpoint, latencies in ms and times in seconds"""
+    with _lock:
+        endpoints = list(_endpoints)
+    summary = {}
+    for endpoint in endpoints:
+        p50 = latency_percentile(endpoint, 50)
+        p95 = latency_percentile(endpoint, 95)
+        with _lock:
+            metrics = _endpoints[endpoint]
+            summary[endpoint] = {
+                "requests": metrics["requests"],
+                "retries": metrics["retries"],
+                "throttled": metrics["throttled"],
+                "errors": metrics["errors"],
+                "bytes": metrics["bytes"],
+                "mean_ms": round(metrics["latency"] / metrics["requests"], 1)
+                if metrics["requests"]
+                else None,
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "max_ms": round(metrics["max_latency"], 1),
+                "histogram": dict(
+                    zip((str(bound) for bound in LATENCY_BUCKETS), metrics["histogram"])
+                ),
+                "statuses": dict(metrics["statuses"]),
+                "backoff": round(metrics["backoff"], 3),
+                "waited": round(metrics["waited"], 3),
+                "processing": round(metrics["processing"], 3),
+                "hedged": metrics["hedged"],
+                "hedge_wins": metrics["hedge_wins"],
+                "breaker_opened": metrics["breaker_opened"],
+                "breaker_skipped": metrics["breaker_skipped"],
+            }
+    return summary
+
+
+def log_api_metrics(logger):
+    """log where each endpoint spent its time this run"""
+    for endpoint, metrics in api_metrics().items():
+        logger.info(
+            "API %s: %s request(s), %s retries, %s 429(s), %s error(s), "
+            "p50 %s ms, p95 %s ms, max %s ms, %s MB, back-off %ss, "
+            "limiter wait %ss, processing %ss, %s hedge(s) (%s won), "
+            "breaker opened %s time(s), %s request(s) skipped",
+            endpoint,
+            metrics["requests"],
+            metrics["retries"],
+            metrics["throttled"],
+            metrics["errors"],
+            metrics["p50_ms"],
+            metrics["p95_ms"],
+            metrics["max_ms"],
+            round(metrics["bytes"] / 1024 / 1024, 2),
+            metrics["backoff"],
+            metrics["waited"],
+            metrics["processing"],
+            metrics["hedged"],
+            metrics["hedge_wins"],
+            metrics["breaker_opened"],
+            metrics["breaker_skipped"],
+            extra={"tags": {"service": endpoint, "metric": "api"}},
+        )
+    for name, value in gauges().items():
+        logger.info(
+            "Gauge %s: %s",
+            name,
+            value,
+            extra={"tags": {"service": "api_metrics", "metric": name}},
+        )
+
+
+def last_run_requests(run_mode):
+    """{endpoint: requests} of the latest saved run_mode run, empty if none"""
+    cursor, connection = connect_to_db(env_library.config)
+    create_api_metrics_table_if_not_exists(cursor)
+    cursor.execute(
+        """
+        SELECT endpoint, requests FROM api_metrics
+        WHERE run_mode = %s
+            AND run_at = (SELECT MAX(run_at) FROM api_metrics WHERE run_mode = %s)
+        """,
+        (run_mode, run_mode),
+    )
+    requests = dict(cursor.fetchall())
+    connection.close()
+    return requests
+
+
+def save_api_metrics(logger, run_mode):
+    """store this run's per endpoint metrics in the api_metrics table"""
+    summary = api_metrics()
+    if not summary:
+        return
+    # one run_at for every row, last_run_requests() finds the run by it
+    run_at = datetime.now().replace(microsecond=0)
+    cursor, connection = connect_to_db(env_library.config)
+    create_api_metrics_table_if_not_exists(cursor)
+    for endpoint, metrics in summary.items():
+        cursor.execute(
+            """
+            INSERT INTO api_metrics (
+                run_at, run_mode, endpoint, requests, retries, throttled,
+                errors, bytes, mean_ms, p50_ms, p95_ms, max_ms, backoff_s,
+                waited_s, processing_s, statuses, histogram, hedged,
+                hedge_wins, breaker_opened, breaker_skipped
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                %s, %s, %s, %s, %s, %s
+            )
+            """,
+            (
+                run_at,
+                run_mode,
+                endpoint,
+                metrics["requests"],
+                metrics["retries"],
+                metrics["throttled"],
+                metrics["errors"],
+                metrics["bytes"],
+                metrics["mean_ms"],
+                metrics["p50_ms"],
+                metrics["p95_ms"],
+                metrics["max_ms"],
+                metrics["backoff"],
+                metrics["waited"],
+                metrics["processing"],
+                json.dumps(metrics["statuses"]),
+                json.dumps(metrics["histogram"]),
+                metrics["hedged"],
+                metrics["hedge_wins"],
+                metrics["breaker_opened"],
+                metrics["breaker_skipped"],
+            ),
+        )
+    connection.commit()
+    connection.close()
+    logger.info(
+        "Saved api metrics for %s endpoint(s)",
+        len(summary),
+        extra={"tags": {"service": "api_metrics"}},
+    )
@@ -0,0 +1,61 @@
+"""fetch pages on a background thread so the next one downloads while the
+caller is still upserting the last one
+
+paginate() uses this when it runs with a single worker. The thread fetches
+the pages in order into a queue bounded by PIPELINE_DEPTH, so it never runs
+more than that many pages ahead of the writes, and it stops as soon as the
+caller does. The DB work stays on the caller's thread and cursor.
+"""
+import queue
+import threading
+
+# Put on the queue when the thread stops, whatever the reason
+_DONE = object()
+
+
+def _put(results, stop, item):
+    """queue item, waiting for room unless stop is set, False if it was"""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def start_prefetch(fetch, pages, depth):
+    """fetch(page) for every page in order on a thread, return (results, stop)
+
+    results holds (page, data) tuples, the thread ends after the first page
+    fetch() returns None for.
+    """
+    results = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for page in pages:
+                if stop.is_set():
+                    return
+                data = fetch(page)
+                if not _put(results, stop, (page, data)) or data is None:
+                    return
+        finally:
+            _put(results, stop, _DONE)
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    return results, stop
+
+
+def next_page(results):
+    """next (page, data) from the thread, data is None if it stopped early"""
+    item = results.get()
+    if item is _DONE:
+        return None, None
+    return item
+
+
+def stop_prefetch(stop):
+    """tell the thread to stop, it finishes the request it's on"""
+    stop.set()
@@ -0,0 +1,141 @@
+"""token bucket rate limiter shared by every api request"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+from library import env_library
+from library.db_general import rate_limit
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+def _get_bucket(name):
+    """bucket state for name, created full on first use"""
+    bucket = _buckets.get(name)
+    if bucket is None:
+        bucket = {
+            "tokens": float(env_library.api_rate_burst),
+            "updated": time.monotonic(),
+            "blocked_until": 0.0,
+            "requests": 0,
+            "waited": 0.0,
+            "throttled": 0,
+            "penalty": 0.0,
+        }
+        _buckets[name] = bucket
+    return bucket
+
+
+def _refill(bucket, now):
+    """add the tokens earned since the last update, returns the refill start"""
+    # no refill while a 429 block is in place
+    start = max(now, bucket["updated"])
+    bucket["tokens"] = min(
+        float(env_library.api_rate_burst),
+        bucket["tokens"] + (start - bucket["updated"]) / rate_limit(),
+    )
+    bucket["updated"] = start
+    return start
+
+
+def acquire(name="default"):
+    """take a token from the bucket, sleeping until it's due
+
+    Tokens refill at 1 / rate_limit() per second up to API_RATE_BURST.
+    A caller that finds the bucket empty reserves the next token and sleeps
+    until it refills, so request latency is never added on top of the budget.
+    Returns the seconds spent waiting.
+    """
+    with _lock:
+        bucket = _get_bucket(name)
+        now = time.monotonic()
+        start = _refill(bucket, now)
+        bucket["tokens"] -= 1
+        wait = (start - now) + max(0.0, -bucket["tokens"]) * rate_limit()
+        bucket["requests"] += 1
+    time.sleep(wait)
+
+    # a 429 may have blocked the bucket while we slept
+    while True:
+        with _lock:
+            blocked = bucket["blocked_until"] - time.monotonic()
+        if blocked <= 0:
+            break
+        time.sleep(blocked)
+        wait += blocked
+
+    with _lock:
+        bucket["waited"] += wait
+    return wait
+
+
+def penalize(name, seconds):
+    """hold every request on the bucket for seconds after a 429"""
+    with _lock:
+        bucket = _get_bucket(name)
+        now = time.monotonic()
+        _refill(bucket, now)
+        until = now + seconds
+        bucket["throttled"] += 1
+        bucket["penalty"] += seconds
+        if until > bucket["blocked_until"]:
+            bucket["blocked_until"] = until
+        if until > bucket["updated"]:
+            bucket["updated"] = until
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+
+
+def retry_after(response, default):
+    """seconds to back off after a 429, from Retry-After or the rate headers"""
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                until = parsedate_to_datetime(value)
+                return max(0.0, (until - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+
+    value = response.headers.get("X-RateLimit-Reset")
+    if value:
+        try:
+            reset = float(value)
+        except ValueError:
+            return default
+        # either an epoch timestamp or seconds until the window resets
+        if reset > 1_000_000_000:
+            return max(0.0, reset - time.time())
+        return max(0.0, reset)
+
+    return default
+
+
+def limiter_stats():
+    """copy of the per bucket counters, waited / penalty are seconds"""
+    with _lock:
+        return {
+            name: {
+                "requests": bucket["requests"],
+                "waited": round(bucket["waited"], 3),
+                "throttled": bucket["throttled"],
+                "penalty": round(bucket["penalty"], 3),
+            }
+            for name, bucket in _buckets.items()
+        }
+
+
+def log_limiter_stats(logger):
+    """log the wait time each bucket spent on the budget and on 429s"""
+    for name, stats in limiter_stats().items():
+        logger.info(
+            "Rate limiter %s: %s requests, waited %ss, %s 429(s), %ss back-off",
+            name,
+            stats["requests"],
+            stats["waited"],
+            stats["throttled"],
+            stats["penalty"],
+            extra={"tags": {"service": "rate_limit"}},
+        )
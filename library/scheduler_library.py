@@ -0,0 +1,126 @@
+"""run the sync modules with one lane per api key, by priority
+
+Endpoints on different keys draw on different rate budgets, so each key
+gets a thread that runs its modules while the other keys' lanes run
+alongside. Within a lane jobs run in priority order (CRITICAL first). With
+a budget, a lane skips non critical jobs its remaining requests can't cover
+or that would start after the cycle's deadline, and reports them as
+deferred. API_PARALLEL_KEYS=0 runs everything in one lane.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from library import env_library
+from library.api_requests import key_bucket
+from library.db_general import rate_limit
+from library.metrics_library import request_counts, set_gauge
+
+# Job priorities, lower runs first, CRITICAL jobs are never deferred
+CRITICAL = 0
+HIGH = 1
+NORMAL = 2
+LOW = 3
+
+_lock = threading.Lock()
+
+
+def lane_budget(cycle_seconds):
+    """requests one key can make in cycle_seconds at the rate limit"""
+    return int(cycle_seconds / rate_limit())
+
+
+def _lane_requests(lane, counts):
+    """requests made so far by the endpoints in lane"""
+    return sum(
+        requests
+        for endpoint, requests in counts.items()
+        if not env_library.api_parallel_keys or key_bucket(endpoint) == lane
+    )
+
+
+def _run_lane(logger, lane, jobs, budget, deadline, estimates, deferred):
+    """run one key's jobs by priority, skipping what the budget can't cover"""
+    start = time.monotonic()
+    used_before = _lane_requests(lane, request_counts())
+    ran = 0
+    for endpoint, job, priority in sorted(jobs, key=lambda job: job[2]):
+        if priority != CRITICAL and budget is not None:
+            used = _lane_requests(lane, request_counts()) - used_before
+            needed = estimates.get(endpoint, 1)
+            late = deadline is not None and time.monotonic() > deadline
+            if budget - used < needed or late:
+                logger.warning(
+                    "Deferred %s (priority %s): needs ~%s request(s), "
+                    "%s of %s left%s",
+                    endpoint,
+                    priority,
+                    needed,
+                    max(0, budget - used),
+                    budget,
+                    ", past the cycle deadline" if late else "",
+                    extra={"tags": {"service": "scheduler", "deferred": endpoint}},
+                )
+                with _lock:
+                    deferred.append(endpoint)
+                continue
+        job()
+        ran += 1
+    logger.info(
+        "Key lane %s finished %s job(s) in %ss using %s request(s)",
+        lane,
+        ran,
+        round(time.monotonic() - start, 1),
+        _lane_requests(lane, request_counts()) - used_before,
+        extra={"tags": {"service": "scheduler"}},
+    )
+
+
+def lanes_for(jobs):
+    """{bucket: [(endpoint, job, priority)]} keeping the given order"""
+    if not env_library.api_parallel_keys:
+        return {"all": list(jobs)}
+    lanes = {}
+    for endpoint, job, priority in jobs:
+        lanes.setdefault(key_bucket(endpoint), []).append((endpoint, job, priority))
+    return lanes
+
+
+def run_jobs(logger, jobs, budget=None, cycle_seconds=None, estimates=None):
+    """run (endpoint, callable, priority) jobs, lanes per api key in parallel
+
+    budget is the requests each lane may make, estimates the requests each
+    endpoint is expected to need (1 if unknown), cycle_seconds stops lanes
+    starting non critical jobs once it has passed. Returns the endpoints
+    that were deferred. An exception in a job stops the rest of its lane
+    and is raised once every lane has finished.
+    """
+    lanes = lanes_for(jobs)
+    deadline = None
+    if cycle_seconds is not None:
+        deadline = time.monotonic() + cycle_seconds
+    deferred = []
+    with ThreadPoolExecutor(max_workers=len(lanes) or 1) as executor:
+        futures = [
+            executor.submit(
+                _run_lane,
+                logger,
+                lane,
+                lane_jobs,
+                budget,
+                deadline,
+                estimates or {},
+                deferred,
+            )
+            for lane, lane_jobs in lanes.items()
+        ]
+    for future in futures:
+        future.result()
+
+    set_gauge("deferred_jobs", len(deferred))
+    if deferred:
+        logger.warning(
+            "Deferred to the next cycle: %s",
+            ", ".join(deferred),
+            extra={"tags": {"service": "scheduler", "finished": "deferred"}},
+        )
+    return deferred
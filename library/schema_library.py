@@ -0,0 +1,430 @@
+"""entity schemas, the one place each table's columns are listed
+
+Every entity is a list of (column, SQL type, source) entries. The CREATE
+TABLE for the live table and its deleted_* copy, the batched upsert and
+the converter from API records to row tuples are all built from it.
+source says where a column's value comes from:
+
+    "field"                 record["field"]
+    ("date", "field")       record["field"] in MariaDB DATETIME form
+    ("unix", "field")       record["field"] as a unix timestamp, 0 if None
+    ("json", "field")       json.dumps(record["field"])
+    ("get", "field", d)     record.get("field", d)
+    ("json_get", "field", d)  json.dumps(record.get("field", d))
+    ("nested", "field", "key")  record["field"].get("key")
+    ("property", "key")     record["properties"].get("key")
+    ("devices", "field")    extract_devices(record["field"])
+    ("hash",)               compute_hash(record)
+    None                    not written by the sync, DDL only
+
+The converter is generated source, one tuple expression per record with
+the lookups inlined, compiled once per entity.
+"""
+from functools import lru_cache
+import json
+from library.db_general import extract_devices
+from library.db_hash import compute_hash
+from library.fix_date_time import format_date_fordb, rs_to_unix_timestamp
+
+_EXPRESSIONS = {
+    "date": "db_date(record[{0!r}])",
+    "unix": "unix_timestamp(record[{0!r}])",
+    "json": "dumps(record[{0!r}])",
+    "get": "record.get({0!r}, {1!r})",
+    "json_get": "dumps(record.get({0!r}, {1!r}))",
+    "nested": "record[{0!r}].get({1!r})",
+    "property": "record['properties'].get({0!r})",
+    "devices": "extract_devices(record[{0!r}])",
+    "hash": "compute_hash(record)",
+}
+
+
+def _db_date(value):
+    """format_date_fordb() without the parse for RS's usual
+    2024-01-31T10:15:00.000-05:00 and 2024-01-31 forms, the wall clock time
+    is kept as is"""
+    if value is not None:
+        if len(value) >= 19 and value[10] == "T":
+            return value[:10] + " " + value[11:19]
+        if len(value) == 10 and value[4] == "-" and value[7] == "-":
+            return value + " 00:00:00"
+    return format_date_fordb(value)
+
+
+_HELPERS = {
+    "db_date": _db_date,
+    "unix_timestamp": rs_to_unix_timestamp,
+    "dumps": json.dumps,
+    "extract_devices": extract_devices,
+    "compute_hash": compute_hash,
+}
+
+
+def _expression(source):
+    """python expression for one column's value out of record"""
+    if isinstance(source, str):
+        return f"record[{source!r}]"
+    kind, *args = source
+    return _EXPRESSIONS[kind].format(*args)
+
+
+def compile_converter(schema, helpers=None):
+    """generate and compile the records -> row tuples converter for schema,
+    helpers replaces the functions the generated code calls by name"""
+    expressions = [
+        _expression(source)
+        for _column, _sql_type, source in schema["columns"]
+        if source is not None
+    ]
+    source = (
+        "def convert(records):\n"
+        f"    return [({', '.join(expressions)},) for record in records]\n"
+    )
+    namespace = dict(_HELPERS, **(helpers or {}))
+    exec(  # pylint: disable=exec-used
+        compile(source, f"<schema {schema['table']}>", "exec"), namespace
+    )
+    return namespace["convert"]
+
+
+def _schema(
+    table,
+    columns,
+    version="updated_at",
+    volume=None,
+    newer=None,
+    changed=None,
+    constraints=(),
+):
+    """schema dict for table, see the module docstring for columns
+
+    names are the written columns in row tuple order, names[0] the primary
+    key. version, newer and changed go to db_insert.upsert_rows(), volume
+    is the volume table's name for the entity.
+    """
+    schema = {
+        "table": table,
+        "columns": columns,
+        "names": tuple(column for column, _type, source in columns if source),
+        "version": version,
+        "volume": volume or table,
+        "newer": newer,
+        "changed": changed,
+        "constraints": constraints,
+    }
+    schema["convert"] = compile_converter(schema)
+    return schema
+
+
+CONTACTS = _schema(
+    "contacts",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("name", "VARCHAR(255)", "name"),
+        ("address1", "VARCHAR(255)", "address1"),
+        ("address2", "VARCHAR(255)", "address2"),
+        ("city", "VARCHAR(255)", "city"),
+        ("state", "VARCHAR(255)", "state"),
+        ("zip", "VARCHAR(255)", "zip"),
+        ("email", "VARCHAR(255)", "email"),
+        ("phone", "VARCHAR(255)", "phone"),
+        ("mobile", "VARCHAR(255)", "mobile"),
+        ("latitude", "FLOAT", "latitude"),
+        ("longitude", "FLOAT", "longitude"),
+        ("customer_id", "INT", "customer_id"),
+        ("account_id", "INT", "account_id"),
+        ("notes", "TEXT", "notes"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("vendor_id", "INT", "vendor_id"),
+        ("title", "VARCHAR(255)", ("property", "title")),
+        ("opt_out", "BOOLEAN", "opt_out"),
+        ("extension", "VARCHAR(50)", "extension"),
+        ("processed_phone", "VARCHAR(255)", "processed_phone"),
+        ("processed_mobile", "VARCHAR(255)", "processed_mobile"),
+        ("ticket_matching_emails", "VARCHAR(255)", "ticket_matching_emails"),
+    ],
+)
+
+CUSTOMERS = _schema(
+    "customers",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("firstname", "VARCHAR(255)", "firstname"),
+        ("lastname", "VARCHAR(255)", "lastname"),
+        ("fullname", "VARCHAR(255)", "fullname"),
+        ("business_name", "VARCHAR(255)", "business_name"),
+        ("email", "VARCHAR(255)", "email"),
+        ("phone", "VARCHAR(255)", "phone"),
+        ("mobile", "VARCHAR(255)", "mobile"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("pdf_url", "TEXT", None),
+        ("address", "VARCHAR(255)", "address"),
+        ("address_2", "VARCHAR(255)", "address_2"),
+        ("city", "VARCHAR(255)", "city"),
+        ("state", "VARCHAR(255)", "state"),
+        ("zip", "VARCHAR(255)", "zip"),
+        ("latitude", "FLOAT", "latitude"),
+        ("longitude", "FLOAT", "longitude"),
+        ("notes", "TEXT", "notes"),
+        ("get_sms", "BOOLEAN", "get_sms"),
+        ("opt_out", "BOOLEAN", "opt_out"),
+        ("disabled", "BOOLEAN", "disabled"),
+        ("no_email", "BOOLEAN", "no_email"),
+        ("location_name", "VARCHAR(255)", None),
+        ("location_id", "INT", None),
+        ("properties", "JSON", ("json", "properties")),
+        ("online_profile_url", "TEXT", None),
+        ("tax_rate_id", "INT", None),
+        ("notification_email", "VARCHAR(255)", None),
+        ("invoice_cc_emails", "VARCHAR(255)", None),
+        ("invoice_term_id", "INT", None),
+        ("referred_by", "VARCHAR(255)", "referred_by"),
+        ("ref_customer_id", "INT", None),
+        ("business_and_full_name", "VARCHAR(255)", None),
+        ("business_then_name", "VARCHAR(255)", None),
+        ("contacts", "JSON", ("json", "contacts")),
+    ],
+)
+
+INVOICES = _schema(
+    "invoices",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("customer_id", "INT", "customer_id"),
+        ("customer_business_then_name", "VARCHAR(255)", "customer_business_then_name"),
+        ("number", "VARCHAR(255)", "number"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("date", "DATE", ("date", "date")),
+        ("due_date", "DATE", ("date", "due_date")),
+        ("subtotal", "DECIMAL(10, 2)", "subtotal"),
+        ("total", "DECIMAL(10, 2)", "total"),
+        ("tax", "DECIMAL(10, 2)", "tax"),
+        ("verified_paid", "BOOLEAN", "verified_paid"),
+        ("tech_marked_paid", "BOOLEAN", "tech_marked_paid"),
+        ("ticket_id", "INT", "ticket_id"),
+        ("user_id", "INT", "user_id"),
+        ("pdf_url", "TEXT", "pdf_url"),
+        ("is_paid", "BOOLEAN", "is_paid"),
+        ("location_id", "INT", "location_id"),
+        ("po_number", "VARCHAR(255)", "po_number"),
+        ("contact_id", "INT", "contact_id"),
+        ("note", "TEXT", "note"),
+        ("hardwarecost", "DECIMAL(10, 2)", "hardwarecost"),
+    ],
+)
+
+INVOICE_ITEMS = _schema(
+    "invoice_items",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("invoice_id", "INT", "invoice_id"),
+        ("item", "VARCHAR(1024)", "item"),
+        ("name", "VARCHAR(4096)", "name"),
+        ("cost", "DECIMAL(10, 2)", "cost"),
+        ("price", "DECIMAL(10, 2)", "price"),
+        ("quantity", "DECIMAL(10, 2)", "quantity"),
+        ("product_id", "INT", "product_id"),
+        ("taxable", "BOOLEAN", "taxable"),
+        ("discount_percent", "DECIMAL(5, 2)", "discount_percent"),
+        ("position", "INT", "position"),
+        ("invoice_bundle_id", "INT", "invoice_bundle_id"),
+        ("discount_dollars", "DECIMAL(10, 2)", "discount_dollars"),
+        ("product_category", "VARCHAR(255)", "product_category"),
+    ],
+    volume="line_items",
+)
+
+ESTIMATES = _schema(
+    "estimates",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("customer_id", "INT", "customer_id"),
+        (
+            "customer_business_then_name",
+            "VARCHAR(4096)",
+            "customer_business_then_name",
+        ),
+        ("number", "VARCHAR(255)", "number"),
+        ("status", "VARCHAR(255)", "status"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("date", "DATETIME", ("date", "date")),
+        ("subtotal", "DECIMAL(10, 2)", "subtotal"),
+        ("total", "DECIMAL(10, 2)", "total"),
+        ("tax", "DECIMAL(10, 2)", "tax"),
+        ("ticket_id", "INT", "ticket_id"),
+        ("pdf_url", "VARCHAR(2048)", "pdf_url"),
+        ("location_id", "INT", "location_id"),
+        ("invoice_id", "INT", "invoice_id"),
+        ("employee", "VARCHAR(255)", "employee"),
+    ],
+)
+
+TICKETS = _schema(
+    "tickets",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("number", "INT", "number"),
+        ("subject", "VARCHAR(255)", "subject"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("created_at_u", "INT", ("unix", "created_at")),
+        ("customer_id", "INT", "customer_id"),
+        ("customer_business_then_name", "VARCHAR(255)", "customer_business_then_name"),
+        ("due_date", "INT", ("unix", "due_date")),
+        ("resolved_at", "DATETIME", ("date", "resolved_at")),
+        ("resolved_at_u", "INT", ("unix", "resolved_at")),
+        ("start_at", "INT", ("unix", "start_at")),
+        ("end_at", "INT", ("unix", "end_at")),
+        ("location_id", "INT", "location_id"),
+        ("problem_type", "VARCHAR(255)", "problem_type"),
+        ("status", "VARCHAR(255)", "status"),
+        ("ticket_type_id", "INT", "ticket_type_id"),
+        ("properties", "TEXT", ("json_get", "properties", {})),
+        ("user_id", "INT", "user_id"),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("updated_at_u", "INT", ("unix", "updated_at")),
+        ("pdf_url", "TEXT", "pdf_url"),
+        ("priority", "VARCHAR(255)", "priority"),
+        ("comments", "TEXT", ("json_get", "comments", {})),
+        ("num_devices", "INT", ("devices", "subject")),
+    ],
+    version="updated_at_u",
+)
+
+COMMENTS = _schema(
+    "comments",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("ticket_id", "INT", "ticket_id"),
+        ("subject", "VARCHAR(255)", "subject"),
+        ("body", "TEXT", "body"),
+        ("tech", "VARCHAR(255)", "tech"),
+        ("hidden", "BOOLEAN", "hidden"),
+        ("user_id", "INT", "user_id"),
+    ],
+    constraints=("FOREIGN KEY (ticket_id) REFERENCES tickets(id)",),
+)
+
+PAYMENTS = _schema(
+    "payments",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("created_at", "DATETIME", ("date", "created_at")),
+        ("updated_at", "DATETIME", ("date", "updated_at")),
+        ("success", "BOOLEAN", "success"),
+        ("payment_amount", "FLOAT", "payment_amount"),
+        ("invoice_ids", "JSON", ("json", "invoice_ids")),
+        ("ref_num", "VARCHAR(255)", "ref_num"),
+        ("applied_at", "DATE", ("date", "applied_at")),
+        ("payment_method", "VARCHAR(255)", "payment_method"),
+        ("transaction_response", "TEXT", "transaction_response"),
+        ("signature_date", "DATE", ("date", "signature_date")),
+        ("customer", "JSON", ("json", "customer")),
+        ("customer_id", "INT", ("nested", "customer", "id")),
+        (
+            "business_and_full_name",
+            "VARCHAR(510)",
+            ("nested", "customer", "business_and_full_name"),
+        ),
+    ],
+)
+
+# products have no updated_at, a different hash means the record changed
+PRODUCTS = _schema(
+    "products",
+    [
+        ("id", "INT PRIMARY KEY", "id"),
+        ("price_cost", "FLOAT", "price_cost"),
+        ("price_retail", "FLOAT", "price_retail"),
+        ("condition", "VARCHAR(255)", ("get", "condition", "")),
+        ("description", "TEXT", "description"),
+        ("maintain_stock", "BOOLEAN", "maintain_stock"),
+        ("name", "VARCHAR(255)", "name"),
+        ("quantity", "INT", "quantity"),
+        ("warranty", "TEXT", ("get", "warranty", None)),
+        ("sort_order", "INT", ("get", "sort_order", None)),
+        ("reorder_at", "INT", ("get", "reorder_at", None)),
+        ("disabled", "BOOLEAN", "disabled"),
+        ("taxable", "BOOLEAN", "taxable"),
+        ("product_category", "VARCHAR(255)", "product_category"),
+        ("category_path", "VARCHAR(255)", "category_path"),
+        ("upc_code", "VARCHAR(255)", ("get", "upc_code", "")),
+        ("discount_percent", "FLOAT", ("get", "discount_percent", None)),
+        ("warranty_template_id", "INT", ("get", "warranty_template_id", None)),
+        ("qb_item_id", "INT", ("get", "qb_item_id", None)),
+        ("desired_stock_level", "INT", ("get", "desired_stock_level", None)),
+        ("price_wholesale", "FLOAT", "price_wholesale"),
+        ("notes", "TEXT", ("get", "notes", "")),
+        ("tax_rate_id", "INT", ("get", "tax_rate_id", None)),
+        ("physical_location", "TEXT", ("get", "physical_location", "")),
+        ("serialized", "BOOLEAN", "serialized"),
+        ("vendor_ids", "JSON", ("json", "vendor_ids")),
+        ("long_description", "TEXT", ("get", "long_description", "")),
+        ("location_quantities", "JSON", ("json", "location_quantities")),
+        ("photos", "JSON", ("json", "photos")),
+        ("hash", "VARCHAR(32)", ("hash",)),
+    ],
+    version="hash",
+    newer="NOT `hash` <=> VALUES(`hash`)",
+    changed=lambda stored, incoming: stored != incoming,
+)
+
+SCHEMAS = {
+    schema["table"]: schema
+    for schema in (
+        CONTACTS,
+        CUSTOMERS,
+        INVOICES,
+        INVOICE_ITEMS,
+        ESTIMATES,
+        TICKETS,
+        COMMENTS,
+        PAYMENTS,
+        PRODUCTS,
+    )
+}
+
+
+def create_table_sql(schema, table=None, constraints=True):
+    """CREATE TABLE IF NOT EXISTS for schema, under table if given"""
+    lines = [
+        f"`{column}` {sql_type}" for column, sql_type, _source in schema["columns"]
+    ]
+    if constraints:
+        lines.extend(schema["constraints"])
+    body = ",\n    ".join(lines)
+    return (
+        f"CREATE TABLE IF NOT EXISTS `{table or schema['table']}` (\n    {body}\n)"
+    )
+
+
+def deleted_table_sql(schema):
+    """CREATE TABLE for schema's deleted_* copy, same columns, no foreign keys"""
+    return create_table_sql(schema, f"deleted_{schema['table']}", False)
+
+
+@lru_cache(maxsize=256)
+def upsert_sql(table, columns, version, newer, count):
+    """INSERT ... ON DUPLICATE KEY UPDATE for count rows, built once per shape
+
+    Every column but the key is only overwritten where newer holds, version
+    is assigned last so the other columns' checks still see the stored one.
+    """
+    names = ", ".join(f"`{column}`" for column in columns)
+    marks = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    assignments = ", ".join(
+        f"`{column}` = IF({newer}, VALUES(`{column}`), `{column}`)"
+        for column in [column for column in columns[1:] if column != version]
+        + [version]
+    )
+    return (
+        f"INSERT INTO `{table}` ({names}) VALUES {', '.join([marks] * count)} "
+        f"ON DUPLICATE KEY UPDATE {assignments}"
+    )
@@ -0,0 +1,294 @@
+"""shadow table rebuilds for --full runs, verified and swapped in atomically
+
+With DB_SHADOW_SWAP=1 the full runs of contacts, products and invoice_items
+don't merge into the live table page by page. Every page goes to
+shadow_<table>, made LIKE the live table and checkpointed the same way, so
+a stopped run resumes into the shadow it left. Once every page is in,
+finish_shadow() checks the shadow's row count and id checksums against the
+ids the API sent, copies in the live rows a --frequent run added or
+changed since the rebuild started, archives the live rows that are gone
+into deleted_<table> and swaps the shadow in with one RENAME TABLE. Readers
+see the old table or the new one, never a half merged one. A run that stopped
+early or failed the check merges the shadow into the live table instead.
+
+--frequent writes to the live table while a swap is underway would land in
+the table being retired, so the swap, from the catch-up copy to the rename,
+holds a named lock that --frequent runs of the same table hold for as long
+as they write, see hold_live_table(). A swap that can't get it merges.
+"""
+from functools import reduce
+import time
+import zlib
+from library import env_library
+from library.bulk_library import merge_rows
+from library.db_create import create_shadow_rebuilds_table_if_not_exists
+from library.db_insert import upsert_rows
+from library.schema_library import SCHEMAS, deleted_table_sql
+from library.volume_library import insert_volume
+
+
+# Seconds a swap waits for a --frequent run to finish with the live table,
+# and a --frequent run waits for a swap, before giving up
+SWAP_LOCK_TIMEOUT = 120
+
+
+def shadow_enabled():
+    """True if DB_SHADOW_SWAP is set"""
+    return env_library.db_shadow_swap
+
+
+def _lock_live_table(cursor, table):
+    """take table's swap lock for the connection, True if it got it in time"""
+    cursor.execute(
+        "SELECT GET_LOCK(%s, %s)", (f"shadow_swap.{table}", SWAP_LOCK_TIMEOUT)
+    )
+    return cursor.fetchone()[0] == 1
+
+
+def _unlock_live_table(cursor, table):
+    """release table's swap lock"""
+    cursor.execute("SELECT RELEASE_LOCK(%s)", (f"shadow_swap.{table}",))
+    cursor.fetchone()
+
+
+def hold_live_table(logger, cursor, table):
+    """keep shadow swaps of table off while a --frequent run writes it,
+    False if one held it too long, the run should skip table this cycle
+
+    Nothing to hold without DB_SHADOW_SWAP. The lock is the connection's
+    until it closes.
+    """
+    if not shadow_enabled() or _lock_live_table(cursor, table):
+        return True
+    logger.warning(
+        "A shadow swap of %s is still running, skipping it this cycle",
+        table,
+        extra={"tags": {"service": table}},
+    )
+    return False
+
+
+def start_shadow(cursor, table, columns, version, fresh, ordered=True):
+    """shadow state for table, fresh empties rows a previous run left
+
+    version is the column telling changed rows apart, ordered if a larger
+    value is a newer row (updated_at), not for a hash. A fresh rebuild
+    stores the live table's largest id and version in shadow_rebuilds, rows
+    past those when it's swapped in were written since it started.
+    """
+    shadow = f"shadow_{table}"
+    key = columns[0]
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS `{shadow}` LIKE `{table}`")
+    create_shadow_rebuilds_table_if_not_exists(cursor)
+    if fresh:
+        cursor.execute(f"TRUNCATE TABLE `{shadow}`")
+        newest = f"MAX(`{version}`)" if ordered else "NULL"
+        cursor.execute(
+            "REPLACE INTO shadow_rebuilds "
+            "(table_name, max_id, max_updated_at, started_at) "
+            f"SELECT %s, MAX(`{key}`), {newest}, NOW() FROM `{table}`",
+            (table,),
+        )
+    cursor.execute(
+        "SELECT max_id, max_updated_at FROM shadow_rebuilds WHERE table_name = %s",
+        (table,),
+    )
+    # a shadow left from before the marks were kept keeps every live row
+    marks = cursor.fetchone() or (None, None)
+    return {
+        "table": table,
+        "shadow": shadow,
+        "columns": columns,
+        "version": version,
+        "ordered": ordered,
+        "max_id": marks[0],
+        "max_updated_at": marks[1],
+        "rows": 0,
+        "seconds": 0.0,
+    }
+
+
+def write_shadow(cursor, shadow, rows):
+    """upsert row tuples, in the shadow's column order, into the shadow table"""
+    version = shadow["version"]
+    start = time.perf_counter()
+    # a page that shifted during the run replaces its earlier copy
+    upsert_rows(
+        cursor,
+        shadow["shadow"],
+        shadow["columns"],
+        rows,
+        version,
+        newer=f"NOT `{version}` <=> VALUES(`{version}`)",
+        changed=lambda stored, incoming: stored != incoming,
+    )
+    shadow["seconds"] += time.perf_counter() - start
+    shadow["rows"] += len(rows)
+
+
+def _id_checksum(ids):
+    """BIT_XOR(CRC32(id)) of ids, computed the way the server does"""
+    return reduce(
+        lambda checksum, row_id: checksum ^ zlib.crc32(str(row_id).encode()),
+        ids,
+        0,
+    )
+
+
+def _verified(logger, cursor, shadow, ids):
+    """True if the shadow holds exactly ids, by count, sum and CRC32 of ids"""
+    key = shadow["columns"][0]
+    cursor.execute(
+        f"SELECT COUNT(*), SUM(`{key}`), BIT_XOR(CRC32(`{key}`)) "
+        f"FROM `{shadow['shadow']}`"
+    )
+    count, id_sum, checksum = cursor.fetchone()
+    found = (count, int(id_sum or 0), int(checksum or 0))
+    expected = (len(ids), sum(ids), _id_checksum(ids))
+    if found == expected:
+        return True
+    logger.error(
+        "Shadow %s failed verification, count/sum/checksum %s, API %s",
+        shadow["shadow"],
+        found,
+        expected,
+        extra={"tags": {"service": shadow["table"]}},
+    )
+    return False
+
+
+def _swap(logger, cursor, shadow, volume_name):
+    """archive the gone rows and swap the shadow in, return (added, updated,
+    deleted), call with the table's swap lock held"""
+    table = shadow["table"]
+    name = shadow["shadow"]
+    columns = shadow["columns"]
+    key = columns[0]
+    version = shadow["version"]
+
+    # rows a --frequent run wrote to the live table while we paged, missing
+    # from the API's listing by the time it got to their page, are kept
+    recent = []
+    params = []
+    if shadow["max_id"] is not None:
+        recent.append(f"t.`{key}` > %s")
+        params.append(shadow["max_id"])
+    if shadow["ordered"] and shadow["max_updated_at"] is not None:
+        recent.append(f"t.`{version}` >= %s")
+        params.append(shadow["max_updated_at"])
+    # without marks (an empty live table) every missing row is recent
+    missing = f"s.`{key}` IS NULL"
+    if recent:
+        missing += f" AND ({' OR '.join(recent)})"
+    cursor.execute(
+        f"INSERT INTO `{name}` SELECT t.* FROM `{table}` t "
+        f"LEFT JOIN `{name}` s ON s.`{key}` = t.`{key}` WHERE {missing}",
+        params,
+    )
+    if cursor.rowcount > 0:
+        logger.info(
+            "Kept %s %s row(s) written since the rebuild started",
+            cursor.rowcount,
+            table,
+            extra={"tags": {"service": table}},
+        )
+
+    if shadow["ordered"]:
+        # rows a --frequent run updated in the live table while we paged
+        assignments = ", ".join(
+            f"s.`{column}` = t.`{column}`" for column in columns[1:]
+        )
+        cursor.execute(
+            f"UPDATE `{name}` s JOIN `{table}` t ON t.`{key}` = s.`{key}` "
+            f"SET {assignments} WHERE t.`{version}` > s.`{version}`"
+        )
+
+    cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+    live_rows = cursor.fetchone()[0]
+    cursor.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(t.`{key}` IS NULL), 0), "
+        f"COALESCE(SUM(NOT t.`{version}` <=> s.`{version}` "
+        f"AND t.`{key}` IS NOT NULL), 0) "
+        f"FROM `{name}` s LEFT JOIN `{table}` t ON t.`{key}` = s.`{key}`"
+    )
+    shadow_rows, added, updated = [int(value) for value in cursor.fetchone()]
+    deleted = live_rows - (shadow_rows - added)
+
+    if deleted:
+        cursor.execute(deleted_table_sql(SCHEMAS[table]))
+        cursor.execute(
+            f"REPLACE INTO `deleted_{table}` SELECT t.* FROM `{table}` t "
+            f"LEFT JOIN `{name}` s ON s.`{key}` = t.`{key}` WHERE s.`{key}` IS NULL"
+        )
+    if added > 0 or updated > 0 or deleted > 0:
+        insert_volume(
+            cursor,
+            logger,
+            new=added,
+            updated=updated,
+            deleted=deleted,
+            table_name=volume_name,
+        )
+
+    # RENAME TABLE commits the archive first, then swaps both names at once
+    retired = f"retired_{table}"
+    cursor.execute(f"DROP TABLE IF EXISTS `{retired}`")
+    cursor.execute(f"RENAME TABLE `{table}` TO `{retired}`, `{name}` TO `{table}`")
+    cursor.execute(f"DROP TABLE `{retired}`")
+    return added, updated, deleted
+
+
+def finish_shadow(logger, cursor, shadow, volume_name, ids=None, clear=True):
+    """swap the shadow in if it holds exactly ids, return True if it did
+
+    ids is None when the API data can't be trusted for deletes, then and
+    when the check fails the shadow is merged into the live table instead
+    and the caller looks for deletes the usual way. clear empties the
+    shadow after a merge, leave it for a run that stopped early to resume.
+    """
+    table = shadow["table"]
+    start = time.perf_counter()
+    swapped = ids is not None and _verified(logger, cursor, shadow, ids)
+    if swapped and not _lock_live_table(cursor, table):
+        logger.warning(
+            "A --frequent run is still writing %s, merging the shadow instead",
+            table,
+            extra={"tags": {"service": table}},
+        )
+        swapped = False
+    if swapped:
+        try:
+            added, updated, deleted = _swap(logger, cursor, shadow, volume_name)
+        finally:
+            _unlock_live_table(cursor, table)
+    else:
+        version = shadow["version"]
+        added, updated = merge_rows(
+            cursor,
+            table,
+            shadow["shadow"],
+            shadow["columns"],
+            version,
+            None if shadow["ordered"] else f"NOT t.`{version}` <=> s.`{version}`",
+        )
+        deleted = 0
+        if added > 0 or updated > 0:
+            insert_volume(
+                cursor, logger, new=added, updated=updated, table_name=volume_name
+            )
+        if clear:
+            cursor.execute(f"TRUNCATE TABLE `{shadow['shadow']}`")
+
+    seconds = shadow["seconds"] + time.perf_counter() - start
+    logger.info(
+        "%s %s: %s rows, added %s, updated %s, archived %s, %s rows/s",
+        "Swapped in" if swapped else "Merged",
+        shadow["shadow"],
+        shadow["rows"],
+        added,
+        updated,
+        deleted,
+        round(shadow["rows"] / seconds) if seconds else shadow["rows"],
+        extra={"tags": {"service": table}},
+    )
+    return swapped
@@ -0,0 +1,53 @@
+"""high-water marks so --frequent runs only page through changed records"""
+from datetime import datetime, timezone
+from library import env_library
+from library.db_create import create_sync_watermarks_table_if_not_exists
+from library.fix_date_time import rs_to_unix_timestamp
+
+
+def load_watermark(cursor, endpoint):
+    """newest updated_at (unix seconds) committed for endpoint, None if unset"""
+    create_sync_watermarks_table_if_not_exists(cursor)
+    cursor.execute(
+        "SELECT updated_at_u FROM sync_watermarks WHERE endpoint = %s", (endpoint,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0]
+
+
+def save_watermark(cursor, endpoint, timestamp):
+    """move endpoint's watermark forward, never back, call before the commit"""
+    create_sync_watermarks_table_if_not_exists(cursor)
+    cursor.execute(
+        """
+        INSERT INTO sync_watermarks (endpoint, updated_at_u, synced_at)
+        VALUES (%s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+            updated_at_u = GREATEST(updated_at_u, VALUES(updated_at_u)),
+            synced_at = NOW()
+        """,
+        (endpoint, timestamp),
+    )
+
+
+def newest_updated_at(items, newest=0, field="updated_at"):
+    """largest field in items as unix seconds, or newest if that's larger"""
+    for item in items:
+        newest = max(newest, rs_to_unix_timestamp(item.get(field)))
+    return newest
+
+
+def window_start(timestamp):
+    """unix seconds an incremental run starts from, the watermark less the overlap
+
+    The overlap picks up records committed late with an older updated_at,
+    the inserts skip the ones that haven't changed.
+    """
+    return timestamp - env_library.watermark_overlap_seconds
+
+
+def since_updated_at(timestamp):
+    """since_updated_at value for a watermark, backed off by the overlap"""
+    return datetime.fromtimestamp(window_start(timestamp), timezone.utc).isoformat()
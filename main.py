@@ -1,6 +1,25 @@
 """ main script for the frequent modules """
 import argparse
+from functools import partial
+from library import env_library
+from library.api_requests import close_session
+from library.cache_library import log_cache_stats
+from library.concurrency_library import log_concurrency_stats
 from library.loki_library import start_loki
+from library.metrics_library import (
+    last_run_requests,
+    log_api_metrics,
+    save_api_metrics,
+)
+from library.rate_limit_library import log_limiter_stats
+from library.scheduler_library import (
+    CRITICAL,
+    HIGH,
+    LOW,
+    NORMAL,
+    lane_budget,
+    run_jobs,
+)
 from modules.backup import backup_database, upload_to_drive
 from modules.users import users
 from modules.customers import customers
@@ -13,6 +32,7 @@ from modules.payments import payments
 from modules.products import products
 from modules.tickets import tickets
 from modules.volume import volume
+from modules.webhooks import webhooks
 
 
 def main():
@@ -24,7 +44,12 @@ def main():
     parser.add_argument(
         "--frequent",
         action="store_true",
-        help="Set lookback days low, run every 5 mins",
+        help="Only fetch what changed since the last run, run every 5 mins",
+    )
+    parser.add_argument(
+        "--webhooks",
+        action="store_true",
+        help="Receive RS webhooks and upsert them as they come, runs until stopped",
     )
 
     args = parser.parse_args()
@@ -38,16 +63,53 @@ def main():
         )
 
         volume()
-        contacts(logger, False)
-        customers(logger, False)
-        estimates(logger, False, 30)
-        invoice_lines(logger, False)
-        invoices(logger, False, 7)  # has since_updated_at
-        payments(logger, False, 7)
-        tickets(logger, False, 14)  # has since_updated_at
-        products(logger, False)
-        users(logger)
+        workers = env_library.api_workers
+        # one lane per api key, tickets first since output depends on them,
+        # products and customers only get what's left of the cycle
+        run_jobs(
+            logger,
+            [
+                (
+                    "tickets",
+                    partial(tickets, logger, False, 14, workers=workers),
+                    CRITICAL,
+                ),
+                ("users", partial(users, logger), HIGH),
+                # has since_updated_at
+                ("invoices", partial(invoices, logger, False, 7), HIGH),
+                (
+                    "invoice_lines",
+                    partial(invoice_lines, logger, False, workers=workers),
+                    HIGH,
+                ),
+                (
+                    "payments",
+                    partial(payments, logger, False, 7, workers=workers),
+                    HIGH,
+                ),
+                (
+                    "estimates",
+                    partial(estimates, logger, False, 30, workers=workers),
+                    NORMAL,
+                ),
+                (
+                    "contacts",
+                    partial(contacts, logger, False, workers=workers),
+                    NORMAL,
+                ),
+                ("customers", partial(customers, logger, False), LOW),
+                ("products", partial(products, logger, False), LOW),
+            ],
+            budget=lane_budget(env_library.frequent_cycle_seconds),
+            cycle_seconds=env_library.frequent_cycle_seconds,
+            estimates=last_run_requests("frequent"),
+        )
         output(logger, 90)
+        log_limiter_stats(logger)
+        log_cache_stats(logger)
+        log_concurrency_stats(logger)
+        log_api_metrics(logger)
+        save_api_metrics(logger, "frequent")
         logger.info(
             "----------END EVERY 5 MINS----------------",
             extra={"tags": {"service": "main_frequent", "finished": "yes"}},
@@ -63,20 +125,50 @@ def main():
 
         backup_database(logger)
         upload_to_drive(logger)
-        contacts(logger, True)
-        customers(logger, True)
-        estimates(logger, True)
-        invoice_lines(logger, True)
-        invoices(logger, True)
-        payments(logger, True)
-        tickets(logger, True)
-        products(logger, True)
+        workers = env_library.api_workers
+        run_jobs(
+            logger,
+            [
+                (
+                    "contacts",
+                    partial(contacts, logger, True, workers=workers),
+                    NORMAL,
+                ),
+                ("customers", partial(customers, logger, True), NORMAL),
+                ("estimates", partial(estimates, logger, True), NORMAL),
+                (
+                    "invoice_lines",
+                    partial(invoice_lines, logger, True, workers=workers),
+                    NORMAL,
+                ),
+                ("invoices", partial(invoices, logger, True), NORMAL),
+                ("payments", partial(payments, logger, True), NORMAL),
+                (
+                    "tickets",
+                    partial(tickets, logger, True, workers=workers),
+                    NORMAL,
+                ),
+                ("products", partial(products, logger, True), NORMAL),
+            ],
+        )
+        log_limiter_stats(logger)
+        log_cache_stats(logger)
+        log_concurrency_stats(logger)
+        log_api_metrics(logger)
+        save_api_metrics(logger, "full")
 
         logger.info(
             "---------END FULL RUN---------------",
             extra={"tags": {"service": "main_full", "finished": "full"}},
         )
 
+    if args.webhooks:
+        logger = start_loki("__main_webhooks__")
+        volume()
+        webhooks(logger)
+
+    close_session()
+
 
 if __name__ == "__main__":
     main()
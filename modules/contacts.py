@@ -1,57 +1,95 @@
 """Getting RS Contacts"""
-import time
+from array import array
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_contact_table_if_not_exists
 from library.db_delete import move_deleted_contacts_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
-from library.db_insert import insert_contacts
-import library.env_library as env_library
-from library.api_requests import (
-    get_contacts,
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
+from library.db_insert import CONTACT_COLUMNS, contact_rows, insert_contacts
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.shadow_library import (
+    finish_shadow,
+    hold_live_table,
+    shadow_enabled,
+    start_shadow,
+    write_shadow,
+)
+from library.watermark_library import (
+    load_watermark,
+    newest_updated_at,
+    save_watermark,
+    since_updated_at,
 )
-def contacts(logger, full_run=False):
+import library.env_library as env_library
+from library.api_requests import paginate, record_ids
+def contacts(logger, full_run=False, workers=1):
     """main script for the contact module"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_contact_table_if_not_exists(cursor)
+    # a --full run's shadow swap would retire the table under our writes
+    if not full_run and not hold_live_table(logger, cursor, "contacts"):
+        connection.close()
+        log_peak_rss(logger, "contacts")
+        return
 
     # Start fetching contacts from page 1
-    current_page = 1
     total_pages = 0
     total_entries = 0
     db_rows = 0
-    all_data = []
+    api_page = 0
+    start_page = 1
+    newest = 0
+    params = None
+    api_ids = array("q")
+    shadow = None
+    if full_run:
+        start_page, api_ids = load_checkpoint(logger, cursor, "contacts")
+        if shadow_enabled():
+            shadow = start_shadow(
+                cursor, "contacts", CONTACT_COLUMNS, "updated_at", start_page == 1
+            )
+    else:
+        # only ask for what changed since the last run, once there is one
+        watermark = load_watermark(cursor, "contacts")
+        if watermark is not None:
+            params = {"since_updated_at": since_updated_at(watermark)}
 
-    # Get 1st Page, then check to make sure not null
-    data = get_contacts(logger, current_page)
-    if data is not None:
+    # Iterate through all the pages
+    for page, data in paginate(
+        logger,
+        "contacts",
+        params,
+        start_page=start_page,
+        workers=workers,
+        cache=not full_run,
+    ):
         total_pages = data["meta"]["total_pages"]
         total_entries = data["meta"]["total_entries"]
-    else:
-        logger.error(
-            "Error getting contact data",
+        if shadow is None:
+            insert_contacts(logger, cursor, data["contacts"])
+        else:
+            write_shadow(cursor, shadow, contact_rows(data["contacts"]))
+        page_ids = record_ids(data, "contacts")
+        api_ids.extend(page_ids)
+        newest = newest_updated_at(data["contacts"], newest)
+        if full_run:
+            save_checkpoint(cursor, "contacts", page, page_ids)
+        connection.commit()
+        api_page = page
+        logger.info(
+            "Added in page # %s",
+            page,
             extra={"tags": {"service": "contacts"}},
         )
 
-    # Iterate through all the pages
-    for page in range(1, total_pages + 1):
-        data = get_contacts(logger, page)
-        if data is not None:
-            all_data.extend(data["contacts"])
-            logger.info(
-                "Added in page # %s",
-                page,
-                extra={"tags": {"service": "contacts"}},
-            )
-        else:
-            logger.error(
-                "Error getting contact data",
-                extra={"tags": {"service": "contacts"}},
-            )
-            break
-        time.sleep(rate_limit())
-
     logger.info(
         "Received all data, %s page(s)",
         total_pages,
@@ -59,22 +97,45 @@ def contacts(logger, full_run=False):
     )
 
     logger.info(
-        "Total rows in all_data: %s",
-        len(all_data),
+        "Total rows received: %s",
+        len(api_ids),
         extra={"tags": {"service": "contacts"}},
     )
 
-    insert_contacts(logger, cursor, all_data)
-
-    if len(all_data) == total_entries:
+    if len(api_ids) == total_entries:
         all_sourced = True
     else:
         all_sourced = False
-    # Check ID sums to see if anything was deleted
-    if all_sourced:
-        deleted = compare_id_sums(logger, cursor, all_data, "contacts")
-        if not deleted:
-            move_deleted_contacts_to_deleted_table(logger, cursor, connection, all_data)
+    swapped = False
+    if shadow is not None:
+        if all_sourced:
+            api_ids = compact_ids(api_ids)
+        swapped = finish_shadow(
+            logger,
+            cursor,
+            shadow,
+            "contacts",
+            api_ids if all_sourced else None,
+            api_page == total_pages,
+        )
+    if params is not None:
+        # Incremental runs only see changed rows, deletes are left to the full run
+        logger.info(
+            "Incremental run, %s row(s) changed since %s",
+            len(api_ids),
+            params["since_updated_at"],
+            extra={"tags": {"service": "contacts"}},
+        )
+    elif all_sourced:
+        # Check ID sums to see if anything was deleted
+        api_ids = compact_ids(api_ids)
+        # the swap already archived the rows that are gone
+        if not swapped:
+            deleted = compare_id_sums(logger, cursor, api_ids, "contacts")
+            if not deleted:
+                move_deleted_contacts_to_deleted_table(
+                    logger, cursor, connection, api_ids
+                )
         # Validate data / totals
         query = "SELECT COUNT(*) FROM contacts"
         cursor.execute(query)
@@ -98,11 +159,20 @@ def contacts(logger, full_run=False):
                 db_rows,
                 extra={"tags": {"service": "contacts", "finished": "full"}},
             )
-    elif not all_sourced:
+    else:
         logger.error(
             "Can't check for deletes, problem with contacts API data",
             extra={"tags": {"service": "contacts", "finished": "full"}},
         )
 
+    # Paging finished, move the watermark up and start the next full run
+    # from page 1 again
+    if api_page == total_pages:
+        if newest:
+            save_watermark(cursor, "contacts", newest)
+        if full_run:
+            clear_checkpoint(cursor, "contacts")
+
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "contacts")
@@ -1,77 +1,105 @@
 """Customer backup module"""
-import time
+from array import array
 from library import env_library
-from library.api_requests import get_customers
+from library.api_requests import paginate, record_ids
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_customer_table_if_not_exists
 from library.db_delete import move_deleted_customers_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
 from library.db_insert import insert_customers
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.watermark_library import (
+    load_watermark,
+    newest_updated_at,
+    save_watermark,
+    since_updated_at,
+)
 
 
-def customers(logger, full_run=False):
+def customers(logger, full_run=False, workers=1):
     """main script for the customer module"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_customer_table_if_not_exists(cursor)
 
     # Start fetching customers from page 1
-    current_page = 1
     total_pages = 0
     total_entries = 0
     db_rows = 0
-    all_data = []
+    api_page = 0
+    start_page = 1
+    newest = 0
+    params = None
+    api_ids = array("q")
+    if full_run:
+        start_page, api_ids = load_checkpoint(logger, cursor, "customers")
+    else:
+        # only ask for what changed since the last run, once there is one
+        watermark = load_watermark(cursor, "customers")
+        if watermark is not None:
+            params = {"since_updated_at": since_updated_at(watermark)}
 
-    # Get 1st Page, then check to make sure not null
-    data = get_customers(logger, current_page)
-    if data is not None:
+    # Iterate through all the pages
+    for page, data in paginate(
+        logger,
+        "customers",
+        params,
+        start_page=start_page,
+        workers=workers,
+        cache=not full_run,
+    ):
         total_pages = data["meta"]["total_pages"]
         total_entries = data["meta"]["total_entries"]
-    else:
-        logger.error(
-            "Error getting customer data",
+        insert_customers(logger, cursor, data["customers"])
+        page_ids = record_ids(data, "customers")
+        api_ids.extend(page_ids)
+        newest = newest_updated_at(data["customers"], newest)
+        if full_run:
+            save_checkpoint(cursor, "customers", page, page_ids)
+        connection.commit()
+        api_page = page
+        logger.info(
+            "Added in page # %s",
+            page,
             extra={"tags": {"service": "customers"}},
         )
 
-    # Iterate through all the pages
-    for page in range(1, total_pages + 1):
-        data = get_customers(logger, page)
-        if data is not None:
-            all_data.extend(data["customers"])
-            logger.info(
-                "Added in page # %s",
-                page,
-                extra={"tags": {"service": "customers"}},
-            )
-        else:
-            logger.error(
-                "Error getting contact data",
-                extra={"tags": {"service": "customers"}},
-            )
-            break
-        time.sleep(rate_limit())
-
     logger.info(
         "Received all data, %s page(s)",
         total_pages,
         extra={"tags": {"service": "customers"}},
     )
     logger.info(
-        "Total rows in all_data: %s",
-        len(all_data),
+        "Total rows received: %s",
+        len(api_ids),
         extra={"tags": {"service": "customers"}},
     )
 
-    insert_customers(logger, cursor, all_data)
-    if len(all_data) == total_entries:
+    if len(api_ids) == total_entries:
         all_sourced = True
     else:
         all_sourced = False
-    if all_sourced:
-        deleted = compare_id_sums(logger, cursor, all_data, "customers")
+    if params is not None:
+        # Incremental runs only see changed rows, deletes are left to the full run
+        logger.info(
+            "Incremental run, %s row(s) changed since %s",
+            len(api_ids),
+            params["since_updated_at"],
+            extra={"tags": {"service": "customers"}},
+        )
+    elif all_sourced:
+        api_ids = compact_ids(api_ids)
+        deleted = compare_id_sums(logger, cursor, api_ids, "customers")
         if not deleted:
-            move_deleted_customers_to_deleted_table(logger, cursor, connection, all_data)
+            move_deleted_customers_to_deleted_table(logger, cursor, connection, api_ids)
         # Validate data / totals
         query = "SELECT COUNT(*) FROM customers"
         cursor.execute(query)
@@ -93,12 +121,21 @@ def customers(logger, full_run=False):
                 db_rows,
                 extra={"tags": {"service": "customers", "finished": "full"}},
             )
-    elif not all_sourced:
+    else:
         logger.error(
             "Can't check for deletes, problem with customers API data",
             extra={"tags": {"service": "customers", "finished": "full"}},
         )
 
 
+    # Paging finished, move the watermark up and start the next full run
+    # from page 1 again
+    if api_page == total_pages:
+        if newest:
+            save_watermark(cursor, "customers", newest)
+        if full_run:
+            clear_checkpoint(cursor, "customers")
+
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "customers")
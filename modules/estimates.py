@@ -1,69 +1,77 @@
 """estimate backup module"""
-import time
-
+from array import array
 from library import env_library
-from library.api_requests import get_estimates, get_date_for_header
+from library.api_requests import get_date_for_header, locate_page, paginate
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_estimates_table_if_not_exists
 from library.db_delete import move_deleted_estimates_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
 from library.db_insert import insert_estimates
+from library.metrics_library import log_peak_rss, reset_peak_rss
 
 
-def estimates(logger, full_run=False, lookback_days=365):
+def estimates(logger, full_run=False, lookback_days=365, workers=1):
     """main script for the estimates module"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_estimates_table_if_not_exists(cursor)
 
     # Meta vars
-    current_page = 1
     total_pages = 0
     api_page = 1
-    all_data = []
+    entries = 0
+    api_ids = array("q")
 
     if not full_run:
-        # Get 1st Page, then check to make sure not null
-        data = get_estimates(logger, current_page)
-        if data is not None:
-            total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting estimate data",
-                extra={"tags": {"service": "estimates"}},
-            )
-
         lookback_date_formatted = get_date_for_header(lookback_days)
         found_page = 0
 
-        for page in range(1, total_pages + 1):
-            data = get_estimates(logger, page)
-            if data is not None and "estimates" in data:
-                found_older = any(
-                    item["created_at"] < lookback_date_formatted
-                    for item in data["estimates"]
-                )
-                if found_older:
-                    logger.info(
-                        "Found older than %s days",
-                        lookback_days,
-                        extra={"tags": {"service": "estimates"}},
-                    )
-                    break
+        # newest first, find the last page still inside the lookback
+        last_page, total_pages, fetched = locate_page(
+            logger,
+            "estimates",
+            lambda estimate: estimate["created_at"],
+            lookback_date_formatted,
+            newest_first=True,
+        )
 
-                all_data.extend(data["estimates"])
+        if last_page:
+            logger.info(
+                "Found older than %s days after page %s",
+                lookback_days,
+                last_page,
+                extra={"tags": {"service": "estimates"}},
+            )
+            for page, data in paginate(
+                logger,
+                "estimates",
+                workers=workers,
+                end_page=last_page,
+                fetched=fetched,
+                cache=True,
+            ):
+                page_items = [
+                    estimate
+                    for estimate in data["estimates"]
+                    if estimate["created_at"] >= lookback_date_formatted
+                ]
+                insert_estimates(logger, cursor, page_items)
+                connection.commit()
+                entries += len(page_items)
                 logger.info(
-                    "Added in page # %s", page, extra={"tags": {"service": "estimates"}}
-                )
-                found_page = page
-            else:
-                logger.error(
-                    "Error getting estimate data",
+                    "Added in page # %s",
+                    page,
                     extra={"tags": {"service": "estimates"}},
                 )
-                break
-            time.sleep(rate_limit())
+                found_page = page
 
         logger.info(
             "Adding in : %s / %s",
@@ -73,37 +81,27 @@ def estimates(logger, full_run=False, lookback_days=365):
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            entries,
             extra={"tags": {"service": "estimates"}},
         )
 
-        insert_estimates(logger, cursor, all_data)
-
     if full_run:
-        data = get_estimates(logger, current_page)
-        if data is not None:
+        total_entries = 0
+        start_page, api_ids = load_checkpoint(logger, cursor, "estimates")
+        for page, data in paginate(
+            logger, "estimates", start_page=start_page, workers=workers
+        ):
             total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting estimate data",
-                extra={"tags": {"service": "estimates"}},
+            total_entries = data["meta"]["total_entries"]
+            insert_estimates(logger, cursor, data["estimates"])
+            page_ids = [estimate["id"] for estimate in data["estimates"]]
+            api_ids.extend(page_ids)
+            save_checkpoint(cursor, "estimates", page, page_ids)
+            connection.commit()
+            logger.info(
+                "Added in page # %s", page, extra={"tags": {"service": "estimates"}}
             )
-
-        for page in range(1, total_pages + 1):
-            data = get_estimates(logger, page)
-            if data is not None:
-                all_data.extend(data["estimates"])
-                logger.info(
-                    "Added in page # %s", page, extra={"tags": {"service": "estimates"}}
-                )
-                api_page = page
-            else:
-                logger.error(
-                    "Error getting estimate data",
-                    extra={"tags": {"service": "estimates"}},
-                )
-                break
-            time.sleep(rate_limit())
+            api_page = page
 
         logger.info(
             "Received all data, %s page(s)",
@@ -112,20 +110,24 @@ def estimates(logger, full_run=False, lookback_days=365):
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(api_ids),
             extra={"tags": {"service": "estimates"}},
         )
 
-        insert_estimates(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
+            clear_checkpoint(cursor, "estimates")
         else:
             all_sourced = False
+        # pages may have shifted while the run was stopped
+        if start_page > 1 and len(api_ids) != total_entries:
+            all_sourced = False
         if all_sourced:
-            deleted = compare_id_sums(logger, cursor, all_data, "estimates")
+            api_ids = compact_ids(api_ids)
+            deleted = compare_id_sums(logger, cursor, api_ids, "estimates")
             if not deleted:
                 move_deleted_estimates_to_deleted_table(
-                    logger, cursor, connection, all_data
+                    logger, cursor, connection, api_ids
                 )
             # Validate data / totals
             query = "SELECT COUNT(*) FROM estimates"
@@ -136,17 +138,17 @@ def estimates(logger, full_run=False, lookback_days=365):
             else:
                 db_rows = 0
             # Check if the total entries match the expected count
-            if db_rows == len(all_data):
+            if db_rows == len(api_ids):
                 logger.info(
                     "All Good -- Estimate API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "estimates", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data Mismatch -- Estimate API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "estimates", "finished": "full"}},
                 )
@@ -158,3 +160,4 @@ def estimates(logger, full_run=False, lookback_days=365):
 
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "estimates")
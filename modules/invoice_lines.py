@@ -1,197 +1,202 @@
 """getting RS invoice line items"""
-import time
+from array import array
+from library.bulk_library import (
+    add_rows,
+    archive_gone,
+    bulk_enabled,
+    finish_bulk,
+    flush_due,
+    load_rows,
+    merge_staged,
+    start_bulk,
+)
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_invoice_items_table_if_not_exists
 from library.db_delete import move_deleted_lines_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
-from library.db_insert import insert_invoice_lines
-import library.env_library as env_library
-from library.api_requests import (
-    get_invoice_lines,
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
+from library.db_insert import (
+    INVOICE_LINE_COLUMNS,
+    insert_invoice_lines,
+    invoice_line_rows,
 )
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.shadow_library import (
+    finish_shadow,
+    hold_live_table,
+    shadow_enabled,
+    start_shadow,
+    write_shadow,
+)
+import library.env_library as env_library
+from library.api_requests import INVOICE_LINE_PARAMS, locate_page, paginate
 from library.fix_date_time import rs_to_unix_timestamp
 
 
-def invoice_lines(logger, full_run=False):
+def invoice_lines(logger, full_run=False, workers=1):
     """main script for the invoice lines module"""
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_invoice_items_table_if_not_exists(cursor)
+    # a --full run's shadow swap would retire the table under our writes
+    if not full_run and not hold_live_table(logger, cursor, "invoice_items"):
+        connection.close()
+        log_peak_rss(logger, "invoice_lines")
+        return
 
-    # Start fetching line items from the end
+    # Meta vars
     total_pages = 0
-    current_page = 1
     api_page = 1
-    all_data = []
-    found_last_updated_row = False
+    entries = 0
+    api_ids = array("q")
 
     if not full_run:
-        # Get invoice lines
-        cursor.execute(
-            "SELECT MAX(updated_at) FROM invoice_items WHERE invoice_id IS NOT NULL"
-        )
-        result = cursor.fetchone()
-        if result:
-            most_recent_update = result[0]
-        else:
-            most_recent_update = 0
-        data = get_invoice_lines(logger, current_page, "invoice")
-        if data:
-            total_pages = data["meta"]["total_pages"]
-            current_page = total_pages
-        else:
-            logger.error(
-                "Error getting invoice line item data",
-                extra={"tags": {"service": "invoice_lines"}},
+        for variant, condition in (
+            ("invoice", "invoice_id IS NOT NULL"),
+            ("estimate", "invoice_id IS NULL"),
+        ):
+            entries = 0
+            cursor.execute(
+                f"SELECT MAX(updated_at) FROM invoice_items WHERE {condition}"
             )
-
-        # work backwards from last page
-        for page in range(total_pages, 0, -1):
-            data = get_invoice_lines(logger, page, "invoice")
-            if data:
-                for line_item in reversed(data["line_items"]):
-                    if rs_to_unix_timestamp(
-                        line_item["updated_at"]
-                    ) < rs_to_unix_timestamp(most_recent_update):
-                        found_last_updated_row = True
-                        logger.info(
-                            "Found last updated row in invoice lines page %s",
-                            page,
-                            extra={"tags": {"service": "invoice_lines"}},
-                        )
-                        break
-                    else:
-                        all_data.append(line_item)
-
-                if found_last_updated_row:
-                    break
-
-                logger.info(
-                    "Added in invoice line page # %s out of %s",
-                    page,
-                    total_pages,
-                    extra={"tags": {"service": "invoice_lines"}},
-                )
+            result = cursor.fetchone()
+            if result:
+                most_recent_update = rs_to_unix_timestamp(result[0])
             else:
-                logger.error(
-                    "Error getting invoice line item data",
-                    extra={"tags": {"service": "invoice_lines"}},
-                )
-                break
-            # time.sleep(rate_limit())
+                most_recent_update = 0
 
-        if not found_last_updated_row:
-            logger.info(
-                "No invoice lines updated since last run",
-                extra={"tags": {"service": "invoice_lines", "updates": "yes"}},
+            # lines come oldest first, find the first page with newer ones
+            params = INVOICE_LINE_PARAMS[variant]
+            first_page, total_pages, fetched = locate_page(
+                logger,
+                "invoice_lines",
+                lambda line_item: rs_to_unix_timestamp(line_item["updated_at"]),
+                most_recent_update,
+                params,
             )
 
-        logger.info(
-            "Number of entries to consider for DB: %s",
-            len(all_data),
-            extra={"tags": {"service": "invoice_lines"}},
-        )
-        insert_invoice_lines(logger, cursor, all_data)
-
-        # Clear out data and flags before moving to estimate lines
-        all_data = []
-        found_last_updated_row = False
-        most_recent_update = 0
-
-        # Get estimate lines
-        cursor.execute(
-            "SELECT MAX(updated_at) FROM invoice_items WHERE invoice_id IS NULL"
-        )
-        result = cursor.fetchone()
-        if result:
-            most_recent_update = result[0]
-        else:
-            most_recent_update = 0
-        data = get_invoice_lines(logger, current_page, "estimate")
-        if data:
-            total_pages = data["meta"]["total_pages"]
-            current_page = total_pages
-        else:
-            logger.error(
-                "Error getting estimate line item data",
-                extra={"tags": {"service": "invoice_lines"}},
-            )
-
-        # work backwards from last page
-        for page in range(total_pages, 0, -1):
-            data = get_invoice_lines(logger, page, "estimate")
-            if data:
-                for line_item in reversed(data["line_items"]):
-                    if rs_to_unix_timestamp(
-                        line_item["updated_at"]
-                    ) < rs_to_unix_timestamp(most_recent_update):
-                        found_last_updated_row = True
-                        logger.info(
-                            "Found last updated estimate row in page %s",
-                            page,
-                            extra={"tags": {"service": "invoice_lines"}},
-                        )
-                        break
-                    else:
-                        all_data.append(line_item)
-
-                if found_last_updated_row:
-                    break
-
+            if first_page is not None and first_page <= total_pages:
                 logger.info(
-                    "Added in estimate lines page # %s out of %s",
-                    page,
-                    total_pages,
+                    "Found last updated %s row in page %s",
+                    variant,
+                    first_page,
                     extra={"tags": {"service": "invoice_lines"}},
                 )
-            else:
-                logger.error(
-                    "Error getting estimate line item data",
-                    extra={"tags": {"service": "invoice_lines"}},
+                for page, data in paginate(
+                    logger,
+                    "invoice_lines",
+                    params,
+                    start_page=first_page,
+                    workers=workers,
+                    fetched=fetched,
+                    cache=True,
+                ):
+                    page_items = [
+                        line_item
+                        for line_item in data["line_items"]
+                        if rs_to_unix_timestamp(line_item["updated_at"])
+                        >= most_recent_update
+                    ]
+                    insert_invoice_lines(logger, cursor, page_items)
+                    connection.commit()
+                    entries += len(page_items)
+                    logger.info(
+                        "Added in %s line page # %s out of %s",
+                        variant,
+                        page,
+                        total_pages,
+                        extra={"tags": {"service": "invoice_lines"}},
+                    )
+
+            if not entries:
+                logger.info(
+                    "No %s lines updated since last run",
+                    variant,
+                    extra={"tags": {"service": "invoice_lines", "updates": "yes"}},
                 )
-                break
-            time.sleep(rate_limit())
 
-        if not found_last_updated_row:
             logger.info(
-                "No estimate lines updated since last run",
-                extra={"tags": {"service": "invoice_lines", "updates": "yes"}},
+                "Number of entries to consider for DB: %s",
+                entries,
+                extra={"tags": {"service": "invoice_lines"}},
             )
 
-        logger.info(
-            "Number of entries to consider for DB: %s",
-            len(all_data),
-            extra={"tags": {"service": "invoice_lines"}},
-        )
-        insert_invoice_lines(logger, cursor, all_data)
-
     if full_run:
-        data = get_invoice_lines(logger, current_page, "invoice")
-        if data is not None:
+        total_entries = 0
+        start_page, api_ids = load_checkpoint(logger, cursor, "invoice_lines")
+        bulk = None
+        shadow = None
+        unloaded = []
+        # a shadow rebuild replaces the staging merge
+        if shadow_enabled():
+            shadow = start_shadow(
+                cursor,
+                "invoice_items",
+                INVOICE_LINE_COLUMNS,
+                "updated_at",
+                start_page == 1,
+            )
+        elif bulk_enabled():
+            bulk = start_bulk(
+                cursor, "invoice_items", INVOICE_LINE_COLUMNS, start_page == 1
+            )
+        for page, data in paginate(
+            logger,
+            "invoice_lines",
+            INVOICE_LINE_PARAMS["invoice"],
+            start_page=start_page,
+            workers=workers,
+        ):
             total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting invoice line item data",
+            total_entries = data["meta"]["total_entries"]
+            page_ids = [line_item["id"] for line_item in data["line_items"]]
+            api_ids.extend(page_ids)
+            if shadow is not None:
+                write_shadow(cursor, shadow, invoice_line_rows(data["line_items"]))
+                save_checkpoint(cursor, "invoice_lines", page, page_ids)
+                connection.commit()
+            elif bulk is None:
+                insert_invoice_lines(logger, cursor, data["line_items"])
+                save_checkpoint(cursor, "invoice_lines", page, page_ids)
+                connection.commit()
+            else:
+                # pages are only checkpointed once their rows are staged
+                add_rows(bulk, invoice_line_rows(data["line_items"]))
+                unloaded.append((page, page_ids))
+                if flush_due(bulk):
+                    load_rows(cursor, bulk)
+                    for done_page, done_ids in unloaded:
+                        save_checkpoint(cursor, "invoice_lines", done_page, done_ids)
+                    unloaded = []
+                    connection.commit()
+            api_page = page
+            logger.info(
+                "Added in page # %s",
+                page,
                 extra={"tags": {"service": "invoice_lines"}},
             )
 
-        for page in range(1, total_pages + 1):
-            data = get_invoice_lines(logger, page, "invoice")
-            if data is not None:
-                all_data.extend(data["line_items"])
-                api_page = page
-                logger.info(
-                    "Added in page # %s",
-                    page,
-                    extra={"tags": {"service": "invoice_lines"}},
-                )
-            else:
-                logger.error(
-                    "Error getting invoice line item data",
-                    extra={"tags": {"service": "invoice_lines"}},
-                )
-                break
-            time.sleep(rate_limit())
+        gone = None
+        if bulk is not None:
+            load_rows(cursor, bulk)
+            for done_page, done_ids in unloaded:
+                save_checkpoint(cursor, "invoice_lines", done_page, done_ids)
+            connection.commit()
+            gone = merge_staged(
+                logger,
+                cursor,
+                bulk,
+                "updated_at",
+                "line_items",
+                len(set(api_ids)) if api_page == total_pages else None,
+            )
+            connection.commit()
 
         logger.info(
             "Received all data, %s page(s)",
@@ -200,20 +205,45 @@ def invoice_lines(logger, full_run=False):
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(api_ids),
             extra={"tags": {"service": "invoice_lines"}},
         )
 
-        insert_invoice_lines(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
+            clear_checkpoint(cursor, "invoice_lines")
         else:
             all_sourced = False
+        # pages may have shifted while the run was stopped
+        if start_page > 1 and len(api_ids) != total_entries:
+            all_sourced = False
+        swapped = False
+        if shadow is not None:
+            if all_sourced:
+                api_ids = compact_ids(api_ids)
+            swapped = finish_shadow(
+                logger,
+                cursor,
+                shadow,
+                "line_items",
+                api_ids if all_sourced else None,
+                api_page == total_pages,
+            )
         if all_sourced:
-            deleted = compare_id_sums(logger, cursor, all_data, "invoice_items")
+            api_ids = compact_ids(api_ids)
+            if swapped:
+                # the swap already archived the rows that are gone
+                deleted = True
+            elif gone is not None:
+                # the merge already found the rows that are gone
+                archive_gone(logger, cursor, bulk, gone, "line_items")
+                connection.commit()
+                deleted = True
+            else:
+                deleted = compare_id_sums(logger, cursor, api_ids, "invoice_items")
             if not deleted:
                 move_deleted_lines_to_deleted_table(
-                    logger, cursor, connection, all_data
+                    logger, cursor, connection, api_ids
                 )
             # Validate data / totals
             query = "SELECT COUNT(*) FROM invoice_items"
@@ -224,17 +254,17 @@ def invoice_lines(logger, full_run=False):
             else:
                 db_rows = 0
             # Check if the total entries match the expected count
-            if db_rows == len(all_data):
+            if db_rows == len(api_ids):
                 logger.info(
                     "All Good -- Invoice Line API Rows: %s, DB Rows %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "invoice_lines", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data Mismatch -- API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "invoice_lines", "finished": "full"}},
                 )
@@ -245,4 +275,7 @@ def invoice_lines(logger, full_run=False):
             )
 
     connection.commit()
+    if full_run and bulk is not None:
+        finish_bulk(cursor, bulk, api_page == total_pages)
     connection.close()
+    log_peak_rss(logger, "invoice_lines")
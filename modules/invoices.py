@@ -1,61 +1,68 @@
 """ getting invoices """
-import time
-
+from array import array
 from library import env_library
-from library.api_requests import (
-    get_invoices,
-    get_date_for_header,
+from library.api_requests import get_date_for_header, paginate
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
 )
 from library.db_create import create_invoices_table_if_not_exists
 from library.db_delete import move_deleted_invoices_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
 from library.db_insert import insert_invoices
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.watermark_library import (
+    load_watermark,
+    newest_updated_at,
+    save_watermark,
+    since_updated_at,
+)
 
 
-def invoices(logger, full_run=False, lookback_days=14):
+def invoices(logger, full_run=False, lookback_days=14, workers=1):
     """Get invoices from the API and insert into the database"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_invoices_table_if_not_exists(cursor)
 
     # Meta vars
-    current_page = 1
     total_pages = 0
     api_page = 1
-    all_data = []
+    entries = 0
+    api_ids = array("q")
 
     if not full_run:
-        # Get 1st Page, then check to make sure not null
-        lookback_date = get_date_for_header(lookback_days)
-        data = get_invoices(logger, current_page, lookback_date)
-        if data is not None:
-            total_pages = data["meta"]["total_pages"]
+        newest = 0
+        watermark = load_watermark(cursor, "invoices")
+        if watermark is None:
+            # first run, seed from the lookback window
+            since = get_date_for_header(lookback_days)
         else:
-            logger.error(
-                "Error getting invoice data",
+            since = since_updated_at(watermark)
+        for page, data in paginate(
+            logger,
+            "invoices",
+            {"since_updated_at": since},
+            workers=workers,
+            cache=True,
+        ):
+            total_pages = data["meta"]["total_pages"]
+            insert_invoices(logger, cursor, data["invoices"])
+            connection.commit()
+            entries += len(data["invoices"])
+            newest = newest_updated_at(data["invoices"], newest)
+            api_page = page
+            logger.info(
+                "Added in page # %s",
+                page,
                 extra={"tags": {"service": "invoices"}},
             )
 
-        # total_pages + 1
-        for page in range(1, total_pages + 1):
-            data = get_invoices(logger, page, lookback_date)
-            if data is not None:
-                all_data.extend(data["invoices"])
-                logger.info(
-                    "Added in page # %s",
-                    page,
-                    extra={"tags": {"service": "invoices"}},
-                )
-            else:
-                logger.error(
-                    "Error getting invoice data",
-                    extra={"tags": {"service": "invoices"}},
-                )
-                break
-            time.sleep(rate_limit())
-
         logger.info(
             "Adding in : %s",
             total_pages,
@@ -63,65 +70,59 @@ def invoices(logger, full_run=False, lookback_days=14):
         )
 
         logger.info(
-            "Number of entries to consider for DB: %s",
-            len(all_data),
+            "Incremental run, %s row(s) changed since %s",
+            entries,
+            since,
             extra={"tags": {"service": "invoices"}},
         )
-        insert_invoices(logger, cursor, all_data)
+
+        # Paging finished, the next run starts from the newest change seen
+        if api_page == total_pages and newest:
+            save_watermark(cursor, "invoices", newest)
 
     if full_run:
-        # Get 1st Page, then check to make sure not null
-        data = get_invoices(logger, current_page)
-        if data is not None:
+        total_entries = 0
+        start_page, api_ids = load_checkpoint(logger, cursor, "invoices")
+        for page, data in paginate(
+            logger, "invoices", start_page=start_page, workers=workers
+        ):
             total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting invoice data",
+            total_entries = data["meta"]["total_entries"]
+            api_page = page
+            insert_invoices(logger, cursor, data["invoices"])
+            page_ids = [invoice["id"] for invoice in data["invoices"]]
+            api_ids.extend(page_ids)
+            save_checkpoint(cursor, "invoices", page, page_ids)
+            connection.commit()
+            logger.info(
+                "Added in page # %s",
+                page,
                 extra={"tags": {"service": "invoices"}},
             )
-        logger.info(
-            "Total Pages: %s",
-            total_pages,
-            extra={"tags": {"service": "invoices"}},
-        )
-        # total_pages + 1
-        for page in range(1, total_pages + 1):
-            data = get_invoices(logger, page)
-            api_page = page
-            if data is not None:
-                all_data.extend(data["invoices"])
-                logger.info(
-                    "Added in page # %s",
-                    page,
-                    extra={"tags": {"service": "invoices"}},
-                )
-            else:
-                logger.error(
-                    "Error getting invoice data",
-                    extra={"tags": {"service": "invoices"}},
-                )
-                break
-            time.sleep(rate_limit())
 
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(api_ids),
             extra={"tags": {"service": "invoices"}},
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(api_ids),
             extra={"tags": {"service": "invoices"}},
         )
-        insert_invoices(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
+            clear_checkpoint(cursor, "invoices")
         else:
             all_sourced = False
+        # pages may have shifted while the run was stopped
+        if start_page > 1 and len(api_ids) != total_entries:
+            all_sourced = False
         if all_sourced:
-            deleted = compare_id_sums(logger, cursor, all_data, "invoices")
+            api_ids = compact_ids(api_ids)
+            deleted = compare_id_sums(logger, cursor, api_ids, "invoices")
             if not deleted:
-                move_deleted_invoices_to_deleted_table(logger, cursor, connection, all_data)
+                move_deleted_invoices_to_deleted_table(logger, cursor, connection, api_ids)
             # Validate data / totals
             query = "SELECT COUNT(*) FROM invoices"
             cursor.execute(query)
@@ -131,17 +132,17 @@ def invoices(logger, full_run=False, lookback_days=14):
             else:
                 db_rows = 0
             # Check if the total entries match the expected count
-            if db_rows == len(all_data):
+            if db_rows == len(api_ids):
                 logger.info(
                     "All Good -- Invoice API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "invoices", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data mismatch -- Invoice API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "invoices", "finished": "full"}},
                 )
@@ -153,3 +154,4 @@ def invoices(logger, full_run=False, lookback_days=14):
 
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "invoices")
@@ -1,108 +1,137 @@
 """module to get payments data"""
 
-import time
+from array import array
 from library import env_library
-from library.api_requests import get_date_for_header, get_payments
+from library.api_requests import get_date_for_header, locate_page, paginate
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_payments_table_if_not_exists
 from library.db_delete import move_deleted_payments_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
 from library.db_insert import insert_payments
-
-def payments(logger, full_run=False, lookback_days=14):
+from library.fix_date_time import rs_to_unix_timestamp
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.watermark_library import (
+    load_watermark,
+    newest_updated_at,
+    save_watermark,
+    since_updated_at,
+    window_start,
+)
+
+def payments(logger, full_run=False, lookback_days=14, workers=1):
     """main function to get payments data"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_payments_table_if_not_exists(cursor)
 
     # Meta vars
-    current_page = 1
     api_page = 1
     total_pages = 0
-    all_data = []
+    entries = 0
+    api_ids = array("q")
 
     if not full_run:
-        # Get 1st Page, then check to make sure not null
-        data = get_payments(logger, current_page)
-        if data is not None:
-            total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting payment data",
-                extra={"tags": {"service": "payments"}},
-            )
-
-        lookback_date_formatted = get_date_for_header(lookback_days)
         found_page = 0
-        found_older = False
-
-        for page in range(1, total_pages + 1):
-            if found_older:
-                break
-            data = get_payments(logger, page)
-            if data is not None and "payments" in data:
-                found_older = any(
-                    item["created_at"] < lookback_date_formatted
-                    for item in data["payments"]
-                )
-                if not found_older:
-                    all_data.extend(data["payments"])
-                    break
+        newest = 0
+        watermark = load_watermark(cursor, "payments")
+        if watermark is None:
+            # first run, seed from the lookback window
+            since = label = get_date_for_header(lookback_days)
 
+            def created(payment):
+                """created_at as sent, compared against the date"""
+                return payment["created_at"]
 
-                logger.info(
-                    "Added in page # %s", page, extra={"tags": {"service": "payments"}}
-                )
-                found_page = page
-            else:
-                logger.error(
-                    "Error getting payment data",
-                    extra={"tags": {"service": "payments"}},
-                )
-                break
-            time.sleep(rate_limit())
+        else:
+            # payments has no since_updated_at, the watermark is on created_at
+            since = window_start(watermark)
+            label = since_updated_at(watermark)
+
+            def created(payment):
+                """created_at as unix seconds, compared against the watermark"""
+                return rs_to_unix_timestamp(payment["created_at"])
+
+        # newest first, find the last page still inside the window
+        last_page, total_pages, fetched = locate_page(
+            logger,
+            "payments",
+            created,
+            since,
+            newest_first=True,
+        )
 
+        if last_page:
             logger.info(
-                "Adding in : %s / %s",
-                found_page,
-                total_pages,
-                extra={"tags": {"service": "payments"}},
-            )
-            logger.info(
-                "Number of entries to consider for DB: %s",
-                len(all_data),
+                "Found older than %s after page %s",
+                label,
+                last_page,
                 extra={"tags": {"service": "payments"}},
             )
+            for page, data in paginate(
+                logger,
+                "payments",
+                workers=workers,
+                end_page=last_page,
+                fetched=fetched,
+                cache=True,
+            ):
+                page_items = [
+                    payment for payment in data["payments"] if created(payment) >= since
+                ]
+                insert_payments(logger, cursor, page_items)
+                connection.commit()
+                entries += len(page_items)
+                newest = newest_updated_at(page_items, newest, "created_at")
+                logger.info(
+                    "Added in page # %s",
+                    page,
+                    extra={"tags": {"service": "payments"}},
+                )
+                found_page = page
 
-        insert_payments(logger, cursor, all_data)
+        logger.info(
+            "Adding in : %s / %s",
+            found_page,
+            total_pages,
+            extra={"tags": {"service": "payments"}},
+        )
+        logger.info(
+            "Incremental run, %s row(s) created since %s",
+            entries,
+            label,
+            extra={"tags": {"service": "payments"}},
+        )
+
+        # Paging finished, the next run starts from the newest payment seen
+        if last_page and found_page == last_page and newest:
+            save_watermark(cursor, "payments", newest)
 
     if full_run:
-        data = get_payments(logger, current_page)
-        if data is not None:
+        total_entries = 0
+        start_page, api_ids = load_checkpoint(logger, cursor, "payments")
+        for page, data in paginate(
+            logger, "payments", start_page=start_page, workers=workers
+        ):
             total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting payment data",
-                extra={"tags": {"service": "payments"}},
+            total_entries = data["meta"]["total_entries"]
+            insert_payments(logger, cursor, data["payments"])
+            page_ids = [payment["id"] for payment in data["payments"]]
+            api_ids.extend(page_ids)
+            save_checkpoint(cursor, "payments", page, page_ids)
+            connection.commit()
+            api_page = page
+            logger.info(
+                "Added in page # %s", page, extra={"tags": {"service": "payments"}}
             )
 
-        for page in range(1, total_pages + 1):
-            data = get_payments(logger, page)
-            if data is not None:
-                all_data.extend(data["payments"])
-                api_page = page
-                logger.info(
-                    "Added in page # %s", page, extra={"tags": {"service": "payments"}}
-                )
-            else:
-                logger.error(
-                    "Error getting payment data",
-                    extra={"tags": {"service": "payments"}},
-                )
-                break
-            time.sleep(rate_limit())
-
         logger.info(
             "Received all data, %s page(s)",
             total_pages,
@@ -110,19 +139,23 @@ def payments(logger, full_run=False, lookback_days=14):
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(api_ids),
             extra={"tags": {"service": "payments"}},
         )
 
-        insert_payments(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
+            clear_checkpoint(cursor, "payments")
         else:
             all_sourced = False
+        # pages may have shifted while the run was stopped
+        if start_page > 1 and len(api_ids) != total_entries:
+            all_sourced = False
         if all_sourced:
-            deleted = compare_id_sums(logger, cursor, all_data, "payments")
+            api_ids = compact_ids(api_ids)
+            deleted = compare_id_sums(logger, cursor, api_ids, "payments")
             if not deleted:
-                move_deleted_payments_to_deleted_table(logger, cursor, connection, all_data)
+                move_deleted_payments_to_deleted_table(logger, cursor, connection, api_ids)
             # Validate data / totals
             query = "SELECT COUNT(*) FROM payments"
             cursor.execute(query)
@@ -132,17 +165,17 @@ def payments(logger, full_run=False, lookback_days=14):
             else:
                 db_rows = 0
             # Check if the total entries match the expected count
-            if db_rows == len(all_data):
+            if db_rows == len(api_ids):
                 logger.info(
                     "All Good -- Payment API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "payments", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data mismatch -- Payment Meta Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(api_ids),
                     db_rows,
                     extra={"tags": {"service": "payments", "finished": "full"}},
                 )
@@ -154,3 +187,4 @@ def payments(logger, full_run=False, lookback_days=14):
 
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "payments")
@@ -1,58 +1,83 @@
 """products module"""
+from array import array
 
-import time
 from library import env_library
-from library.api_requests import get_products
+from library.api_requests import paginate, record_ids
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import create_products_table_if_not_exists
 from library.db_delete import move_deleted_products_to_deleted_table
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
-from library.db_insert import insert_products
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
+from library.db_insert import PRODUCT_COLUMNS, insert_products, product_rows
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.shadow_library import (
+    finish_shadow,
+    hold_live_table,
+    shadow_enabled,
+    start_shadow,
+    write_shadow,
+)
 
 
-def products(logger, full_run=False):
+def products(logger, full_run=False, workers=1):
     """main script for the products module"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
     create_products_table_if_not_exists(cursor)
+    # a --full run's shadow swap would retire the table under our writes
+    if not full_run and not hold_live_table(logger, cursor, "products"):
+        connection.close()
+        log_peak_rss(logger, "products")
+        return
 
     # Start fetching products from page 1
-    current_page = 1
     total_pages = 0
     total_entries = 0
     db_rows = 0
-    all_data = []
+    api_page = 0
+    start_page = 1
+    api_ids = array("q")
+    shadow = None
+    if full_run:
+        start_page, api_ids = load_checkpoint(logger, cursor, "products")
+        if shadow_enabled():
+            shadow = start_shadow(
+                cursor, "products", PRODUCT_COLUMNS, "hash", start_page == 1, False
+            )
 
-    # Get 1st Page, then check to make sure not null
-    data = get_products(logger, current_page)
-    if data is not None:
+    # Iterate through all the pages
+    for page, data in paginate(
+        logger,
+        "products",
+        start_page=start_page,
+        workers=workers,
+        cache=not full_run,
+    ):
         total_pages = data["meta"]["total_pages"]
         total_entries = data["meta"]["total_entries"]
-    else:
-        logger.error(
-            "Error getting product data",
+        if shadow is None:
+            insert_products(logger, cursor, data["products"])
+        else:
+            write_shadow(cursor, shadow, product_rows(data["products"]))
+        page_ids = record_ids(data, "products")
+        api_ids.extend(page_ids)
+        if full_run:
+            save_checkpoint(cursor, "products", page, page_ids)
+        connection.commit()
+        api_page = page
+        logger.info(
+            "Added in page # %s",
+            page,
             extra={"tags": {"service": "products"}},
         )
 
-    # Iterate through all the pages
-    for page in range(1, total_pages + 1):
-        data = get_products(logger, page)
-        if data is not None:
-            all_data.extend(data["products"])
-            logger.info(
-                "Added in page # %s",
-                page,
-                extra={"tags": {"service": "products"}},
-            )
-        else:
-            logger.error(
-                "Error getting product data",
-                extra={"tags": {"service": "products"}},
-            )
-            break
-        time.sleep(rate_limit())
-
     logger.info(
         "Received all data, %s page(s)",
         total_pages,
@@ -60,21 +85,37 @@ def products(logger, full_run=False):
     )
 
     logger.info(
-        "Total rows in all_data: %s",
-        len(all_data),
+        "Total rows received: %s",
+        len(api_ids),
         extra={"tags": {"service": "products"}},
     )
 
-    insert_products(logger, cursor, all_data)
-    if len(all_data) == total_entries:
+    if len(api_ids) == total_entries:
         all_sourced = True
     else:
         all_sourced = False
+    swapped = False
+    if shadow is not None:
+        if all_sourced:
+            api_ids = compact_ids(api_ids)
+        swapped = finish_shadow(
+            logger,
+            cursor,
+            shadow,
+            "products",
+            api_ids if all_sourced else None,
+            api_page == total_pages,
+        )
     if all_sourced:
+        api_ids = compact_ids(api_ids)
         # Check ID sums to see if anything was deleted
-        deleted = compare_id_sums(logger, cursor, all_data, "products")
-        if not deleted:
-            move_deleted_products_to_deleted_table(logger, cursor, connection, all_data)
+        # the swap already archived the rows that are gone
+        if not swapped:
+            deleted = compare_id_sums(logger, cursor, api_ids, "products")
+            if not deleted:
+                move_deleted_products_to_deleted_table(
+                    logger, cursor, connection, api_ids
+                )
         # Validate data / totals
         query = "SELECT COUNT(*) FROM products"
         cursor.execute(query)
@@ -96,11 +137,16 @@ def products(logger, full_run=False):
                 db_rows,
                 extra={"tags": {"service": "products"}},
             )
-    elif not all_sourced:
+    else:
         logger.error(
             "Can't check for deletes, problem with products API data",
             extra={"tags": {"service": "products"}},
         )
 
+    # Paging finished, the next full run starts from page 1 again
+    if full_run and api_page == total_pages:
+        clear_checkpoint(cursor, "products")
+
     connection.commit()
     connection.close()
+    log_peak_rss(logger, "products")
@@ -1,7 +1,22 @@
 """ticket with parameterized lookback"""
-import time
+from array import array
 from library import env_library
-from library.api_requests import get_date_for_header, get_tickets
+from library.api_requests import get_date_for_header, paginate
+from library.bulk_library import (
+    add_rows,
+    archive_gone,
+    bulk_enabled,
+    finish_bulk,
+    flush_due,
+    load_rows,
+    merge_staged,
+    start_bulk,
+)
+from library.checkpoint_library import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from library.db_create import (
     create_comments_table_if_not_exists,
     create_tickets_table_if_not_exists,
@@ -11,13 +26,29 @@ from library.db_delete import (
     move_deleted_comments_to_deleted_table_frequent_only,
     move_deleted_tickets_to_deleted_table,
 )
-from library.db_general import compare_id_sums, connect_to_db, rate_limit
-from library.db_insert import insert_comments, insert_tickets
+from library.db_general import compact_ids, compare_id_sums, connect_to_db
+from library.db_insert import (
+    COMMENT_COLUMNS,
+    TICKET_COLUMNS,
+    comment_rows,
+    insert_comments,
+    insert_tickets,
+    ticket_rows,
+)
+from library.metrics_library import log_peak_rss, reset_peak_rss
+from library.watermark_library import (
+    load_watermark,
+    newest_updated_at,
+    save_watermark,
+    since_updated_at,
+)
 
 
-def tickets(logger, full_run=False, lookback_days=14):
+def tickets(logger, full_run=False, lookback_days=14, workers=1):
     """main script for the ticket module"""
 
+    reset_peak_rss()
+
     # Database configurations
     config = env_library.config
     cursor, connection = connect_to_db(config)
@@ -25,98 +56,88 @@ def tickets(logger, full_run=False, lookback_days=14):
     create_comments_table_if_not_exists(cursor)
 
     # Meta vars
-    current_page = 1
     api_page = 1
     total_pages = 0
-    all_data = []
+    ticket_ids = array("q")
+    comment_ids = array("q")
 
     if not full_run:
-        # Get 1st Page, then check to make sure not null
-        data = get_tickets(logger, current_page, lookback_days)
-        if data is not None:
-            total_pages = data["meta"]["total_pages"]
+        newest = 0
+        watermark = load_watermark(cursor, "tickets")
+        if watermark is None:
+            # first run, seed from the lookback window
+            since = get_date_for_header(lookback_days)
         else:
-            logger.error(
-                "Error getting ticket data",
-                extra={"tags": {"service": "tickets"}},
-            )
-
-        logger.info(
-            "Total pages: %s",
-            total_pages,
-            extra={"tags": {"service": "tickets"}},
-        )
-
-        # total_pages + 1
-        for page in range(1, total_pages + 1):
-            data = get_tickets(logger, page, lookback_days)
-            if data is not None:
-                all_data.extend(data["tickets"])
-                api_page = page
-                logger.info(
-                    "Added in page # %s",
-                    page,
-                    extra={"tags": {"service": "tickets"}},
+            since = since_updated_at(watermark)
+        for page, data in paginate(
+            logger,
+            "tickets",
+            {"since_updated_at": since},
+            workers=workers,
+        ):
+            total_pages = data["meta"]["total_pages"]
+            insert_tickets(logger, cursor, data["tickets"])
+            comments = insert_comments(logger, cursor, data["tickets"])
+            connection.commit()
+            ticket_ids.extend(ticket["id"] for ticket in data["tickets"])
+            newest = newest_updated_at(data["tickets"], newest)
+            if watermark is None:
+                # only comments inside the lookback window are checked for deletes
+                comment_ids.extend(
+                    comment["id"]
+                    for comment in comments
+                    if comment["created_at"] >= since
                 )
             else:
-                logger.error(
-                    "Error getting ticket data",
-                    extra={"tags": {"service": "tickets"}},
-                )
-                break
-            time.sleep(rate_limit())
+                # every comment of a changed ticket comes with it
+                comment_ids.extend(comment["id"] for comment in comments)
+            api_page = page
+            logger.info(
+                "Added in page # %s",
+                page,
+                extra={"tags": {"service": "tickets"}},
+            )
 
         logger.info(
-            "Total tickets: %s",
-            len(all_data),
-            extra={"tags": {"service": "tickets"}},
-        )
-        logger.info(
-            "Number of entries to consider for DB: %s",
-            len(all_data),
+            "Incremental run, %s ticket(s) changed since %s",
+            len(ticket_ids),
+            since,
             extra={"tags": {"service": "tickets"}},
         )
 
-        insert_tickets(logger, cursor, all_data)
-        comments = insert_comments(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
         else:
             all_sourced = False
-        if all_sourced:
-            in_range_comments = []
-            for comment in comments:
-                if comment["created_at"] >= get_date_for_header(lookback_days):
-                    in_range_comments.append(comment)
+        if all_sourced and watermark is not None:
+            comment_ids = compact_ids(comment_ids)
+            # Check the changed tickets' comments against the DB for deletes
+            db_comment_ids = []
+            changed = sorted(set(ticket_ids))
+            for start in range(0, len(changed), 1000):
+                chunk = changed[start : start + 1000]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                query = f"SELECT id FROM comments WHERE ticket_id IN ({placeholders})"
+                cursor.execute(query, chunk)
+                db_comment_ids.extend(row[0] for row in cursor.fetchall())
+            if db_comment_ids and sum(comment_ids) != sum(db_comment_ids):
+                move_deleted_comments_to_deleted_table_frequent_only(
+                    logger, cursor, connection, comment_ids, db_comment_ids
+                )
+        elif all_sourced:
+            comment_ids = compact_ids(comment_ids)
             # Check ID sums to see if any comment was deleted
-            # Fetch the column names from the cursor description
-            query = "SELECT * from comments WHERE created_at >= %s"
-            cursor.execute(query, (get_date_for_header(lookback_days),))
-            db_comments = cursor.fetchall()
-            if db_comments and cursor.description:
-                row = cursor.fetchone()
-                column_names = [desc[0] for desc in cursor.description]
-                db_comments_data = [
-                    dict(zip(column_names, comment)) for comment in db_comments
-                ]
-
-                query = "SELECT SUM(id) FROM comments WHERE created_at >= %s"
-                cursor.execute(query, (get_date_for_header(lookback_days),))
-                cursor.fetchall()
-                if row:
-                    db_id_sum = row[0]
-                else:
-                    db_id_sum = 0
-                # Extract the "id" values and filter out non-integer values
-
-                api_sum = sum(comment["id"] for comment in in_range_comments)
-                if api_sum != db_id_sum:
+            query = "SELECT id FROM comments WHERE created_at >= %s"
+            cursor.execute(query, (since,))
+            db_comment_ids = [row[0] for row in cursor.fetchall()]
+            if db_comment_ids:
+                if sum(comment_ids) != sum(db_comment_ids):
                     move_deleted_comments_to_deleted_table_frequent_only(
-                        logger, cursor, connection, in_range_comments, db_comments_data
+                        logger, cursor, connection, comment_ids, db_comment_ids
                     )
                 # Validate data / totals
                 query = "SELECT COUNT(*) FROM tickets WHERE updated_at >= %s"
-                cursor.execute(query, (get_date_for_header(lookback_days),))
+                cursor.execute(query, (since,))
                 db_rows = cursor.fetchone()
                 cursor.fetchall()
                 if db_rows is not None:
@@ -124,42 +145,109 @@ def tickets(logger, full_run=False, lookback_days=14):
                 else:
                     db_rows = 0
                 # Check if the API and DB totals match
-                if db_rows != len(all_data):
+                if db_rows != len(ticket_ids):
                     logger.error(
                         "Data Mismatch -- Ticket API Rows: %s, DB Rows: %s",
-                        len(all_data),
+                        len(ticket_ids),
                         db_rows,
                         extra={"tags": {"service": "tickets", "finished": "yes"}},
                     )
 
+        # Paging finished, the next run starts from the newest change seen
+        if all_sourced and newest:
+            save_watermark(cursor, "tickets", newest)
+
     if full_run:
-        # Get 1st Page, then check to make sure not null
-        data = get_tickets(logger, current_page)
-        if data is not None:
+        total_entries = 0
+        start_page, ticket_ids = load_checkpoint(logger, cursor, "tickets")
+        comment_page, comment_ids = load_checkpoint(logger, cursor, "comments")
+        # both are saved with the same commit, anything else means starting over
+        if start_page != comment_page:
+            clear_checkpoint(cursor, "tickets")
+            clear_checkpoint(cursor, "comments")
+            start_page = 1
+            ticket_ids = array("q")
+            comment_ids = array("q")
+        bulk = None
+        comment_bulk = None
+        unloaded = []
+        if bulk_enabled():
+            bulk = start_bulk(cursor, "tickets", TICKET_COLUMNS, start_page == 1)
+            comment_bulk = start_bulk(
+                cursor, "comments", COMMENT_COLUMNS, start_page == 1
+            )
+        connection.commit()
+
+        for page, data in paginate(
+            logger, "tickets", start_page=start_page, workers=workers
+        ):
             total_pages = data["meta"]["total_pages"]
-        else:
-            logger.error(
-                "Error getting ticket data",
+            total_entries = data["meta"]["total_entries"]
+            page_ticket_ids = [ticket["id"] for ticket in data["tickets"]]
+            ticket_ids.extend(page_ticket_ids)
+            if bulk is None:
+                insert_tickets(logger, cursor, data["tickets"])
+                comments = insert_comments(logger, cursor, data["tickets"])
+            else:
+                comments = [
+                    comment
+                    for ticket in data["tickets"]
+                    for comment in ticket.get("comments", [])
+                ]
+                add_rows(bulk, ticket_rows(data["tickets"]))
+                add_rows(comment_bulk, comment_rows(comments))
+            page_comment_ids = [comment["id"] for comment in comments]
+            comment_ids.extend(page_comment_ids)
+            if bulk is None:
+                save_checkpoint(cursor, "tickets", page, page_ticket_ids)
+                save_checkpoint(cursor, "comments", page, page_comment_ids)
+                connection.commit()
+            else:
+                # pages are only checkpointed once their rows are staged
+                unloaded.append((page, page_ticket_ids, page_comment_ids))
+                if flush_due(bulk) or flush_due(comment_bulk):
+                    load_rows(cursor, bulk)
+                    load_rows(cursor, comment_bulk)
+                    for done_page, done_tickets, done_comments in unloaded:
+                        save_checkpoint(cursor, "tickets", done_page, done_tickets)
+                        save_checkpoint(cursor, "comments", done_page, done_comments)
+                    unloaded = []
+                    connection.commit()
+            api_page = page
+            logger.info(
+                "Added in page # %s",
+                page,
                 extra={"tags": {"service": "tickets"}},
             )
 
-        for page in range(1, total_pages + 1):
-            data = get_tickets(logger, page)
-            if data is not None:
-                all_data.extend(data["tickets"])
-                api_page = page
-                logger.info(
-                    "Added in page # %s",
-                    page,
-                    extra={"tags": {"service": "tickets"}},
-                )
-            else:
-                logger.error(
-                    "Error getting ticket data",
-                    extra={"tags": {"service": "tickets"}},
-                )
-                break
-            time.sleep(rate_limit())
+        gone = None
+        comments_gone = None
+        if bulk is not None:
+            load_rows(cursor, bulk)
+            load_rows(cursor, comment_bulk)
+            for done_page, done_tickets, done_comments in unloaded:
+                save_checkpoint(cursor, "tickets", done_page, done_tickets)
+                save_checkpoint(cursor, "comments", done_page, done_comments)
+            connection.commit()
+            # tickets first, comments reference them
+            complete = api_page == total_pages
+            gone = merge_staged(
+                logger,
+                cursor,
+                bulk,
+                "updated_at_u",
+                "tickets",
+                len(set(ticket_ids)) if complete else None,
+            )
+            comments_gone = merge_staged(
+                logger,
+                cursor,
+                comment_bulk,
+                "updated_at",
+                "comments",
+                len(set(comment_ids)) if complete else None,
+            )
+            connection.commit()
 
         logger.info(
             "Total pages: %s",
@@ -168,22 +256,32 @@ def tickets(logger, full_run=False, lookback_days=14):
         )
         logger.info(
             "Number of entries to consider for DB: %s",
-            len(all_data),
+            len(ticket_ids),
             extra={"tags": {"service": "tickets"}},
         )
 
-        insert_tickets(logger, cursor, all_data)
-        comments_data = insert_comments(logger, cursor, all_data)
         if api_page == total_pages:
             all_sourced = True
+            clear_checkpoint(cursor, "tickets")
+            clear_checkpoint(cursor, "comments")
         else:
             all_sourced = False
+        # pages may have shifted while the run was stopped
+        if start_page > 1 and len(ticket_ids) != total_entries:
+            all_sourced = False
         if all_sourced:
-            # Check ID sums to see if any comment was deleted
-            deleted = compare_id_sums(logger, cursor, comments_data, "comments")
+            comment_ids = compact_ids(comment_ids)
+            # Check ID sums to see if any comment was deleted, the bulk merge
+            # already found the ones that are gone
+            if comments_gone is not None:
+                archive_gone(logger, cursor, comment_bulk, comments_gone, "comments")
+                connection.commit()
+                deleted = True
+            else:
+                deleted = compare_id_sums(logger, cursor, comment_ids, "comments")
             if not deleted:
                 move_deleted_comments_to_deleted_table(
-                    logger, cursor, connection, all_data
+                    logger, cursor, connection, comment_ids
                 )
             # Validate data / totals
             query = "SELECT COUNT(*) FROM comments"
@@ -194,25 +292,34 @@ def tickets(logger, full_run=False, lookback_days=14):
             else:
                 db_rows = 0
             # Check if the API and DB totals match
-            if db_rows == len(comments_data):
+            if db_rows == len(comment_ids):
                 logger.info(
                     "ALL Good -- Ticket Comments API Rows: %s, DB Rows: %s",
-                    len(comments_data),
+                    len(comment_ids),
                     db_rows,
                     extra={"tags": {"service": "tickets", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data Mismatch -- Ticket Comments API Rows: %s, DB Rows: %s",
-                    len(comments_data),
+                    len(comment_ids),
                     db_rows,
                     extra={"tags": {"service": "tickets"}},
                 )
             # Again for tickets
-            deleted = compare_id_sums(logger, cursor, all_data, "tickets")
+            ticket_ids = compact_ids(ticket_ids)
+            if gone is not None:
+                # with their comments, like move_deleted_tickets_to_deleted_table
+                archive_gone(
+                    logger, cursor, bulk, gone, "tickets", (("comments", "ticket_id"),)
+                )
+                connection.commit()
+                deleted = True
+            else:
+                deleted = compare_id_sums(logger, cursor, ticket_ids, "tickets")
             if not deleted:
                 move_deleted_tickets_to_deleted_table(
-                    logger, cursor, connection, all_data
+                    logger, cursor, connection, ticket_ids
                 )
             # Validate data / totals
             query = "SELECT COUNT(*) FROM tickets"
@@ -223,17 +330,17 @@ def tickets(logger, full_run=False, lookback_days=14):
             else:
                 db_rows = 0
             # Check if the API and DB totals match
-            if db_rows == len(all_data):
+            if db_rows == len(ticket_ids):
                 logger.info(
                     "ALL Good -- Ticket API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(ticket_ids),
                     db_rows,
                     extra={"tags": {"service": "tickets", "finished": "full"}},
                 )
             else:
                 logger.error(
                     "Data Mismatch -- Ticket API Rows: %s, DB Rows: %s",
-                    len(all_data),
+                    len(ticket_ids),
                     db_rows,
                     extra={"tags": {"service": "tickets", "finished": "full"}},
                 )
@@ -244,4 +351,8 @@ def tickets(logger, full_run=False, lookback_days=14):
             )
 
     connection.commit()
+    if full_run and bulk is not None:
+        finish_bulk(cursor, bulk, api_page == total_pages)
+        finish_bulk(cursor, comment_bulk, api_page == total_pages)
     connection.close()
+    log_peak_rss(logger, "tickets")
@@ -1,7 +1,7 @@
 """get users for db"""
 
 from library import env_library
-from library.api_requests import get_users
+from library.api_requests import fetch_page
 from library.db_create import create_users_table_if_not_exists
 from library.db_general import connect_to_db
 from library.db_insert import insert_users
@@ -15,7 +15,7 @@ def users(logger):
     cursor, connection = connect_to_db(config)
     create_users_table_if_not_exists(cursor)
 
-    data = get_users(logger)
+    data = fetch_page(logger, "users")
 
     insert_users(logger, cursor, data)
 
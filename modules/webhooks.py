@@ -0,0 +1,324 @@
+"""receive RS webhooks and upsert the records straight away
+
+Point the RS webhooks at http://<host>:WEBHOOK_PORT/webhooks/<kind>?token=
+WEBHOOK_SECRET, kind being tickets, comments, invoices or payments. The
+record is taken from the payload's "attributes" (or the payload itself),
+checked for the fields the insert needs, run through the table's row
+converter and written with the same insert_* calls the polling uses, so an
+older copy never overwrites a newer one.
+Polling stays on as the safety net for missed or rejected webhooks, the
+watermarks are left alone.
+"""
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import mysql.connector
+from library import env_library, json_library
+from library.db_create import (
+    create_comments_table_if_not_exists,
+    create_invoices_table_if_not_exists,
+    create_payments_table_if_not_exists,
+    create_tickets_table_if_not_exists,
+)
+from library.db_general import connect_to_db
+from library.db_insert import (
+    insert_comments,
+    insert_invoices,
+    insert_payments,
+    insert_tickets,
+)
+from library.schema_library import SCHEMAS
+
+# Payloads bigger than this are refused before they're read
+MAX_BODY_BYTES = 1024 * 1024
+
+# Fields each insert reads without a default
+REQUIRED_FIELDS = {
+    "tickets": (
+        "id",
+        "number",
+        "subject",
+        "created_at",
+        "customer_id",
+        "customer_business_then_name",
+        "due_date",
+        "resolved_at",
+        "start_at",
+        "end_at",
+        "location_id",
+        "problem_type",
+        "status",
+        "ticket_type_id",
+        "user_id",
+        "updated_at",
+        "pdf_url",
+        "priority",
+    ),
+    "comments": (
+        "id",
+        "created_at",
+        "updated_at",
+        "ticket_id",
+        "subject",
+        "body",
+        "tech",
+        "hidden",
+        "user_id",
+    ),
+    "invoices": (
+        "id",
+        "customer_id",
+        "customer_business_then_name",
+        "number",
+        "created_at",
+        "updated_at",
+        "date",
+        "due_date",
+        "subtotal",
+        "total",
+        "tax",
+        "verified_paid",
+        "tech_marked_paid",
+        "ticket_id",
+        "user_id",
+        "pdf_url",
+        "is_paid",
+        "location_id",
+        "po_number",
+        "contact_id",
+        "note",
+        "hardwarecost",
+    ),
+    "payments": (
+        "id",
+        "created_at",
+        "updated_at",
+        "success",
+        "payment_amount",
+        "invoice_ids",
+        "ref_num",
+        "applied_at",
+        "payment_method",
+        "transaction_response",
+        "signature_date",
+        "customer",
+    ),
+}
+
+_lock = threading.Lock()
+_db = {"cursor": None, "connection": None}
+
+
+def parse_record(kind, body):
+    """record from a webhook body, raises ValueError if it isn't usable"""
+    if kind not in REQUIRED_FIELDS:
+        raise ValueError(f"unknown webhook kind {kind}")
+    try:
+        payload = json_library.loads(body)
+    except json_library.JSONDecodeError as error:
+        raise ValueError(f"body isn't json: {error}") from error
+    if not isinstance(payload, dict):
+        raise ValueError("payload isn't an object")
+    record = payload.get("attributes", payload)
+    if not isinstance(record, dict):
+        raise ValueError("attributes isn't an object")
+    missing = [field for field in REQUIRED_FIELDS[kind] if field not in record]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if not isinstance(record["id"], int):
+        raise ValueError("id isn't an integer")
+    if kind == "payments" and not isinstance(record["customer"], dict):
+        raise ValueError("customer isn't an object")
+    # run the insert's own conversion, so a bad date or a null subject is a
+    # 400 here instead of a failure halfway through the write
+    try:
+        SCHEMAS[kind]["convert"]([record])
+        if kind == "tickets":
+            SCHEMAS["comments"]["convert"](record.get("comments") or [])
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"record doesn't convert: {error!r}") from error
+    return record
+
+
+def _get_cursor():
+    """cursor on the shared connection, reconnecting if it dropped, hold _lock"""
+    connection = _db["connection"]
+    if connection is None or not connection.is_connected():
+        _db["cursor"], _db["connection"] = connect_to_db(env_library.config)
+    return _db["cursor"], _db["connection"]
+
+
+def apply_record(logger, kind, record):
+    """upsert one webhook record and commit it, rolled back on any error
+    so the shared connection never carries half of it into the next commit"""
+    with _lock:
+        cursor, connection = _get_cursor()
+        try:
+            if kind == "tickets":
+                insert_tickets(logger, cursor, [record])
+                if record.get("comments"):
+                    insert_comments(logger, cursor, [record])
+            elif kind == "comments":
+                insert_comments(logger, cursor, [{"comments": [record]}])
+            elif kind == "invoices":
+                insert_invoices(logger, cursor, [record])
+            else:
+                insert_payments(logger, cursor, [record])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """accepts one webhook per POST"""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """validate the webhook and upsert its record"""
+        logger = self.server.logger
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "webhooks":
+            self.send_json(404, {"error": "Not found"})
+            return
+        kind = parts[1]
+
+        token = self.headers.get("X-Webhook-Token") or parse_qs(url.query).get(
+            "token", [""]
+        )[0]
+        if not hmac.compare_digest(token.encode(), self.server.secret.encode()):
+            logger.warning(
+                "Webhook %s refused, bad token from %s",
+                kind,
+                self.client_address[0],
+                extra={"tags": {"service": "webhooks"}},
+            )
+            self.send_json(401, {"error": "Bad token"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "Bad Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": "Payload too large"})
+            return
+        try:
+            record = parse_record(kind, self.rfile.read(length))
+        except ValueError as error:
+            logger.warning(
+                "Webhook %s rejected: %s",
+                kind,
+                error,
+                extra={"tags": {"service": "webhooks"}},
+            )
+            self.send_json(400, {"error": str(error)})
+            return
+
+        try:
+            apply_record(logger, kind, record)
+        except mysql.connector.errors.IntegrityError as error:
+            # a comment whose ticket isn't in yet, polling will bring both
+            logger.warning(
+                "Webhook %s %s not applied: %s",
+                kind,
+                record["id"],
+                error,
+                extra={"tags": {"service": "webhooks"}},
+            )
+            self.send_json(409, {"error": "Conflict"})
+            return
+        except mysql.connector.Error as error:
+            logger.error(
+                "Webhook %s %s failed: %s",
+                kind,
+                record["id"],
+                error,
+                extra={"tags": {"service": "webhooks"}},
+            )
+            self.send_json(503, {"error": "Database unavailable"})
+            return
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(
+                "Webhook %s %s failed",
+                kind,
+                record["id"],
+                extra={"tags": {"service": "webhooks"}},
+            )
+            self.send_json(500, {"error": "Internal error"})
+            return
+
+        logger.info(
+            "Webhook %s %s applied",
+            kind,
+            record["id"],
+            extra={"tags": {"service": "webhooks"}},
+        )
+        self.send_json(200, {"status": "ok"})
+
+    def send_json(self, status, data):
+        """write data as the json response"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """requests are logged through the logger instead"""
+
+
+def start_webhook_server(logger, host=None, port=None):
+    """create the tables and bind the receiver, return the server"""
+    cursor, connection = connect_to_db(env_library.config)
+    create_tickets_table_if_not_exists(cursor)
+    create_comments_table_if_not_exists(cursor)
+    create_invoices_table_if_not_exists(cursor)
+    create_payments_table_if_not_exists(cursor)
+    connection.commit()
+    connection.close()
+
+    server = ThreadingHTTPServer(
+        (
+            host if host is not None else env_library.webhook_host,
+            port if port is not None else env_library.webhook_port,
+        ),
+        WebhookHandler,
+    )
+    server.daemon_threads = True
+    server.logger = logger
+    server.secret = env_library.webhook_secret
+    return server
+
+
+def webhooks(logger):
+    """serve webhooks until stopped"""
+    if not env_library.webhook_secret:
+        logger.error(
+            "WEBHOOK_SECRET isn't set, not starting the webhook receiver",
+            extra={"tags": {"service": "webhooks"}},
+        )
+        return
+    server = start_webhook_server(logger)
+    logger.info(
+        "Receiving webhooks on %s:%s",
+        server.server_address[0],
+        server.server_address[1],
+        extra={"tags": {"service": "webhooks"}},
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with _lock:
+            if _db["connection"] is not None:
+                _db["connection"].close()
+                _db["connection"] = None